@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Exact path statistics for acyclic graphs (e.g. -u with acyclic layer wiring)
+# by dynamic programming in topological order instead of path enumeration.
+#
+# For every vertex v the forward pass accumulates over all attacker->v paths:
+#   N   number of paths
+#   Nl  number of paths per length (in vertices)
+#   P   sum of path probabilities
+#   I   sum of path impacts
+#   PI  sum of path probability * path impact (PRisk)
+#   R   sum of VRisk
+# The path scores follow prob_calculator.path_risk: the first vertex of a path
+# does not contribute and every further vertex v multiplies the probability by
+# q[v] and adds w[v] to the impact.
+# P_total needs the product over (1-p) of all paths which does not decompose;
+# it is computed from the power sums S_k = sum(p^k) via
+#   log(prod(1-p)) = -sum_k S_k/k
+
+from graph_tool.all import *
+import numpy
+import math
+
+import path_agg as pa
+from tools import log
+
+# max number of power sums for P_total and the chunk size to compute them
+DAG_MAX_POWERS=4096
+DAG_POWER_CHUNK=64
+DAG_POWER_EPS=1e-17
+
+
+# number of vertices of the longest path starting at any of the attackers
+def longest_path(g, attackers):
+    succs = [ [] for _ in range(g.num_vertices()) ]
+    for s,t in g.get_edges()[:,0:2]:
+        succs[s].append(int(t))
+    plen = numpy.zeros(g.num_vertices(), dtype=int)
+    for a in attackers:
+        plen[ int(a) ] = 1
+    for v in topological_sort(g):
+        if plen[v] > 0:
+            for t in succs[v]:
+                plen[t] = max(plen[t], plen[v]+1)
+    return plen.max()
+
+
+class DagEngine:
+    # q: per vertex probability factor, w: per vertex impact contribution
+    # const_risk: if not None, VRisk uses this constant instead of the prefix probability
+    #             (ignore_score mode of path_risk)
+    def __init__(self, g, attackers, q, w, const_risk=None):
+        self.g = g
+        self.nv = g.num_vertices()
+        self.q = numpy.asarray(q, dtype=float)
+        self.w = numpy.asarray(w, dtype=float)
+        self.const_risk = const_risk
+
+        self.is_attk = numpy.zeros(self.nv, dtype=bool)
+        for a in attackers:
+            self.is_attk[ int(a) ] = True
+
+        self.preds = [ [] for _ in range(self.nv) ]
+        self.succs = [ [] for _ in range(self.nv) ]
+        for s,t in g.get_edges()[:,0:2]:
+            self.preds[t].append(int(s))
+            self.succs[s].append(int(t))
+
+        # only vertices reachable from an attacker are of interest
+        order = [ int(v) for v in topological_sort(g) ]
+        reach = self.is_attk.copy()
+        for v in order:
+            if reach[v]:
+                for t in self.succs[v]:
+                    reach[t] = True
+        self.order = [ v for v in order if reach[v] ]
+        self.forward()
+
+    def forward(self):
+        nv = self.nv
+        self.N = [0] * nv
+        self.Nl = [ {} for _ in range(nv) ]
+        self.Nf = numpy.zeros(nv)
+        self.P = numpy.zeros(nv)
+        self.I = numpy.zeros(nv)
+        self.PI = numpy.zeros(nv)
+        self.R = numpy.zeros(nv)
+        self.Imin = numpy.full(nv, math.inf)
+        self.Imax = numpy.full(nv, -math.inf)
+        self.Pmax = numpy.zeros(nv)
+
+        for v in self.order:
+            q = self.q[v]
+            w = self.w[v]
+            n = 0
+            nl = {}
+            nf = p = i = pi = r = 0.0
+            imin = math.inf
+            imax = -math.inf
+            pmax = 0.0
+            for u in self.preds[v]:
+                if self.N[u] == 0:
+                    continue
+                n = n + self.N[u]
+                for l,cnt in self.Nl[u].items():
+                    pa.hist_add(nl, l+1, cnt)
+                nf = nf + self.Nf[u]
+                p = p + self.P[u]
+                i = i + self.I[u] + w*self.Nf[u]
+                newpi = q*(self.PI[u] + w*self.P[u])
+                pi = pi + newpi
+                if self.const_risk == None:
+                    r = r + self.R[u] + newpi
+                else:
+                    r = r + self.R[u] + self.const_risk*(self.I[u] + w*self.Nf[u])
+                imin = min(imin, self.Imin[u] + w)
+                imax = max(imax, self.Imax[u] + w)
+                pmax = max(pmax, self.Pmax[u])
+            p = q*p
+            pmax = q*pmax
+            if self.is_attk[v]:
+                # the single-vertex path [v]: prob 1, no impact
+                n = n + 1
+                pa.hist_add(nl, 1)
+                nf = nf + 1.0
+                p = p + 1.0
+                imin = min(imin, 0.0)
+                imax = max(imax, 0.0)
+                pmax = 1.0
+            self.N[v] = n
+            self.Nl[v] = nl
+            (self.Nf[v], self.P[v], self.I[v], self.PI[v], self.R[v]) = (nf, p, i, pi, r)
+            (self.Imin[v], self.Imax[v], self.Pmax[v]) = (imin, imax, pmax)
+
+    # S_k = sum(p^k) over all attacker->c paths for the given powers k
+    def power_sums(self, c, ks):
+        qk = self.q[:,None] ** ks[None,:]
+        S = numpy.zeros((self.nv, len(ks)))
+        for v in self.order:
+            acc = numpy.zeros(len(ks))
+            for u in self.preds[v]:
+                acc = acc + S[u]
+            S[v] = qk[v] * acc
+            if self.is_attk[v]:
+                S[v] = S[v] + 1.0
+            if v == c:
+                break
+        return S[c]
+
+    def analyze(self, c, nodemode=[], maxpaths=0):
+        return DagPathStats(self, int(c), nodemode, maxpaths)
+
+
+# result object for a single target, accessors follow path_agg.PathAggregator
+class DagPathStats:
+    def __init__(self, dag, c, nodemode, maxpaths):
+        self.dag = dag
+        self.c = c
+        self.hist = { l:dag.Nl[c][l] for l in sorted(dag.Nl[c]) }
+        self.npaths = dag.N[c]
+        self.nf = dag.Nf[c]
+        self.maxpaths = maxpaths
+        self.maxnodepaths = 0
+
+        # number of paths from every vertex to c
+        self.B = [0] * dag.nv
+        self.B[c] = 1
+        for v in reversed(dag.order):
+            if v == c:
+                continue
+            self.B[v] = sum( self.B[t] for t in dag.succs[v] )
+
+        self.nodemode = {}
+        if len(nodemode) > 0:
+            self.node_lengths(nodemode)
+
+    # length histograms of all paths through the given nodes
+    def node_lengths(self, nodemode):
+        dag = self.dag
+        Bl = [ {} for _ in range(dag.nv) ]
+        Bl[self.c] = {1:1}
+        for v in reversed(dag.order):
+            if v == self.c:
+                continue
+            for t in dag.succs[v]:
+                for l,cnt in Bl[t].items():
+                    pa.hist_add(Bl[v], l+1, cnt)
+        for node in nodemode:
+            nhist = {}
+            if node != None:
+                for l1,c1 in dag.Nl[node].items():
+                    for l2,c2 in Bl[node].items():
+                        pa.hist_add(nhist, l1+l2-1, c1*c2)
+            self.nodemode[node] = ({ l:nhist[l] for l in sorted(nhist) }, [])
+
+    # reconstruct up to limit paths of length plen ending at c (depth-first
+    # over the predecessors, from c backwards)
+    def paths_of_len(self, plen, limit):
+        dag = self.dag
+        out = []
+        if limit <= 0:
+            return out
+        if plen == 1:
+            if dag.is_attk[self.c]:
+                out.append([self.c])
+            return out
+        # rpath: the vertices from c backwards, preds: their predecessor iterators
+        rpath = [self.c]
+        preds = [ iter(dag.preds[self.c]) ]
+        while len(preds) > 0:
+            u = next(preds[-1], None)
+            if u == None:
+                rpath.pop()
+                preds.pop()
+                continue
+            # length of the path from an attacker to u
+            l = plen - len(rpath)
+            if dag.Nl[u].get(l, 0) == 0:
+                continue
+            if l == 1:
+                out.append( [u] + rpath[::-1] )
+                if len(out) >= limit:
+                    break
+                continue
+            rpath.append(u)
+            preds.append( iter(dag.preds[u]) )
+        return out
+
+    def count(self):
+        return self.npaths
+    def histogram(self):
+        return self.hist
+
+    def shortest(self):
+        minlen = min(self.hist)
+        return (minlen, self.hist[minlen], self.paths_of_len(minlen, self.maxpaths))
+    def longest(self):
+        maxlen = max(self.hist)
+        return (maxlen, self.hist[maxlen], self.paths_of_len(maxlen, self.maxpaths))
+    def first(self):
+        return None
+
+    def mean(self):
+        return pa.hist_mean(self.hist)
+    def stdev(self):
+        return pa.hist_stdev(self.hist)
+    def median(self):
+        return pa.hist_median(self.hist)
+    def multimode(self):
+        return pa.hist_multimode(self.hist)
+
+    # the truncated series underestimates P_total: with a max path probability
+    # close to 1 the terms shrink too slowly for DAG_MAX_POWERS power sums
+    def p_total(self):
+        dag = self.dag
+        pmax = dag.Pmax[self.c]
+        if pmax >= 1.0:
+            return 1.0
+        too_close = pmax ** DAG_MAX_POWERS / (1.0 - pmax) > DAG_POWER_EPS
+        if too_close:
+            log.warning("WARNING: max path probability %s is too close to 1 for %s power sums, P_total is too low", pmax, DAG_MAX_POWERS)
+        log_inter = 0.0
+        k = 1
+        converged = False
+        while k <= DAG_MAX_POWERS:
+            ks = numpy.arange(k, k+DAG_POWER_CHUNK, dtype=float)
+            terms = dag.power_sums(self.c, ks) / ks
+            log_inter = log_inter - math.fsum(terms)
+            k = k + DAG_POWER_CHUNK
+            # remaining terms are bounded by a geometric series of the last one
+            if terms[-1] / (1.0 - pmax) <= DAG_POWER_EPS * abs(log_inter):
+                converged = True
+                break
+        if not converged and not too_close:
+            log.warning("WARNING: P_total series did not converge within %s power sums, P_total is too low (max path probability: %s )", DAG_MAX_POWERS, pmax)
+        return 1.0 - math.exp(log_inter)
+    def avg_prob(self):
+        return self.dag.P[self.c] / self.nf
+
+    # min/max of VRisk and PRisk do not decompose over the vertices of a path
+    def impact(self):
+        return (self.dag.Imin[self.c], self.dag.Imax[self.c], self.dag.I[self.c] / self.nf)
+    def vrisk_stats(self):
+        return ("n/a", "n/a", self.dag.R[self.c] / self.nf)
+    def prisk_stats(self):
+        return ("n/a", "n/a", self.dag.PI[self.c] / self.nf)
+    def risk(self):
+        return self.dag.PI[self.c]
+
+    def vertex_counts(self):
+        dag = self.dag
+        counts = [0] * dag.nv
+        for v in dag.order:
+            fwd = dag.N[v] - int(dag.is_attk[v])
+            bwd = self.B[v] - int(v == self.c)
+            counts[v] = fwd * bwd
+        return counts
+    def modes(self, k=3):
+        return pa.mode_tiers(self.vertex_counts(), k)
+
+    def node_stats(self, node):
+        return self.nodemode[node]
+
+    # all edges that are part of an attacker->c path
+    def path_edges(self):
+        dag = self.dag
+        return [ (u,v) for v in dag.order for u in dag.preds[v] if self.B[v] > 0 and dag.N[u] > 0 ]
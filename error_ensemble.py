@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Noise ensemble of the -E option (--error_replicates R).
+#
+# Instead of one noisy result, the enumerated paths are scored R times with
+# noisy node probabilities and impacts (the noise of -E: normal distribution
+# with a variance of |E| percent, clipped to [0,1] for probabilities and [0,4]
+# for impacts). The noise of all replicates is drawn at once from the --seed
+# generator, so the results don't depend on the number of workers.
+# Replicates are scored in batches; with workers > 1 the batches run on forked
+# processes that see the paths and the noise read-only.
+
+import logging
+import multiprocessing
+import numpy
+
+import path_agg as pa
+from tools import log, tqdm
+
+# replicates scored at once (bounds the [replicate, path] matrices)
+REPLICATE_BATCH=32
+PERCENTILES=[5, 25, 50, 75, 95]
+
+# ensemble shared with the forked workers
+_ens = None
+
+
+# noisy copies [replicate, vertex] of the vertex probabilities and impacts
+# (only the first nnodes vertices get noise, like -E)
+def noise_matrix(rng, error, replicates, vprob, vimpact, nnodes):
+    noise = rng.normal(0.0, numpy.sqrt(abs(error)), (2, replicates, nnodes)) * numpy.copysign(1.0, error) / 100.0
+    prob = numpy.tile(vprob, (replicates, 1))
+    impt = numpy.tile(vimpact, (replicates, 1))
+    prob[:,0:nnodes] = numpy.clip(prob[:,0:nnodes] + noise[0], 0.0, 1.0)
+    impt[:,0:nnodes] = numpy.clip(impt[:,0:nnodes] + noise[1], 0.0, 4.0)
+    return prob, impt
+
+
+class Ensemble:
+    # paths: PathStore, valid: paths without loops
+    def __init__(self, pcalc, paths, valid, shift, cut_off, nmodes, vprob, vimpact):
+        self.pcalc = pcalc
+        self.paths = paths
+        self.valid = valid
+        self.shift = shift
+        self.cut_off = cut_off
+        self.nmodes = nmodes
+        self.vprob = vprob
+        self.vimpact = vimpact
+        # interior vertices of the paths and their path index (for the modes)
+        offs = paths.get_offsets()
+        interior = numpy.ones(len(paths.vertices()), dtype=bool)
+        interior[ offs[:-1] ] = False
+        interior[ offs[1:]-1 ] = False
+        self.ivertices = paths.vertices()[interior]
+        self.ipaths = numpy.repeat(numpy.arange(len(paths)), numpy.diff(offs))[interior]
+        self.nvertices = len(vprob[0])
+
+    def replicates(self):
+        return len(self.vprob)
+
+    # P_total, risk score, node mode values and first mode vertices of the
+    # replicates [b:e]
+    def score(self, b, e):
+        n = e - b
+        (prob, impt, _) = self.pcalc.path_scores_matrix(self.paths, self.vprob[b:e],
+                                                        numpy.full(n, self.shift), self.vimpact[b:e])
+        keep = self.valid[None,:] & (prob >= self.cut_off)
+        kprob = numpy.where(keep, prob, 0.0)
+        p_total = 1.0 - numpy.prod(1.0 - kprob, axis=1)
+        risk = numpy.sum(kprob * impt, axis=1)
+
+        modes = numpy.zeros( (n, self.nmodes) )
+        first = numpy.zeros(self.nvertices, dtype=numpy.int64)
+        for r in range(n):
+            if r > 0 and numpy.array_equal(keep[r], keep[r-1]):
+                modes[r] = modes[r-1]
+                first[tiers[0]] += 1
+                continue
+            counts = numpy.bincount( self.ivertices[ keep[r][self.ipaths] ], minlength=self.nvertices )
+            # no kept paths: mode values 0 and no first mode
+            tiers = [ [] ]
+            if counts.max() > 0:
+                (vals, tiers) = pa.mode_tiers(counts, self.nmodes)
+                modes[r,0:len(vals)] = vals
+            first[tiers[0]] += 1
+        return p_total, risk, modes, first
+
+def score_batch(batch):
+    return _ens.score(*batch)
+
+# score all replicates, returns (p_total, risk, modes, first mode counts)
+def run(ens, workers=1):
+    global _ens
+    batches = [ (b, min(b+REPLICATE_BATCH, ens.replicates())) for b in range(0, ens.replicates(), REPLICATE_BATCH) ]
+    results = []
+    if workers <= 1:
+        for batch in tqdm(batches, desc="Replicates", disable=not log.isEnabledFor(logging.INFO)):
+            results.append( ens.score(*batch) )
+    else:
+        _ens = ens
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            # imap returns the results in batch order
+            for res in tqdm(pool.imap(score_batch, batches), desc="Replicates", total=len(batches), disable=not log.isEnabledFor(logging.INFO)):
+                results.append(res)
+        _ens = None
+    return ( numpy.concatenate([ r[0] for r in results ]),
+             numpy.concatenate([ r[1] for r in results ]),
+             numpy.concatenate([ r[2] for r in results ]),
+             numpy.sum([ r[3] for r in results ], axis=0) )
+
+# mean, stdev and percentiles of the values of the replicates
+def distribution(vals):
+    dist = { "mean": float(numpy.mean(vals)),
+             "stdev": float(numpy.std(vals, ddof=1)) if len(vals) > 1 else 0.0 }
+    for q,v in zip(PERCENTILES, numpy.percentile(vals, PERCENTILES)):
+        dist["p{}".format(q)] = float(v)
+    return dist
@@ -18,11 +18,15 @@
 
 
 import copy
+import logging
 
 import layers
 import groups
 import nodes
 import stencil
+import symbols
+from stencil import StencilTemplate
+from tools import log
 
 
 class StrongGraph:
@@ -30,11 +34,13 @@ class StrongGraph:
         self.layers = layers.LayerList()
         self.nodes = nodes.NodeList()
         self.stencils = stencil.StencilList()
-        self.nodes_dict = {}
+        self.symbols = None
         self.config = config
 
         self.attacker = ymldata.pop("attacker",[])
         self.target = ymldata.pop("target",[])
+        self.attacker_set = set(self.attacker)
+        self.target_set = set(self.target)
         gdata = ymldata.pop("groups",[])
         self.groups = groups.StrongGroups(gdata, config.GGroupProb())
         self.cmap = {}
@@ -47,7 +53,7 @@ class StrongGraph:
                 elif d["type"].lower() == "stencil":
                     self.stencils.add(n, d)
                 else:
-                    print("Unrecognized Type:", d["type"])
+                    log.warning("Unrecognized Type: %s", d["type"])
 
         # second pass over data to create nodes
         for n,d in ymldata.items():
@@ -62,15 +68,16 @@ class StrongGraph:
                     self.nodes.add(n, d, self.layers, self.groups, config)
 
         # fix/update any links that might need to be remapped because of modified/collapsed stencils
-        print("LINK UPDATES ====================")
+        log.debug("LINK UPDATES ====================")
         for n in self.nodes.get():
             n.fixlinkdest( self.cmap )
 
         self.layers.log()
-        print("NodeList:")
-        for n in self.nodes.get():
-            print("Node:",n.nname()," ---> ",n.nlinks()," | ",n.nactivegroup())
-            self.nodes_dict[n.nname()] = n
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("NodeList:")
+            for n in self.nodes.get():
+                log.debug("Node: %s  --->  %s  |  %s", n.nname(), n.nlinks(), n.nactivegroup())
+        self.symbols = symbols.SymbolTable([ n.nname() for n in self.nodes.get() ])
         self.check_consistency()
 
 
@@ -84,16 +91,21 @@ class StrongGraph:
     def get_targets(self):
         return self.target
 
+    def get_symbols(self):
+        return self.symbols
+
     def is_attacker(self, name):
-        return name in self.attacker
+        return name in self.attacker_set
     def is_target(self, name):
-        return name in self.target
+        return name in self.target_set
 
     def shorten_ta_names(self, shortener):
         if "." in self.attacker[0]:
             self.attacker = [ shortener.apply( n ) for n in self.attacker ]
         if "." in self.target[0]:
             self.target = [ shortener.apply( n ) for n in self.target ]
+        self.attacker_set = set(self.attacker)
+        self.target_set = set(self.target)
 
     # create instance links dictionary for all external links
     # such that linklist[subnode] returns a list of those links
@@ -106,7 +118,7 @@ class StrongGraph:
                     linklist[ li["s"] ] = []
                 link_entry = { k:v for (k,v) in li.items() if k != "s" }
                 if link_entry["d"] in self.cmap:
-                    print("ReMapping outbound link:", link_entry["d"] )
+                    log.debug("ReMapping outbound link: %s", link_entry["d"])
                     link_entry["d"] = self.cmap[ link_entry["d"] ]
                 linklist[ li["s"] ].append( link_entry  )
 
@@ -118,29 +130,33 @@ class StrongGraph:
 
 
 
-    # instantiate the intra-stencil links
-    def instantiate_links(self, srcnode, node, instancename, removed):
+    # instantiate the intra-stencil links (new link entries, the template links
+    # are not modified)
+    def instantiate_links(self, srcnode, node, layer, instancename, removed):
         instlinks = []
         if "links" in node:
-            print("Link Instantiation for: ", srcnode)
-            nameprefix = node["layer"] + "." + instancename + "."
+            log.debug("Link Instantiation for: %s", srcnode)
+            nameprefix = layer + "." + instancename + "."
             for dest in node["links"]:
-                print("link to",dest)
-                if dest in removed:
-                    print("SKIPPING removed destination snode", dest)
+                log.debug("link to %s", dest)
+                if dest["d"] in removed:
+                    log.debug("SKIPPING removed destination snode %s", dest)
                     continue
+                newlink = dest.copy()
                 if nameprefix+dest["d"] in self.cmap:
-                    tnode = self.cmap[ nameprefix+dest["d"] ]
+                    newlink["d"] = self.cmap[ nameprefix+dest["d"] ]
                 else:
-                    tnode = node["layer"] + "." + instancename + "." + dest["d"]
-                newlink = dest
-                newlink["d"] = tnode
+                    newlink["d"] = nameprefix + dest["d"]
                 instlinks.append(newlink)
         return instlinks
 
+    # stencil template with the modifiers of the instance applied
+    # (built once per stencil and distinct set of modifiers)
     def process_modifiers(self, instencil, ndata):
-        stencil = copy.deepcopy(instencil)
+        return instencil.template( ndata.get("modifier"),
+                                   lambda: self.build_template(instencil, ndata) )
 
+    def build_template(self, stencil, ndata):
         # deletion updates
         # renaming updates
         # problem: node rename/deletion doesn't update link-names
@@ -152,13 +168,13 @@ class StrongGraph:
                 for k,v in e.items():
                     modifiers[ k ] = v
                     if len(v) == 0:
-                        print("stencil node '{}' will be removed by modifier".format(k))
+                        log.debug("stencil node '%s' will be removed by modifier", k)
                         snode_remove.append(k)
         else:
-            return stencil.sdata(),snode_remove
+            return StencilTemplate(stencil.sdata(), snode_remove)
 
         snodes = {}
-        print("Processing modifiers for stencil:", stencil.sname())
+        log.debug("Processing modifiers for stencil: %s", stencil.sname())
         for snode,sdata in stencil.sdata().items():
             if snode in modifiers:
                 # if instance has a modifier for this stencil node:
@@ -206,12 +222,36 @@ class StrongGraph:
                         snodes[snode]["links"].append(link.copy())
 
         for n,v in snodes.items():
-            print(n, v)
-        return snodes,snode_remove
+            log.debug("%s %s", n, v)
+        return StencilTemplate(snodes, snode_remove)
+
+    # internal part of collapsing the nodes of a template (same for all instances):
+    # returns (remaining stencil nodes, internal links of the collapsed node,
+    #          destinations of those links)
+    def collapse_template(self, template, collapsed, cnodename):
+        remaining = {}
+        remaining[cnodename] = None
+        cnode_links = []
+        uniquedest = set()
+        for sn,sd in template.nodes().items():
+            if sn not in collapsed:
+                remaining[sn] = sd
+            else:
+                # internal links updates: destinations
+                for l in sd["links"]:
+                    if l["d"] not in collapsed:
+                        if l["d"] in uniquedest:
+                            continue
+                        uniquedest.add(l["d"])
+                        newlink = l.copy()
+                        newlink["s"] = cnodename
+                        cnode_links.append( newlink )
+                        log.debug("creating new internal link based on %s to %s", sn, newlink)
+        return remaining, cnode_links, uniquedest
 
     # create a collapsed node, remove collapsed subnodes from stencil items
     # collect node-to-collapsed node mappings for links
-    def process_collapsed(self, nametup, ndata, stencilnodes, linklist):
+    def process_collapsed(self, nametup, ndata, template, linklist):
         nameprefix=nametup[0]+"."+nametup[1]+"."
         cnodename=nametup[2]
 
@@ -220,30 +260,20 @@ class StrongGraph:
             # todo: check connectivity (can only collapse connected nodes)
             for cn in ndata["collapsed"]:
                 self.cmap[nameprefix+cn] = nameprefix+cnodename
-            print(self.cmap)
-            remaining = {}
+                log.debug("collapsing: %s -> %s", nameprefix+cn, nameprefix+cnodename)
+
+            (cremaining, cnode_links, cuniquedest) = template.collapse(
+                (tuple(ndata["collapsed"]), cnodename),
+                lambda: self.collapse_template(template, set(ndata["collapsed"]), cnodename) )
 
             # create the collapsed node
             cnode={}
             cnode["layer"] = ndata["layer"]
-            cnode["links"] = []
-            remaining[cnodename] = cnode
-
-            uniquedest = set()
-            for sn,sd in stencilnodes.items():
-                if sn not in ndata["collapsed"]:
-                    remaining[sn] = sd
-                else:
-                    # internal links updates: destinations
-                    for l in sd["links"]:
-                        if nameprefix+l["d"] not in self.cmap:
-                            newlink = copy.deepcopy( l )
-                            if newlink["d"] in uniquedest:
-                                continue
-                            uniquedest.add(l["d"])
-                            newlink["s"] = cnodename
-                            cnode["links"].append( newlink )
-                            print("creating new internal link based on",sn,"to", newlink)
+            cnode["links"] = [ l.copy() for l in cnode_links ]
+            remaining = dict(cremaining)
+            if remaining[cnodename] == None:
+                remaining[cnodename] = cnode
+            uniquedest = set(cuniquedest)
             linklist[ cnodename ] = []
 
             # external link updates: sources
@@ -255,7 +285,7 @@ class StrongGraph:
                             continue
                         uniquedest.add(l["d"])
                         newlink["s"] = cnodename
-                        print("Updated external link: ", ln, " sourced:", cnodename)
+                        log.debug("Updated external link: %s sourced: %s", ln, cnodename)
                         linklist[ cnodename ].append( newlink )
 
             if "cprobability" in ndata:
@@ -273,12 +303,12 @@ class StrongGraph:
             #     cnode["probability"] = self.config.DefaultProb()
 
             return cnode, remaining
-        return None, stencilnodes
+        return None, template.nodes()
 
 
     def instantiate(self, name, ndata):
         if ndata["stencil"] not in self.stencils.get():
-            print("Requested stencil ", ndata["stencil"], "not (yet) known. Make sure stencil is defined before instantiation")
+            log.warning("Requested stencil %s not (yet) known. Make sure stencil is defined before instantiation", ndata["stencil"])
             return
 
         linklist = self.extract_external_links(ndata)
@@ -287,7 +317,8 @@ class StrongGraph:
         stencil = self.stencils.get()[ ndata["stencil"] ]
         snode_list = nodes.NodeList()
 
-        modified,removed = self.process_modifiers(stencil, ndata)
+        template = self.process_modifiers(stencil, ndata)
+        removed = template.removed_nodes()
         modout = ""
         if "modifier" in ndata:
             modout = "with modifiers"
@@ -303,13 +334,14 @@ class StrongGraph:
 
         cnode,modified = self.process_collapsed( (ndata["layer"], name, "grouped"),
                                                  ndata,
-                                                 modified,
+                                                 template,
                                                  linklist )
 
-        print("Instantiating stencil '{}' as '{}' {}".format(ndata["stencil"], name, modout) )
+        log.info("Instantiating stencil '%s' as '%s' %s", ndata["stencil"], name, modout)
         for snode,sdata in modified.items():
-            print("Instantiating NODE:", snode)
-            newnode = copy.deepcopy(sdata)  # make sure the stencil data is replicated from the original
+            log.debug("Instantiating NODE: %s", snode)
+            # the template data is shared: new dict, links are instantiated below
+            newnode = { k:v for (k,v) in sdata.items() if k != "links" }
             newnode["layer"] = ndata["layer"]
 
             if "probability" in sdata:
@@ -325,7 +357,7 @@ class StrongGraph:
             if "groups" in ndata:
                 newnode["groups"] = ndata["groups"]
 
-            instlinks = self.instantiate_links(snode, newnode, name, removed)
+            instlinks = self.instantiate_links(snode, sdata, ndata["layer"], name, removed)
 
             if snode in linklist:
                 nodelinks = linklist[snode]
@@ -340,4 +372,4 @@ class StrongGraph:
         return snode_list
 
     def check_consistency(self):
-        self.nodes.check_consistency(self.layers)
+        self.nodes.check_consistency(self.layers, self.symbols)
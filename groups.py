@@ -16,6 +16,8 @@
 # limitations under the License.
 # 
 
+from tools import log
+
 class StrongGroup:
     def __init__(self, name, prob, prio):
         self.name = name
@@ -38,12 +40,13 @@ class StrongGroups:
     # the order of the groups is important for priority
     def __init__(self, ymldata, ovrrd):
         self.groups = {}
-        print("GROUPDATA:", ymldata, ovrrd)
+        self.ymldata = ymldata
+        log.debug("GROUPDATA: %s %s", ymldata, ovrrd)
         ovrrd_offset=len(ovrrd)
         for prio,g in enumerate(ymldata):
             for k,v in g.items():
                 if k in ovrrd:
-                    print("Groupprob override:", k, ovrrd[k])
+                    log.info("Groupprob override: %s %s", k, ovrrd[k])
                     self.add(k, ovrrd[k][0], prio+ovrrd_offset) # cmdline override
                 else:
                     self.add(k, v, prio+ovrrd_offset) # regular yml defined
@@ -62,6 +65,10 @@ class StrongGroups:
     def get(self):
         return self.groups
 
+    # the group list of the yml file
+    def yml(self):
+        return self.ymldata
+
     def find(self, name):
         if name in self.groups:
             return self.groups[name]
@@ -70,4 +77,4 @@ class StrongGroups:
 
     def log(self):
         for k,v in self.groups.items():
-            print(k, ":", v.gprobability(), ",", v.gpriority())
+            log.debug("%s : %s , %s", k, v.gprobability(), v.gpriority())
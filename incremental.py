@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Incremental update of the enumerated paths and their scores (--watch).
+#
+# The path analysis keeps the paths {target: PathStore} and their scores
+# {target: (prob, impt, risk)} of the previous analysis (see path_stats).
+# When the model changed, update() compares the old and the new graph:
+#  - paths that use a removed edge are dropped
+#  - paths that use an added edge are enumerated and appended (every new path
+#    is enumerated for the first added edge on it: a prefix from the attacker
+#    without added edges, the edge and any suffix to the target)
+#  - paths through vertices with changed scores (probability, impact or
+#    out-degree) are rescored, found with the vertex->paths index of the store
+# Models with different nodes, attackers or targets are analyzed from scratch.
+# The statistics equal those of a fresh analysis; after structural changes the
+# order of the paths (and so the printed path lists) can differ.
+
+from graph_tool.all import *
+import os
+import numpy
+
+import path_store as ps
+import path_trie as pt
+from tools import log
+
+
+# {file: mtime} of the files of a model (None for missing files)
+def source_mtimes(fnames):
+    mtimes = {}
+    for fname in fnames:
+        try:
+            mtimes[fname] = os.stat(fname).st_mtime_ns
+        except OSError:
+            mtimes[fname] = None
+    return mtimes
+
+# edges of g as sorted keys source*nv+target
+def edge_keys(g):
+    edges = g.get_edges()
+    nv = g.num_vertices()
+    return numpy.unique( edges[:,0].astype(numpy.int64) * nv + edges[:,1] )
+
+# bool mask of the paths of a store that use one of the edges (keys)
+def paths_using(ap, keys, nv):
+    if len(ap) == 0 or len(keys) == 0:
+        return numpy.zeros(len(ap), dtype=bool)
+    verts = ap.vertices().astype(numpy.int64)
+    # edge of every vertex to the next one, the last vertex of a path has none
+    ekeys = numpy.empty(len(verts), dtype=numpy.int64)
+    ekeys[:-1] = verts[:-1] * nv + verts[1:]
+    ekeys[-1] = -1
+    ekeys[ ap.get_offsets()[1:]-1 ] = -1
+    hit = numpy.isin(ekeys, keys)
+    return numpy.logical_or.reduceat(hit, ap.get_offsets()[:-1])
+
+# all attacker->target paths that use one of the added edges (keys)
+def paths_via(g, attackers, target, added, cutoff):
+    nv = g.num_vertices()
+    target = int(target)
+    store = ps.PathStore(nv)
+    # prefixes don't use added edges and don't contain the target
+    efilt = g.new_edge_property("bool", val=True)
+    edges = g.get_edges([g.edge_index])
+    efilt.get_array()[:] = ~numpy.isin( edges[:,0].astype(numpy.int64) * nv + edges[:,1], added )
+    vfilt = g.new_vertex_property("bool", val=True)
+    vfilt[target] = False
+    base = GraphView(g, vfilt=vfilt, efilt=efilt)
+
+    for key in added:
+        (u, v) = (int(key // nv), int(key % nv))
+        if u == target:
+            continue
+        for a in attackers:
+            a = int(a)
+            if v == a:
+                continue
+            if u == a:
+                prefixes = [ numpy.array([a]) ]
+            else:
+                prefixes = all_paths(base, a, u, cutoff=cutoff-1, edges=False)
+            for prefix in prefixes:
+                if len(prefix) > cutoff or v in prefix:
+                    continue
+                if v == target:
+                    store.append( numpy.append(prefix, v) )
+                    continue
+                sfilt = g.new_vertex_property("bool", val=True)
+                for p in prefix:
+                    sfilt[int(p)] = False
+                view = GraphView(g, vfilt=sfilt)
+                for suffix in all_paths(view, v, target, cutoff=cutoff-len(prefix), edges=False):
+                    store.append( numpy.concatenate( (prefix, suffix) ) )
+    return store
+
+# concatenation of two stores
+def join(first, second):
+    store = ps.PathStore(first.nvertices, capacity=1)
+    store.buf = numpy.concatenate( (first.vertices(), second.vertices().astype(first.dtype)) )
+    store.offsets = numpy.concatenate( (first.get_offsets(), second.get_offsets()[1:] + len(first.vertices())) )
+    store.npaths = len(first) + len(second)
+    return store
+
+# update paths and scores from the graph old_sg to sg (see above)
+# returns False if the model changed too much (paths and scores are cleared)
+def update(old_sg, sg, pcalc, old_pcalc, shift, paths, scores):
+    old = old_sg.model
+    new = sg.model
+    if ( old.num_nodes() != new.num_nodes()
+         or [ old.longname(i) for i in range(old.num_nodes()) ] != [ new.longname(i) for i in range(new.num_nodes()) ]
+         or not numpy.array_equal(old.attackers(), new.attackers())
+         or not numpy.array_equal(old.targets(), new.targets()) ):
+        paths.clear()
+        scores.clear()
+        return False
+
+    nv = sg.g.num_vertices()
+    old_keys = edge_keys(old_sg.g)
+    new_keys = edge_keys(sg.g)
+    removed = numpy.setdiff1d(old_keys, new_keys)
+    added = numpy.setdiff1d(new_keys, old_keys)
+    changed = numpy.flatnonzero( (old_pcalc.vprob != pcalc.vprob) | (old_pcalc.vimpt != pcalc.vimpt) )
+    log.info("Model changes: %s removed edges, %s added edges, %s vertices with changed scores",
+             len(removed), len(added), len(changed))
+
+    cutoff = max( 50, int( float( sg.num_nodes()) *0.85 ))
+    for c in list(paths):
+        ap = pt.as_store(paths[c])
+        sc = scores.get(c)
+        if len(removed) > 0:
+            keep = ~paths_using(ap, removed, nv)
+            log.info("Dropping %s paths", len(ap) - numpy.count_nonzero(keep))
+            ap = ap.take(keep)
+            if sc != None:
+                sc = tuple([ s[keep] for s in sc ])
+        nold = len(ap)
+        if len(added) > 0:
+            ap = join( ap, paths_via(sg.g, sg.get_attackers(), c, added, cutoff) )
+            log.info("Adding %s paths", len(ap) - nold)
+        paths[c] = ap
+        if sc == None:
+            continue
+
+        # rescore the new paths and the paths through changed vertices
+        if not ap.has_index():
+            ap.build_index()
+        ids = [ numpy.arange(nold, len(ap)) ] + [ ap.paths_with(v) for v in changed ]
+        ids = numpy.unique( numpy.concatenate(ids) ).astype(numpy.int64)
+        log.info("Rescoring %s paths", len(ids))
+        sc = tuple([ numpy.concatenate( (s, numpy.zeros(len(ap)-nold)) ) for s in sc ])
+        for s,new_s in zip(sc, pcalc.path_scores(ap.take(ids), shift)):
+            s[ids] = new_s
+        scores[c] = sc
+    return True
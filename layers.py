@@ -16,10 +16,13 @@
 # limitations under the License.
 # 
 
+import logging
 import os
 import pathlib
 import yaml
 
+from tools import log
+
 class Layer:
     def __init__(self, name, upper = "none", lower = "none", data={}):
         LAYER_DEFAULTS={"upper":"none",
@@ -64,9 +67,9 @@ class LayerList:
 
     def add(self, name, ldata):
         if name in self.layers:
-            print("WARNING: trying to add a stencil that already exits.")
+            log.warning("WARNING: trying to add a layer that already exits: %s", name)
         else:
-            print("LAYER: adding new: ",name)
+            log.debug("LAYER: adding new: %s", name)
             self.layers[name] = Layer(name, data=ldata)
             self.sorted = self.order()
         return self.layers[name]
@@ -87,5 +90,7 @@ class LayerList:
 
 
     def log(self):
-        print("Layers :", [ {l.lname(): [l.lupper(), l.llower()]} for _,l in self.get().items() ] )
-        print("Ordered:", [ {l.lname(): [l.lupper(), l.llower()]} for l in self.ordered() ] )
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        log.debug("Layers : %s", [ {l.lname(): [l.lupper(), l.llower()]} for _,l in self.get().items() ] )
+        log.debug("Ordered: %s", [ {l.lname(): [l.lupper(), l.llower()]} for l in self.ordered() ] )
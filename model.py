@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# The model as flat arrays: everything the analysis needs from the yml model
+# after stencil instantiation, consistency checks and name shortening.
+#
+# A model is either built from a StrongGraph or read from a compiled model
+# file (python strong.py compile model.yml -o model.sgm). File layout:
+#   MAGIC | header length (8 bytes, little endian) | json header | arrays
+# The header lists dtype, shape and offset of every array. The arrays start at
+# ALIGN aligned offsets and are opened with numpy.memmap (read-only, so all
+# processes that use the same file share the pages).
+# The header also records the source files (mtime, sha256) and the options that
+# change the node scores, so an outdated compiled model can be rebuilt.
+# A compiled model saves the parsing, stencil instantiation, checks and name
+# shortening; the graph of the analysis is still created from the arrays.
+
+import hashlib
+import json
+import logging
+import os
+import numpy
+
+import graph as sgr
+import symbols
+import tools
+from tools import log
+
+MAGIC = b"STRONGM1"
+ALIGN = 64
+# version of the arrays and meta data (older compiled models are rebuilt)
+MODEL_VERSION = 2
+
+
+# names as one utf-8 blob plus the byte offsets of the names
+def pack_names(names):
+    enc = [ n.encode() for n in names ]
+    offs = numpy.zeros(len(enc)+1, dtype=numpy.int64)
+    numpy.cumsum([ len(e) for e in enc ], out=offs[1:])
+    return numpy.frombuffer(b"".join(enc), dtype=numpy.uint8), offs
+
+def unpack_names(blob, offs):
+    data = blob.tobytes()
+    o = offs.tolist()
+    return [ data[o[i]:o[i+1]].decode() for i in range(len(o)-1) ]
+
+def file_digest(fname):
+    with open(fname, 'rb') as data_stream:
+        return hashlib.sha256(data_stream.read()).hexdigest()
+
+def source_entry(fname):
+    return { "path": os.path.abspath(fname),
+             "mtime": os.stat(fname).st_mtime_ns,
+             "sha256": file_digest(fname) }
+
+# True if any of the source files was modified (or removed)
+def sources_changed(sources):
+    for src in sources:
+        try:
+            mtime = os.stat(src["path"]).st_mtime_ns
+        except OSError:
+            return True
+        if mtime != src["mtime"] and file_digest(src["path"]) != src["sha256"]:
+            return True
+    return False
+
+
+class Model:
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.longnames = unpack_names(arrays["long_blob"], arrays["long_offs"])
+        self.shortnames = unpack_names(arrays["short_blob"], arrays["short_offs"])
+        # created on first use (node lookups of -M)
+        self.symbols = None
+        self.shortener = tools.Shortener()
+        self.shortener.restore(meta["shortener"], meta["overrides"])
+
+    def num_nodes(self):
+        return len(self.longnames)
+    def get_symbols(self):
+        if self.symbols == None:
+            self.symbols = symbols.SymbolTable(self.longnames)
+            self.symbols.set_short(self.shortnames)
+        return self.symbols
+    def get_shortener(self):
+        return self.shortener
+
+    def longname(self, idx):
+        return self.longnames[idx]
+    def shortname(self, idx):
+        return self.shortnames[idx]
+    # node probability as given in the model (int or float)
+    def probability(self, idx):
+        p = float(self.arrays["prob"][idx])
+        if self.arrays["prob_int"][idx]:
+            return int(p)
+        return p
+
+    def probabilities(self):
+        return self.arrays["prob"]
+    def impacts(self):
+        return self.arrays["impact"]
+    # outbound links of node idx: link_dst[ link_ptr[idx]:link_ptr[idx+1] ]
+    def links(self):
+        return self.arrays["link_ptr"], self.arrays["link_dst"]
+    def attackers(self):
+        return self.arrays["attackers"]
+    def targets(self):
+        return self.arrays["targets"]
+
+    def layer_names(self):
+        return self.meta["layers"]
+    def layers(self):
+        return self.arrays["layer"]
+    def group_names(self):
+        return self.meta["groups"]
+    # index into group_names of the active group, -1 for none
+    def groups(self):
+        return self.arrays["group"]
+
+    # what the node probabilities are derived from (see sweep):
+    #  - the node probability of the yml file (-1.0 for none)
+    #  - the groups of the nodes: member_idx[ member_ptr[idx]:member_ptr[idx+1] ]
+    #    are indices into member_names
+    #  - the group list of the yml file
+    def yml_probabilities(self):
+        return self.arrays["prob_yml"]
+    def members(self):
+        return self.arrays["member_ptr"], self.arrays["member_idx"]
+    def member_names(self):
+        return self.meta["members"]
+    def yml_groups(self):
+        return self.meta["ymlgroups"]
+
+    # digest of the links, attackers and targets: models with the same key
+    # have the same graph (and the same paths) and only differ in the scores
+    def structure_key(self):
+        digest = hashlib.sha256()
+        for name in ["link_ptr", "link_dst", "attackers", "targets"]:
+            digest.update( numpy.ascontiguousarray(self.arrays[name], dtype=numpy.int64).tobytes() )
+            digest.update(b"|")
+        return digest.hexdigest()
+
+    def sources(self):
+        return self.meta["sources"]
+    def config_key(self):
+        return self.meta["config"]
+    def version(self):
+        return self.meta.get("version")
+
+
+# model of a StrongGraph (creates the short names)
+# sources: list of the yml files the graph was created from
+def build(lg, config, sources=[]):
+    nodes = lg.get_nodes().get()
+    shortener = tools.Shortener()
+    shlist = shortener.assign([ n.nname() for n in nodes ])
+    if shlist == None:
+        raise tools.NameShorteningError("NO MORE SHORTENING OPTIONS AVAILABLE TO CREATE UNIQUE SHORTNAMES")
+    log.info("Successful SHORTENING with option %s : %s", shortener.get(), shlist)
+    symtab = lg.get_symbols()
+    symtab.set_short(shlist)
+    lg.shorten_ta_names(shortener)
+
+    arrays = {}
+    (arrays["long_blob"], arrays["long_offs"]) = pack_names([ n.nname() for n in nodes ])
+    (arrays["short_blob"], arrays["short_offs"]) = pack_names(shlist)
+    arrays["prob"] = numpy.array([ n.nprobability() for n in nodes ], dtype=numpy.float64).reshape(-1)
+    arrays["prob_int"] = numpy.array([ isinstance(n.nprobability(), int) for n in nodes ], dtype=bool).reshape(-1)
+    arrays["impact"] = numpy.array([ n.nimpact() for n in nodes ], dtype=numpy.float64).reshape(-1)
+
+    arrays["link_ptr"] = numpy.zeros(len(nodes)+1, dtype=numpy.int64)
+    numpy.cumsum([ len(n.nlinks()) for n in nodes ], out=arrays["link_ptr"][1:])
+    arrays["link_dst"] = numpy.array([ symtab.vertex( l["d"] ) for n in nodes for l in n.nlinks() ],
+                                     dtype=numpy.int64).reshape(-1)
+
+    arrays["attackers"] = numpy.array([ idx for idx,s in enumerate(shlist) if lg.is_attacker(s) ], dtype=numpy.int64).reshape(-1)
+    arrays["targets"] = numpy.array([ idx for idx,s in enumerate(shlist) if lg.is_target(s) ], dtype=numpy.int64).reshape(-1)
+
+    layers = list(lg.get_layers().get())
+    lidx = { l:idx for idx,l in enumerate(layers) }
+    arrays["layer"] = numpy.array([ lidx.get(n.nlayer(), -1) for n in nodes ], dtype=numpy.int32).reshape(-1)
+    groups = list(lg.groups.get())
+    gidx = { g:idx for idx,g in enumerate(groups) }
+    arrays["group"] = numpy.array([ -1 if n.nactivegroup() == None else gidx[ n.nactivegroup().gname() ]
+                                    for n in nodes ], dtype=numpy.int32).reshape(-1)
+
+    arrays["prob_yml"] = numpy.array([ n.nymlprobability() for n in nodes ], dtype=numpy.float64).reshape(-1)
+    members = list(groups)
+    members.extend( sorted(set([ g for n in nodes for g in n.ngroups() if g not in gidx ])) )
+    midx = { g:idx for idx,g in enumerate(members) }
+    arrays["member_ptr"] = numpy.zeros(len(nodes)+1, dtype=numpy.int64)
+    numpy.cumsum([ len(n.ngroups()) for n in nodes ], out=arrays["member_ptr"][1:])
+    arrays["member_idx"] = numpy.array([ midx[g] for n in nodes for g in n.ngroups() ], dtype=numpy.int32).reshape(-1)
+
+    meta = { "version": MODEL_VERSION,
+             "shortener": shortener.get(),
+             "overrides": shortener.overrides,
+             "layers": layers,
+             "groups": groups,
+             "members": members,
+             "ymlgroups": lg.groups.yml(),
+             "config": config.ModelKey(),
+             "sources": [ source_entry(f) for f in sources ] }
+    return Model(arrays, meta)
+
+# model of a yml file and its includes
+def build_yml(fname, config, cache_dir=None):
+    (ymldata, files) = tools.load_model_files(fname, cache_dir)
+    if ymldata == None:
+        return None
+    gr = sgr.StrongGraph(ymldata, config)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s", [ (g.gname(),g.gprobability()) for _,g in gr.groups.get().items() ])
+    return build(gr, config, files)
+
+
+def write(mdl, fname):
+    names = sorted(mdl.arrays)
+    header = { "arrays": {}, "meta": mdl.meta }
+    offset = 0
+    for name in names:
+        arr = numpy.ascontiguousarray(mdl.arrays[name])
+        header["arrays"][name] = { "dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset }
+        offset = offset + (arr.nbytes + ALIGN-1) // ALIGN * ALIGN
+    hdata = json.dumps(header).encode()
+    start = (len(MAGIC) + 8 + len(hdata) + ALIGN-1) // ALIGN * ALIGN
+
+    tmpfile = "{}.{}.tmp".format(fname, os.getpid())
+    with open(tmpfile, "wb") as mstream:
+        mstream.write(MAGIC)
+        mstream.write(len(hdata).to_bytes(8, "little"))
+        mstream.write(hdata)
+        for name in names:
+            arr = numpy.ascontiguousarray(mdl.arrays[name])
+            mstream.seek(start + header["arrays"][name]["offset"])
+            mstream.write(arr.tobytes())
+        mstream.truncate(start + offset)
+    os.replace(tmpfile, fname)
+
+def is_compiled(fname):
+    try:
+        with open(fname, "rb") as mstream:
+            return mstream.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def read(fname):
+    with open(fname, "rb") as mstream:
+        if mstream.read(len(MAGIC)) != MAGIC:
+            raise tools.DataConsistencyError("{} is not a compiled model".format(fname))
+        hlen = int.from_bytes(mstream.read(8), "little")
+        header = json.loads(mstream.read(hlen).decode())
+    start = (len(MAGIC) + 8 + hlen + ALIGN-1) // ALIGN * ALIGN
+    arrays = {}
+    for name,desc in header["arrays"].items():
+        shape = tuple(desc["shape"])
+        if numpy.prod(shape) == 0:
+            arrays[name] = numpy.zeros(shape, dtype=desc["dtype"])
+        else:
+            arrays[name] = numpy.memmap(fname, dtype=desc["dtype"], mode="r",
+                                        offset=start+desc["offset"], shape=shape)
+    return Model(arrays, header["meta"])
+
+# compiled model, rebuilt (and rewritten) if the source files changed since it
+# was compiled. With other score options than the compiled ones, the model is
+# built from the sources in memory and the file is left as it is.
+# returns None if the model is outdated and can't be rebuilt
+def load(fname, config, cache_dir=None):
+    mdl = read(fname)
+    options = mdl.config_key() != config.ModelKey()
+    outdated = options or mdl.version() != MODEL_VERSION
+    if not outdated and not sources_changed(mdl.sources()):
+        return mdl
+
+    root = mdl.sources()[0]["path"] if len(mdl.sources()) > 0 else None
+    if root == None or not os.path.exists(root):
+        if outdated:
+            log.error("Compiled model %s was created with different score options (-D/-I/-i/-G/-P) or by an older version and its source is not available", fname)
+            return None
+        log.warning("WARNING: sources of the compiled model %s changed or are missing, using it as is", fname)
+        return mdl
+    if options:
+        log.info("Compiled model %s has other score options, building the model from %s", fname, root)
+        return build_yml(root, config, cache_dir)
+    log.info("Rebuilding outdated compiled model %s from %s", fname, root)
+    mdl = build_yml(root, config, cache_dir)
+    if mdl == None:
+        return None
+    write(mdl, fname)
+    return read(fname)
@@ -19,9 +19,11 @@
 import os
 import pathlib
 import yaml
+import numpy
 
 from constants import DEFAULT_PROBABILITY,DEFAULT_IMPACT
 import tools
+from tools import log
 import layers
 import groups as gr
 
@@ -44,7 +46,9 @@ class Node:
                 setattr(self, key, NODE_DEFAULTS[key])
             else:
                 setattr(self, key, data[key])
-        print("NODE:",self.name,"Probability:",self.probability)
+        log.debug("NODE: %s Probability: %s", self.name, self.probability)
+        # probability before the group and default adjustments (-1.0: none)
+        self.ymlprobability = self.probability
 
         self.setlref( layers.find( self.nlayer() ) )
         self.activegroup = None
@@ -64,11 +68,11 @@ class Node:
         for gg in self.groups:
             gobj = groups.find(gg)
             if gobj and gprio>gobj.gpriority():
-                print("GROUP: member of:",gobj.gname(), "; Priority:",gobj.gpriority())
+                log.debug("GROUP: member of: %s ; Priority: %s", gobj.gname(), gobj.gpriority())
                 self.activegroup = gobj
                 gprio = gobj.gpriority()
         if self.activegroup != None:
-            print("INFO: GROUP setting active group {}".format(self.activegroup.gname()) )
+            log.debug("INFO: GROUP setting active group %s", self.activegroup.gname())
             if gprob_override == True:
                 self.probability = self.activegroup.gprobability()
 
@@ -79,8 +83,8 @@ class Node:
             return
 
         if config.GProbOverride() and self.activegroup != None:
+            # (group-impact is not yet implemented, see adjustimpact)
             self.probability = self.activegroup.gprobability()
-            self.impact = self.activegroup.gimpact()
             return
 
         if self.probability == -1.0:
@@ -90,10 +94,8 @@ class Node:
                 self.probability = config.DefaultProb()
             return
         if self.impact == -1.0:
-            if self.activegroup != None:
-                self.impact = self.activegroup.gimpact()
-            else:
-                self.impact = config.DefaultImpact()
+            # (group-impact is not yet implemented, see adjustimpact)
+            self.impact = config.DefaultImpact()
             return
 
     def adjustimpact(self, config):
@@ -112,6 +114,8 @@ class Node:
         return self.activegroup
     def nprobability(self):
         return self.probability
+    def nymlprobability(self):
+        return self.ymlprobability
     def nimpact(self):
         return self.impact
     def nlayer(self):
@@ -122,9 +126,9 @@ class Node:
         return [ l["d"] for l in self.links ]
     def fixlinkdest(self, link_map):
         for l in self.links:
-            print(self.nname()," --> ", l["d"])
+            log.debug("%s  -->  %s", self.nname(), l["d"])
             if l["d"] in link_map:
-                print(self.nname(),": Remapping link: ",l["d"],"to",link_map[ l["d"] ])
+                log.debug("%s : Remapping link: %s to %s", self.nname(), l["d"], link_map[ l["d"] ])
                 l["d"] = link_map[ l["d"] ]
 
 
@@ -140,43 +144,38 @@ class NodeList:
     def add_node(self, node):
         self.nodes.append( node )
 
-    def check_consistency(self, layers):
-        # collect node list for easier existence check
-        nlist = [ n.nname() for n in self.nodes ]
+    # validate all nodes and raise one DataConsistencyError listing all problems
+    def check_consistency(self, layers, symbols):
+        errors = []
+        names = [ n.nname() for n in self.nodes ]
 
-        passed=True
-        for n in self.nodes:
+        # make sure probabilities are within range
+        prob = numpy.array([ n.nprobability() for n in self.nodes ], dtype=float)
+        for idx in numpy.flatnonzero( (prob < 0.0) | (prob > 1.0) ):
+            errors.append( (names[idx], "Probability out of range. {} not in [0.0 : 1.0]".format(prob[idx])) )
 
-            # make sure probabilities are within range
-            if n.nprobability() < 0.0 or n.nprobability() > 1.0:
-                msg="Probability out of range. {} not in [0.0 : 1.0]".format(n.nprobability())
-                passed=False
+        # impact range 1.0..4.0 and 0.0 for iso layer nodes
+        impt = numpy.array([ n.nimpact() for n in self.nodes ], dtype=float)
+        for idx in numpy.flatnonzero( ((impt < 1.0) & (impt != 0.0)) | (impt > 4.0) ):
+            errors.append( (names[idx], "Impact Score out of range. {} not in [1.0 : 4.0]".format(impt[idx])) )
 
-            # impact range 1.0..4.0 and 0.0 for iso layer nodes
-            if (n.nimpact() < 1.0 and n.nimpact != 0.0) or n.nimpact() > 4.0:
-                msg="Impact Score out of range. {} not in [1.0 : 4.0]".format(n.impact())
-                passed=False
-
-            # check for any link destinations that point to non-existing nodes
+        # check for any link destinations that point to non-existing nodes
+        for n in self.nodes:
             for l in n.nlinks():
-                if l["d"] not in nlist:
-                    msg = "unknown link destination "+l["d"]
-                    passed = False
-                    break
+                if l["d"] not in symbols:
+                    errors.append( (n.nname(), "unknown link destination "+l["d"]) )
                 if "p" in l and (l["p"] < 0.0 or l["p"] > 1.0):
-                    msg = "link probability for {} out of range. {} not in [0.0 : 1.0]".format(l["d"], l["p"])
-                    passed = False
-                    break
+                    errors.append( (n.nname(), "link probability for {} out of range. {} not in [0.0 : 1.0]".format(l["d"], l["p"])) )
 
-            # make sure the node references a layer that exists
-            if layers != None:
+        # make sure the node references a layer that exists
+        if layers != None:
+            for n in self.nodes:
                 if not layers.find(n.nlayer()):
-                    msg="No layer definition found for {}".format(n.nlayer())
-                    passed = False
-
-            if not passed:
-                raise tools.DataConsistencyError("INCONSISTENCY: NODE:{}: {}".format(n.nname(), msg))
+                    errors.append( (n.nname(), "No layer definition found for {}".format(n.nlayer())) )
 
+        if len(errors) > 0:
+            msgs = [ "INCONSISTENCY: NODE:{}: {}".format(name, msg) for name,msg in errors ]
+            raise tools.DataConsistencyError("{} inconsistencies found:\n{}".format(len(msgs), "\n".join(msgs)))
 
     def get(self):
         return self.nodes
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+import sys
+import numpy
+from fractions import Fraction
+
+
+# length histograms are plain dicts {length: count}.  Insertion order is the
+# order in which a length was first seen, which is what statistics.multimode()
+# uses to order its result
+def hist_add(hist, length, count=1):
+    hist[length] = hist.get(length, 0) + count
+
+def hist_count(hist):
+    return sum(hist.values())
+
+# same as statistics.mean() of the integer lengths: an int if the mean is
+# integral, else the correctly rounded float
+def hist_mean(hist):
+    n = hist_count(hist)
+    s1 = sum(l*c for l,c in hist.items())
+    if s1 % n == 0:
+        return s1 // n
+    return s1 / n
+
+# correctly rounded sqrt(num/den) (as statistics.stdev: the integer square
+# root of the fraction scaled to enough bits, rounded to odd, then divided
+# by a power of 2)
+SQRT_BITS = 2 * sys.float_info.mant_dig + 3
+
+def isqrt_frac_rto(num, den):
+    a = math.isqrt(num // den)
+    return a | (a*a*den != num)
+
+def sqrt_frac(num, den):
+    q = (num.bit_length() - den.bit_length() - SQRT_BITS) // 2
+    if q >= 0:
+        return (isqrt_frac_rto(num, den << 2*q) << q) / 1
+    return isqrt_frac_rto(num << -2*q, den) / (1 << -q)
+
+# sample standard deviation (same as statistics.stdev) computed from the exact
+# integer moments of the histogram
+def hist_stdev(hist):
+    n = hist_count(hist)
+    s1 = sum(l*c for l,c in hist.items())
+    s2 = sum(l*l*c for l,c in hist.items())
+    var = Fraction(n*s2 - s1*s1, n*(n-1))
+    return sqrt_frac(var.numerator, var.denominator)
+
+# same semantics as statistics.median(): middle element for odd counts,
+# average of the two middle elements otherwise
+def hist_median(hist):
+    n = hist_count(hist)
+    lo = (n-1)//2
+    hi = n//2
+    lo_val = None
+    seen = 0
+    for l in sorted(hist):
+        seen = seen + hist[l]
+        if lo_val == None and seen > lo:
+            lo_val = l
+        if seen > hi:
+            if lo == hi:
+                return l
+            return (lo_val + l) / 2
+    return None
+
+def hist_multimode(hist):
+    if len(hist) == 0:
+        return []
+    peak = max(hist.values())
+    return [ l for l,c in hist.items() if c == peak ]
+
+# dense list of counts for every length in [minlen..maxlen]
+def hist_bins(hist):
+    minlen = min(hist)
+    maxlen = max(hist)
+    return [ (l, hist.get(l, 0)) for l in range(minlen, maxlen+1) ]
+
+
+# find the k highest distinct values in counts and the list of vertices for each
+# returns ([val1, val2, ...], [[vertices with val1], [vertices with val2], ...])
+def mode_tiers(counts, k=3):
+    counts = numpy.asarray(counts)
+    vals = numpy.unique(counts)[::-1][0:k]
+    tiers = [ numpy.flatnonzero(counts == v).tolist() for v in vals ]
+    return vals.tolist(), tiers
+
+
+def has_loop(path):
+    return len(path) != len(set(path))
+
+
+# exact floating point sum (Shewchuk's non-overlapping partials, see math.fsum)
+# the result does not depend on the order of the added values, so partial sums
+# computed by different workers can be merged without changing a single bit
+class ExactSum:
+    def __init__(self):
+        self.partials = []
+
+    def add(self, x):
+        i = 0
+        for y in self.partials:
+            if abs(x) < abs(y):
+                x,y = y,x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                self.partials[i] = lo
+                i = i + 1
+            x = hi
+        self.partials[i:] = [x]
+
+    def merge(self, other):
+        for p in other.partials:
+            self.add(p)
+
+    def value(self):
+        return math.fsum(self.partials)
+
+
+# min/max/sum of a per-path value
+class MinMaxSum:
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.sum = ExactSum()
+
+    def add(self, val):
+        if self.min == None or val < self.min:
+            self.min = val
+        if self.max == None or val > self.max:
+            self.max = val
+        self.sum.add(val)
+
+    def merge(self, other):
+        if other.min == None:
+            return
+        if self.min == None or other.min < self.min:
+            self.min = other.min
+        if self.max == None or other.max > self.max:
+            self.max = other.max
+        self.sum.merge(other.sum)
+
+
+# collects the statistics of path_stats in a single pass over the enumerated
+# paths. Memory is O(V + max path length) plus the bounded lists of paths kept
+# for printing (at most maxpaths each).
+# Aggregators of consecutive parts of the enumeration can be merged; the result
+# is identical to a single aggregator that saw all paths in the same order.
+class PathAggregator:
+    def __init__(self, nvertices, maxpaths, nodemode=[], maxnodepaths=20, track_edges=False):
+        self.maxpaths = maxpaths
+        self.maxnodepaths = maxnodepaths
+
+        # all enumerated paths (incl. dropped ones) for the shift detection
+        self.raw_hist = {}
+        self.first_raw = None
+
+        # paths that survived the cut-off
+        self.hist = {}
+        self.vcount = numpy.zeros(nvertices, dtype=numpy.int64)
+
+        self.minlen = None
+        self.maxlen = None
+        self.spa = []
+        self.nspa = 0
+        self.lpa = []
+        self.nlpa = 0
+        self.fpa = []
+
+        # P_total is accumulated in the log domain to avoid underflow
+        self.nprob = 0
+        self.log_inter = ExactSum()
+        self.certain = False
+        self.prob = ExactSum()
+        self.impt = MinMaxSum()
+        self.vrisk = MinMaxSum()
+        self.prisk = MinMaxSum()
+
+        # per-node stats for -M: (length histogram, first few paths)
+        self.nodemode = { n:({}, []) for n in nodemode }
+
+        # edges used by any of the paths (blast radius)
+        self.edges = None
+        if track_edges:
+            self.edges = set()
+
+    def add_raw(self, path):
+        if self.first_raw == None:
+            self.first_raw = list(path)
+        hist_add(self.raw_hist, len(path))
+
+    def add(self, path, pprob, pimpt, risk):
+        plen = len(path)
+        hist_add(self.hist, plen)
+
+        # paths are simple, so no vertex repeats within path[1:-1]
+        self.vcount[ numpy.asarray(path[1:-1], dtype=numpy.int64) ] += 1
+
+        if self.minlen == None or plen < self.minlen:
+            self.minlen = plen
+            self.spa = []
+            self.nspa = 0
+        if plen == self.minlen:
+            self.nspa = self.nspa + 1
+            if len(self.spa) < self.maxpaths:
+                self.spa.append(list(path))
+
+        if self.maxlen == None or plen > self.maxlen:
+            self.maxlen = plen
+            self.lpa = []
+            self.nlpa = 0
+        if plen == self.maxlen:
+            self.nlpa = self.nlpa + 1
+            if len(self.lpa) < self.maxpaths:
+                self.lpa.append(list(path))
+
+        if len(self.fpa) < self.maxpaths:
+            self.fpa.append(list(path))
+
+        self.nprob = self.nprob + 1
+        if pprob >= 1.0:
+            self.certain = True
+        else:
+            self.log_inter.add( math.log1p(-pprob) )
+        self.prob.add(pprob)
+        self.impt.add(pimpt)
+        self.vrisk.add(risk)
+        self.prisk.add(pprob * pimpt)
+
+        for node,(nhist,npaths) in self.nodemode.items():
+            if node in path:
+                hist_add(nhist, plen)
+                if len(npaths) < self.maxnodepaths:
+                    npaths.append(list(path))
+
+        if self.edges != None:
+            for i in range(1, plen):
+                self.edges.add( (int(path[i-1]), int(path[i])) )
+
+    # append the results of an aggregator that saw the paths following ours
+    def merge(self, other):
+        for l,cnt in other.raw_hist.items():
+            hist_add(self.raw_hist, l, cnt)
+        if self.first_raw == None:
+            self.first_raw = other.first_raw
+        for l,cnt in other.hist.items():
+            hist_add(self.hist, l, cnt)
+        self.vcount += other.vcount
+
+        if other.minlen != None:
+            if self.minlen == None or other.minlen < self.minlen:
+                (self.minlen, self.nspa, self.spa) = (other.minlen, 0, [])
+            if other.minlen == self.minlen:
+                self.nspa = self.nspa + other.nspa
+                self.spa = (self.spa + other.spa)[0:self.maxpaths]
+            if self.maxlen == None or other.maxlen > self.maxlen:
+                (self.maxlen, self.nlpa, self.lpa) = (other.maxlen, 0, [])
+            if other.maxlen == self.maxlen:
+                self.nlpa = self.nlpa + other.nlpa
+                self.lpa = (self.lpa + other.lpa)[0:self.maxpaths]
+        self.fpa = (self.fpa + other.fpa)[0:self.maxpaths]
+
+        self.nprob = self.nprob + other.nprob
+        self.certain = self.certain or other.certain
+        self.log_inter.merge(other.log_inter)
+        self.prob.merge(other.prob)
+        self.impt.merge(other.impt)
+        self.vrisk.merge(other.vrisk)
+        self.prisk.merge(other.prisk)
+
+        for node,(nhist,npaths) in other.nodemode.items():
+            (mhist, mpaths) = self.nodemode[node]
+            for l,cnt in nhist.items():
+                hist_add(mhist, l, cnt)
+            mpaths.extend( npaths[0:self.maxnodepaths-len(mpaths)] )
+
+        if self.edges != None:
+            self.edges.update(other.edges)
+
+    def count(self):
+        return hist_count(self.hist)
+    def raw_count(self):
+        return hist_count(self.raw_hist)
+    def raw_histogram(self):
+        return self.raw_hist
+    def first_path(self):
+        return self.first_raw
+    def histogram(self):
+        return self.hist
+
+    def shortest(self):
+        return (self.minlen, self.nspa, self.spa)
+    def longest(self):
+        return (self.maxlen, self.nlpa, self.lpa)
+    def first(self):
+        return self.fpa
+
+    def mean(self):
+        return hist_mean(self.hist)
+    def stdev(self):
+        return hist_stdev(self.hist)
+    def median(self):
+        return hist_median(self.hist)
+    def multimode(self):
+        return hist_multimode(self.hist)
+
+    def p_total(self):
+        if self.certain:
+            return 1.0
+        return 1.0 - math.exp(self.log_inter.value())
+    def avg_prob(self):
+        return self.prob.value() / self.nprob
+
+    def minmaxavg(self, mms):
+        return (mms.min, mms.max, mms.sum.value() / self.nprob)
+    def impact(self):
+        return self.minmaxavg(self.impt)
+    def vrisk_stats(self):
+        return self.minmaxavg(self.vrisk)
+    def prisk_stats(self):
+        return self.minmaxavg(self.prisk)
+    def risk(self):
+        return self.prisk.sum.value()
+
+    def vertex_counts(self):
+        return self.vcount
+    def modes(self, k=3):
+        return mode_tiers(self.vcount, k)
+
+    def node_stats(self, node):
+        return self.nodemode[node]
+
+    def path_edges(self):
+        return self.edges
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Path enumeration split into independent work units for a process pool.
+#
+# A work unit is a path prefix [attacker, v1, ..., vk]. It covers all paths
+# to the target that start with that prefix. Units are created in the DFS order
+# of all_paths, so merging the per-unit aggregates in unit order gives the same
+# result as one serial all_paths run per attacker.
+# The workers are forked from the main process and see the graph and the
+# probability calculator read-only; only the aggregates travel back (the
+# streaming engine) or the paths of the units (the path enumeration engine,
+# see enumerate_target).
+
+from graph_tool.all import *
+import logging
+import multiprocessing
+import numpy
+
+import path_agg as pa
+import path_store as ps
+from tools import log, tqdm
+
+# try to create at least this many units per worker for load balancing
+UNITS_PER_WORKER=8
+MAX_PREFIX_DEPTH=3
+# paths collected before scoring them with one path_scores call
+SCORE_BATCH=4096
+
+# analysis context shared with the forked workers
+_ctx = None
+# graph, target, cutoff and number of vertices of enumerate_target for the workers
+_enum = None
+
+
+class StreamContext:
+    def __init__(self, g, pcalc, shift, cut_off, cutoff, maxpaths, nodemode, maxnodepaths, track_edges):
+        self.g = g
+        self.pcalc = pcalc
+        self.shift = shift
+        self.cut_off = cut_off
+        self.cutoff = cutoff
+        self.nvertices = g.num_vertices()
+        self.maxpaths = maxpaths
+        self.nodemode = nodemode
+        self.maxnodepaths = maxnodepaths
+        self.track_edges = track_edges
+
+
+# all paths to target that start with prefix (in all_paths order)
+def unit_paths(g, prefix, target, cutoff):
+    last = prefix[-1]
+    if last == target:
+        yield numpy.array(prefix)
+        return
+    if len(prefix) == 1:
+        yield from all_paths(g, last, target, cutoff=cutoff, edges=False)
+        return
+    vfilt = g.new_vertex_property("bool", val=True)
+    for v in prefix[0:-1]:
+        vfilt[v] = False
+    view = GraphView(g, vfilt=vfilt)
+    head = numpy.array(prefix[0:-1])
+    for path in all_paths(view, last, target, cutoff=cutoff-(len(prefix)-1), edges=False):
+        yield numpy.concatenate( (head, path) )
+
+# split the paths from attackers to target into prefixes in DFS order
+def make_units(g, attackers, target, cutoff, nunits):
+    units = [ [int(a)] for a in attackers ]
+    depth = 0
+    while len(units) < nunits and depth < MAX_PREFIX_DEPTH:
+        expanded = []
+        for prefix in units:
+            last = prefix[-1]
+            if last == int(target) or len(prefix)-1 >= cutoff:
+                expanded.append(prefix)
+                continue
+            for v in g.get_out_neighbors(last):
+                if int(v) not in prefix:
+                    expanded.append( prefix + [int(v)] )
+        units = expanded
+        depth = depth + 1
+    return units
+
+# enumerate and score all paths of one unit
+# paths are scored in batches of SCORE_BATCH with prob_calculator.path_scores
+# returns (aggregator, number of dropped paths)
+def stream_unit(ctx, target, prefix, progress=False):
+    agg = pa.PathAggregator(ctx.nvertices, ctx.maxpaths, ctx.nodemode, ctx.maxnodepaths, ctx.track_edges)
+    dropped_paths = 0
+    paths = unit_paths(ctx.g, prefix, target, ctx.cutoff)
+    if progress:
+        paths = tqdm(paths, desc="PathStream", disable=not log.isEnabledFor(logging.INFO))
+    batch = ps.PathStore(ctx.nvertices)
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= SCORE_BATCH:
+            dropped_paths = dropped_paths + score_batch(ctx, agg, batch)
+            batch = ps.PathStore(ctx.nvertices)
+    dropped_paths = dropped_paths + score_batch(ctx, agg, batch)
+    return agg, dropped_paths
+
+# add a batch of paths to the aggregator, returns the number of dropped paths
+def score_batch(ctx, agg, batch):
+    dropped_paths = 0
+    if len(batch) == 0:
+        return 0
+    loops = batch.loops()
+    (pprob, pimpt, risk) = ctx.pcalc.path_scores(batch, ctx.shift)
+    for i,path in enumerate(batch):
+        agg.add_raw(path)
+        if loops[i]:
+            log.warning("THIS PATH HAS A LOOP: %s", path)
+            continue
+        if pprob[i] >= ctx.cut_off:
+            agg.add(path, float(pprob[i]), float(pimpt[i]), float(risk[i]))
+        else:
+            dropped_paths = dropped_paths + 1
+    return dropped_paths
+
+def run_unit(unit):
+    (target, prefix) = unit
+    return stream_unit(_ctx, target, prefix)
+
+# aggregate all attacker->target paths, with workers > 1 in a process pool
+def stream_target(ctx, attackers, target, workers=1):
+    global _ctx
+    total = pa.PathAggregator(ctx.nvertices, ctx.maxpaths, ctx.nodemode, ctx.maxnodepaths, ctx.track_edges)
+    dropped_paths = 0
+    if workers <= 1:
+        for a in attackers:
+            (agg, dropped) = stream_unit(ctx, target, [int(a)], progress=True)
+            total.merge(agg)
+            dropped_paths = dropped_paths + dropped
+        return total, dropped_paths
+
+    units = make_units(ctx.g, attackers, target, ctx.cutoff, workers*UNITS_PER_WORKER)
+    log.info("Enumerating paths in %s work units on %s workers...", len(units), workers)
+    _ctx = ctx
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        # imap returns the results in unit order
+        for (agg, dropped) in tqdm(pool.imap(run_unit, [ (int(target), u) for u in units ]), desc="PathUnits", total=len(units), disable=not log.isEnabledFor(logging.INFO)):
+            total.merge(agg)
+            dropped_paths = dropped_paths + dropped
+    _ctx = None
+    return total, dropped_paths
+
+# all paths of one unit as PathStore
+def enumerate_unit(prefix):
+    (g, target, cutoff, nvertices) = _enum
+    part = ps.PathStore(nvertices)
+    part.extend( unit_paths(g, prefix, target, cutoff) )
+    return part
+
+# append all attacker->target paths to store (PathStore or PathTrie), the work
+# units are enumerated by a pool of workers and appended in unit order, so the
+# paths come in the same order as from a serial all_paths run per attacker
+def enumerate_target(g, attackers, target, cutoff, store, workers):
+    global _enum
+    units = make_units(g, attackers, target, cutoff, workers*UNITS_PER_WORKER)
+    log.info("Enumerating paths in %s work units on %s workers...", len(units), workers)
+    _enum = (g, int(target), cutoff, store.nvertices)
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        for part in tqdm(pool.imap(enumerate_unit, units), desc="PathUnits", total=len(units), disable=not log.isEnabledFor(logging.INFO)):
+            store.extend(part)
+    _enum = None
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Path enumeration that applies the -C cut-off during the search
+# (--engine pruned).
+#
+# The probability of a path prefix (product of the vertex probability factors
+# of path_risk) can only decrease when the prefix is extended, so once it is
+# below the cut-off no path through that prefix is kept. The depth-first search
+# follows all_paths (same order of the successors, same length cutoff, same
+# paths) but doesn't extend such prefixes. Every extension that is cut this
+# way counts as one pruned subtree. Successors that can't reach the target at
+# all are skipped as well; they don't lead to any path.
+
+import numpy
+
+
+class PrunedPaths:
+    # vprob: per vertex probability factor, const_prob: constant factor of
+    # the ignore_score mode (or None), see prob_calculator.vertex_arrays
+    def __init__(self, g, target, cutoff, vprob, const_prob, cut_off):
+        self.target = int(target)
+        self.cutoff = cutoff
+        self.cut_off = cut_off
+        self.vprob = numpy.asarray(vprob, dtype=float).tolist()
+        self.powers = None
+        if const_prob != None:
+            # same powers as prob_calculator.path_scores
+            self.powers = [ const_prob ** k for k in range(cutoff+2) ]
+
+        nv = g.num_vertices()
+        succs = [ [] for _ in range(nv) ]
+        preds = [ [] for _ in range(nv) ]
+        for s,t in g.get_edges()[:,0:2]:
+            succs[s].append(int(t))
+            preds[t].append(int(s))
+        canreach = numpy.zeros(nv, dtype=bool)
+        canreach[self.target] = True
+        todo = [self.target]
+        while len(todo) > 0:
+            v = todo.pop()
+            for s in preds[v]:
+                if not canreach[s]:
+                    canreach[s] = True
+                    todo.append(s)
+        self.succs = [ [ t for t in succs[v] if canreach[t] ] for v in range(nv) ]
+        self.visited = [False] * nv
+
+    # appends the paths from attacker a with a probability of at least the
+    # cut-off to store, returns the number of pruned subtrees
+    def enumerate(self, a, store):
+        a = int(a)
+        pruned = 0
+        visited = self.visited
+        visited[a] = True
+        path = [a]
+        probs = [1.0]
+        stack = [ iter(self.succs[a]) ]
+        while len(stack) > 0:
+            v = next(stack[-1], None) if len(stack) <= self.cutoff else None
+            if v == None:
+                visited[path.pop()] = False
+                probs.pop()
+                stack.pop()
+                continue
+            if v != self.target and visited[v]:
+                continue
+            if self.powers != None:
+                prob = self.powers[len(path)]
+            else:
+                prob = probs[-1] * self.vprob[v]
+            if prob < self.cut_off:
+                pruned = pruned + 1
+                continue
+            if v == self.target:
+                store.append(path + [v])
+            else:
+                visited[v] = True
+                path.append(v)
+                probs.append(prob)
+                stack.append( iter(self.succs[v]) )
+        return pruned
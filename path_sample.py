@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Monte Carlo estimation of the path statistics for graphs where the paths
+# can't be enumerated.
+#
+# Paths are sampled as self-avoiding random walks from a random attacker
+# (Knuth/Rosenbluth): at every step the walk picks one of the k unvisited
+# successors uniformly and multiplies its weight by k. A walk that reaches the
+# target has weight 1/P(path), dead ends have weight 0. So for any per-path
+# value f:   E[ weight * f(path) ] = sum of f over all attacker->target paths
+# Totals are estimated by the sample mean of weight*f, averages by the ratio
+# of two such totals. Confidence intervals use the normal approximation (and
+# the delta method for ratios). Stdev, median and mode are no sums; their
+# intervals come from batch means: the samples are split into consecutive
+# batches and the spread of the per-batch values gives the interval.
+
+import math
+import numpy
+
+import path_agg as pa
+
+SAMPLE_BATCH=1000
+SAMPLE_Z=1.96  # 95% confidence intervals
+# batches of consecutive samples for the batch means confidence intervals of
+# stdev, median and mode
+SAMPLE_CI_BATCHES=20
+
+
+class PathSampler:
+    def __init__(self, g, attackers, target, cutoff, rng):
+        self.rng = rng
+        self.attackers = [ int(a) for a in attackers ]
+        self.target = int(target)
+        self.maxlen = cutoff+1
+
+        nv = g.num_vertices()
+        succs = [ [] for _ in range(nv) ]
+        preds = [ [] for _ in range(nv) ]
+        for s,t in g.get_edges()[:,0:2]:
+            succs[s].append(int(t))
+            preds[t].append(int(s))
+
+        # only step to vertices that can still reach the target at all
+        # (a cheap way of avoiding many of the zero-weight dead ends)
+        canreach = numpy.zeros(nv, dtype=bool)
+        canreach[self.target] = True
+        todo = [self.target]
+        while len(todo) > 0:
+            v = todo.pop()
+            for s in preds[v]:
+                if not canreach[s]:
+                    canreach[s] = True
+                    todo.append(s)
+        self.succs = [ [ t for t in succs[v] if canreach[t] ] for v in range(nv) ]
+
+    # returns (path, weight)
+    def walk(self):
+        nattk = len(self.attackers)
+        v = self.attackers[ self.rng.integers(nattk) ]
+        weight = float(nattk)
+        path = [v]
+        visited = {v}
+        while v != self.target:
+            if len(path) >= self.maxlen:
+                return path, 0.0
+            choices = [ t for t in self.succs[v] if t not in visited ]
+            if len(choices) == 0:
+                return path, 0.0
+            weight = weight * len(choices)
+            v = choices[ self.rng.integers(len(choices)) ]
+            path.append(v)
+            visited.add(v)
+        return path, weight
+
+
+# weighted statistics of path lengths (for the batch means)
+def weighted_stdev(w, lens):
+    m = (w*lens).sum() / w.sum()
+    return math.sqrt( (w*(lens-m)**2).sum() / w.sum() )
+
+def weighted_median(w, lens):
+    order = numpy.argsort(lens, kind='stable')
+    seen = numpy.cumsum(w[order])
+    return lens[order][ numpy.searchsorted(seen, seen[-1]/2.0) ]
+
+def weighted_mode(w, lens):
+    (vals, inv) = numpy.unique(lens, return_inverse=True)
+    return vals[ numpy.argmax(numpy.bincount(inv, weights=w)) ]
+
+
+# weighted samples and the estimators derived from them
+class SampleStats:
+    def __init__(self, nvertices, maxpaths, nodemode=[]):
+        self.nvertices = nvertices
+        self.maxpaths = maxpaths
+        self.n = 0
+        self.cols = { k:[] for k in ["idx", "w", "len", "kept", "prob", "impt", "vrisk", "prisk", "logq"] }
+        self.vsum = numpy.zeros(nvertices)
+        self.vsum2 = numpy.zeros(nvertices)
+        self.lsum = {}
+        self.lsum2 = {}
+        self.minmax = { k:[None, None] for k in ["len", "impt", "vrisk", "prisk"] }
+        self.spa = []
+        self.lpa = []
+        # per-node weighted length histograms for -M
+        self.nodemode = { n:{} for n in nodemode }
+
+    # zero weight samples (dead ends) still count for the sample size
+    def add(self, path, weight, scores=None, kept=True):
+        self.n = self.n + 1
+        if weight == 0.0:
+            return
+        plen = len(path)
+        (pprob, pimpt, risk) = scores
+        for k,val in [("idx", self.n-1), ("w", weight), ("len", plen), ("kept", float(kept)),
+                      ("prob", pprob), ("impt", pimpt), ("vrisk", risk), ("prisk", pprob*pimpt),
+                      ("logq", -math.inf if pprob >= 1.0 else math.log1p(-pprob))]:
+            self.cols[k].append(val)
+        if not kept:
+            return
+        interior = list(set(path[1:-1]))
+        self.vsum[interior] = self.vsum[interior] + weight
+        self.vsum2[interior] = self.vsum2[interior] + weight*weight
+        pa.hist_add(self.lsum, plen, weight)
+        pa.hist_add(self.lsum2, plen, weight*weight)
+        for node,nhist in self.nodemode.items():
+            if node in path:
+                pa.hist_add(nhist, plen, weight)
+        for k,val in [("len", plen), ("impt", pimpt), ("vrisk", risk), ("prisk", pprob*pimpt)]:
+            mm = self.minmax[k]
+            if mm[0] == None or val < mm[0]:
+                mm[0] = val
+                if k == "len":
+                    self.spa = []
+            if mm[1] == None or val > mm[1]:
+                mm[1] = val
+                if k == "len":
+                    self.lpa = []
+        if plen == self.minmax["len"][0] and len(self.spa) < self.maxpaths and path not in self.spa:
+            self.spa.append(path)
+        if plen == self.minmax["len"][1] and len(self.lpa) < self.maxpaths and path not in self.lpa:
+            self.lpa.append(path)
+
+    def samples(self):
+        return self.n
+    def hits(self):
+        return len(self.cols["w"])
+
+    def col(self, k):
+        return numpy.asarray(self.cols[k], dtype=float)
+
+    # estimate of sum(f) over all paths: (value, ci); zero-weight samples contribute 0
+    def total(self, y):
+        mean = y.sum() / self.n
+        if self.n < 2:
+            return (mean, math.inf)
+        var = ( (y*y).sum() - self.n*mean*mean ) / (self.n-1)
+        return (mean, SAMPLE_Z*math.sqrt(max(var, 0.0)/self.n))
+
+    # estimate of sum(fy)/sum(fx) over all paths: (value, ci)
+    def ratio(self, y, x):
+        if x.sum() == 0.0:
+            return (math.nan, math.inf)
+        r = y.sum() / x.sum()
+        if self.n < 2:
+            return (r, math.inf)
+        d = y - r*x
+        var = (d*d).sum() / (self.n-1)
+        xm = x.sum() / self.n
+        return (r, SAMPLE_Z*math.sqrt(var/self.n) / xm)
+
+    def weights(self):
+        return self.col("w") * self.col("kept")
+
+    def count(self):
+        return self.total( self.weights() )
+    def dropped(self):
+        return self.total( self.col("w") * (1.0-self.col("kept")) )
+    def raw_count(self):
+        return self.total( self.col("w") )
+
+    def mean(self):
+        return self.ratio( self.weights()*self.col("len"), self.weights() )
+    def stdev(self):
+        w = self.weights()
+        (m,_) = self.mean()
+        var = (w*(self.col("len")-m)**2).sum() / w.sum()
+        return math.sqrt(var)
+
+    # estimated path length histogram {length: (value, ci)}
+    def histogram(self):
+        hist = {}
+        for l in sorted(self.lsum):
+            mean = self.lsum[l] / self.n
+            var = max(0.0, self.lsum2[l]/self.n - mean*mean) * self.n/max(1, self.n-1)
+            hist[l] = (mean, SAMPLE_Z*math.sqrt(var/self.n))
+        return hist
+    def raw_histogram(self):
+        hist = {}
+        for w,l in zip(self.cols["w"], self.cols["len"]):
+            pa.hist_add(hist, l, w/self.n)
+        return hist
+    def median(self):
+        hist = self.histogram()
+        half = sum( v for v,_ in hist.values() ) / 2.0
+        seen = 0.0
+        for l,(v,_) in hist.items():
+            seen = seen + v
+            if seen >= half:
+                return l
+        return None
+    def mode(self):
+        hist = self.histogram()
+        return max(hist, key=lambda l: hist[l][0])
+
+    # 95% confidence interval of stat(weights, lengths) by batch means
+    def batch_ci(self, stat):
+        w = self.weights()
+        lens = self.col("len")
+        batch = (self.col("idx").astype(numpy.int64) * SAMPLE_CI_BATCHES) // self.n
+        vals = []
+        for b in range(SAMPLE_CI_BATCHES):
+            sel = (batch == b) & (w > 0.0)
+            if numpy.any(sel):
+                vals.append( stat(w[sel], lens[sel]) )
+        if len(vals) < 2:
+            return math.inf
+        return SAMPLE_Z * float(numpy.std(vals, ddof=1)) / math.sqrt(len(vals))
+    def stdev_ci(self):
+        return self.batch_ci(weighted_stdev)
+    def median_ci(self):
+        return self.batch_ci(weighted_median)
+    def mode_ci(self):
+        return self.batch_ci(weighted_mode)
+
+    def shortest(self):
+        return (self.minmax["len"][0], self.spa)
+    def longest(self):
+        return (self.minmax["len"][1], self.lpa)
+
+    # P_total = 1 - exp( sum(log(1-p)) )
+    def p_total(self):
+        w = self.weights()
+        logq = self.col("logq")
+        if numpy.any( (w > 0.0) & numpy.isinf(logq) ):
+            return (1.0, 0.0)
+        (lsum, ci) = self.total( w*logq )
+        val = 1.0 - math.exp(lsum)
+        # delta method: d(1-exp(x))/dx = -exp(x)
+        return (val, math.exp(lsum)*ci)
+    def avg_prob(self):
+        return self.ratio( self.weights()*self.col("prob"), self.weights() )
+
+    def minmaxavg(self, k):
+        (avg, ci) = self.ratio( self.weights()*self.col(k), self.weights() )
+        return (self.minmax[k][0], self.minmax[k][1], avg, ci)
+    def impact(self):
+        return self.minmaxavg("impt")
+    def vrisk_stats(self):
+        return self.minmaxavg("vrisk")
+    def prisk_stats(self):
+        return self.minmaxavg("prisk")
+    def risk(self):
+        return self.total( self.weights()*self.col("prisk") )
+
+    # mode tiers of the estimated paths-through counts: (vals, cis, tiers)
+    def modes(self, k=3):
+        (vals, tiers) = pa.mode_tiers(list(self.vsum / self.n), k)
+        cis = []
+        for val,tier in zip(vals, tiers):
+            v = tier[0]
+            var = max(0.0, self.vsum2[v]/self.n - val*val) * self.n/max(1, self.n-1)
+            cis.append( SAMPLE_Z*math.sqrt(var/self.n) )
+        return (vals, cis, tiers)
+
+    # (estimated number of paths via node, estimated median length)
+    def node_stats(self, node):
+        nhist = self.nodemode[node]
+        total = sum(nhist.values())
+        seen = 0.0
+        for l in sorted(nhist):
+            seen = seen + nhist[l]
+            if seen >= total/2.0:
+                return (total/self.n, l)
+        return (0.0, None)
+
+    def rel_error(self):
+        (val, ci) = self.count()
+        if val == 0.0:
+            return math.inf
+        return ci / val
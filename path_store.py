@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy
+
+
+# compact storage for a list of paths (CSR layout):
+#   vertex ids of all paths are appended into one flat buffer and
+#   offsets[i]..offsets[i+1] is the slice of path i.
+# Indexing a store returns a numpy view into the buffer (no copy).
+class PathStore:
+    def __init__(self, nvertices, capacity=1024):
+        if nvertices <= numpy.iinfo(numpy.int16).max:
+            self.dtype = numpy.int16
+        else:
+            self.dtype = numpy.int32
+        self.nvertices = nvertices
+        self.buf = numpy.empty(capacity, dtype=self.dtype)
+        self.offsets = numpy.zeros(max(2, capacity//8), dtype=numpy.int64)
+        self.npaths = 0
+        # inverted index (see build_index)
+        self.index_start = None
+        self.index_paths = None
+
+    def grow(self, nelem):
+        need = self.offsets[self.npaths] + nelem
+        if need > len(self.buf):
+            newbuf = numpy.empty(max(need, 2*len(self.buf)), dtype=self.dtype)
+            newbuf[0:len(self.buf)] = self.buf
+            self.buf = newbuf
+        if self.npaths+2 > len(self.offsets):
+            newoff = numpy.zeros(2*len(self.offsets), dtype=numpy.int64)
+            newoff[0:len(self.offsets)] = self.offsets
+            self.offsets = newoff
+
+    def append(self, path):
+        plen = len(path)
+        self.grow(plen)
+        start = self.offsets[self.npaths]
+        self.buf[start:start+plen] = path
+        self.offsets[self.npaths+1] = start + plen
+        self.npaths = self.npaths + 1
+        self.index_start = None
+        self.index_paths = None
+
+    def extend(self, paths):
+        for p in paths:
+            self.append(p)
+
+    def __len__(self):
+        return self.npaths
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take( range(*idx.indices(self.npaths)) )
+        if idx < 0:
+            idx = idx + self.npaths
+        if idx < 0 or idx >= self.npaths:
+            raise IndexError("path index out of range")
+        return self.buf[ self.offsets[idx]:self.offsets[idx+1] ]
+
+    def __iter__(self):
+        for i in range(self.npaths):
+            yield self.buf[ self.offsets[i]:self.offsets[i+1] ]
+
+    def get_offsets(self):
+        return self.offsets[0:self.npaths+1]
+
+    # flat array of all vertex ids of all paths
+    def vertices(self):
+        return self.buf[0:self.offsets[self.npaths]]
+
+    def lengths(self):
+        return numpy.diff(self.get_offsets())
+
+    # first vertex (attacker) of every path
+    def first_vertices(self):
+        return self.vertices()[ self.get_offsets()[:-1] ]
+
+    # path id for every entry of vertices()
+    def path_ids(self):
+        return numpy.repeat(numpy.arange(self.npaths), self.lengths())
+
+    # new store with the selected paths (list/array of path ids or bool mask)
+    def take(self, idx):
+        idx = numpy.asarray(idx)
+        if idx.dtype == bool:
+            idx = numpy.flatnonzero(idx)
+        store = PathStore(self.nvertices, capacity=1)
+        if len(idx) == 0:
+            return store
+        offs = self.get_offsets()
+        lens = offs[idx+1] - offs[idx]
+        store.offsets = numpy.zeros(len(idx)+1, dtype=numpy.int64)
+        numpy.cumsum(lens, out=store.offsets[1:])
+        # gather the selected slices with one index array
+        starts = numpy.repeat(offs[idx] - store.offsets[:-1], lens)
+        store.buf = self.buf[ starts + numpy.arange(store.offsets[-1]) ]
+        store.npaths = len(idx)
+        return store
+
+    # inverted index vertex -> ids of the paths containing it: the ids for
+    # vertex v are index_paths[ index_start[v]:index_start[v+1] ] (ascending)
+    def build_index(self):
+        verts = self.vertices()
+        counts = numpy.bincount(verts, minlength=self.nvertices)
+        self.index_start = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=self.index_start[1:])
+        self.index_paths = self.path_ids()[ numpy.argsort(verts, kind='stable') ]
+
+    def has_index(self):
+        return self.index_paths is not None
+
+    # ids of all paths that contain vertex v
+    def paths_with(self, v):
+        if self.index_paths is not None:
+            return self.index_paths[ self.index_start[v]:self.index_start[v+1] ]
+        pos = numpy.flatnonzero(self.vertices() == v)
+        return numpy.unique( numpy.searchsorted(self.get_offsets(), pos, side='right') - 1 )
+
+    # bool mask of the paths that visit a vertex more than once
+    def loops(self):
+        key = self.path_ids() * self.nvertices + self.vertices()
+        key.sort()
+        dups = key[1:][ key[1:] == key[:-1] ] // self.nvertices
+        mask = numpy.zeros(self.npaths, dtype=bool)
+        mask[dups] = True
+        return mask
+
+    def nbytes(self):
+        return self.buf.nbytes + self.offsets.nbytes
+
+
+# length histogram {length: count} of a store, ordered by first occurrence
+# (see path_agg.hist_multimode)
+def length_hist(lengths):
+    vals, first, counts = numpy.unique(lengths, return_index=True, return_counts=True)
+    order = numpy.argsort(first, kind='stable')
+    return { int(vals[i]):int(counts[i]) for i in order }
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Prefix trie of enumerated paths (--path_trie).
+#
+# all_paths enumerates depth-first, so consecutive paths share the prefix of
+# the current search stack. Every trie node is one vertex of a path prefix:
+#   parent[n]  parent node (-1 for the first vertex of a path, the attacker)
+#   vertex[n]  vertex id
+#   depth[n]   position in the path (0 for the attacker)
+# A parent is always created before its children. A path is the chain from
+# one of the leaves up to its root; leaves are kept in enumeration order.
+# A new path only adds the nodes after its longest common prefix with the
+# previous path, so shared prefixes are stored (and scored, see
+# prob_calculator.trie_scores) once.
+
+import copy
+import numpy
+
+import path_store as ps
+
+# number of paths materialized at once by loops()
+TRIE_BATCH=65536
+
+
+class PathTrie:
+    def __init__(self, nvertices, capacity=1024):
+        self.nvertices = nvertices
+        # vertex ids and depths (< path length cutoff) as small as in PathStore
+        if max(nvertices, 64) <= numpy.iinfo(numpy.int16).max:
+            self.dtype = numpy.int16
+        else:
+            self.dtype = numpy.int32
+        self.parent = numpy.empty(capacity, dtype=numpy.int32)
+        self.vertex = numpy.empty(capacity, dtype=self.dtype)
+        self.depth = numpy.empty(capacity, dtype=self.dtype)
+        self.nnodes = 0
+        self.leaves = numpy.empty(max(2, capacity//8), dtype=numpy.int64)
+        self.npaths = 0
+        # vertices and trie nodes of the last added path
+        self.last = numpy.empty(0, dtype=numpy.int64)
+        self.last_nodes = numpy.empty(0, dtype=numpy.int64)
+
+    def grow(self, nnew):
+        need = self.nnodes + nnew
+        if need > len(self.parent):
+            size = max(need, 2*len(self.parent))
+            for name in ("parent", "vertex", "depth"):
+                old = getattr(self, name)
+                dtype = old.dtype
+                if name == "parent" and size > numpy.iinfo(numpy.int32).max:
+                    dtype = numpy.int64
+                new = numpy.empty(size, dtype=dtype)
+                new[0:self.nnodes] = old[0:self.nnodes]
+                setattr(self, name, new)
+        if self.npaths+1 > len(self.leaves):
+            newleaves = numpy.empty(2*len(self.leaves), dtype=numpy.int64)
+            newleaves[0:self.npaths] = self.leaves[0:self.npaths]
+            self.leaves = newleaves
+
+    def append(self, path):
+        path = numpy.asarray(path, dtype=numpy.int64)
+        n = min(len(path), len(self.last))
+        diff = numpy.flatnonzero(path[0:n] != self.last[0:n])
+        common = int(diff[0]) if len(diff) > 0 else n
+        # a path can't end inside the previous one, keep one node for its leaf
+        common = min(common, len(path)-1)
+        nnew = len(path) - common
+        self.grow(nnew)
+        nodes = numpy.arange(self.nnodes, self.nnodes+nnew)
+        self.parent[nodes] = nodes - 1
+        self.parent[self.nnodes] = self.last_nodes[common-1] if common > 0 else -1
+        self.vertex[nodes] = path[common:]
+        self.depth[nodes] = numpy.arange(common, len(path))
+        self.nnodes = self.nnodes + nnew
+        self.last = path
+        self.last_nodes = numpy.concatenate( (self.last_nodes[0:common], nodes) )
+        self.leaves[self.npaths] = nodes[-1]
+        self.npaths = self.npaths + 1
+
+    def extend(self, paths):
+        for p in paths:
+            self.append(p)
+
+    def __len__(self):
+        return self.npaths
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take( range(*idx.indices(self.npaths)) )
+        if idx < 0:
+            idx = idx + self.npaths
+        if idx < 0 or idx >= self.npaths:
+            raise IndexError("path index out of range")
+        return self.take([idx])[0]
+
+    def __iter__(self):
+        for b in range(0, self.npaths, TRIE_BATCH):
+            yield from self.take( range(b, min(b+TRIE_BATCH, self.npaths)) )
+
+    def get_leaves(self):
+        return self.leaves[0:self.npaths]
+
+    def get_parents(self):
+        return self.parent[0:self.nnodes]
+
+    def get_vertices(self):
+        return self.vertex[0:self.nnodes]
+
+    def get_depths(self):
+        return self.depth[0:self.nnodes]
+
+    def lengths(self):
+        return self.depth[ self.get_leaves() ].astype(numpy.int64) + 1
+
+    # trie nodes grouped by depth: nodes of depth d are order[ptr[d]:ptr[d+1]]
+    def levels(self):
+        depths = self.get_depths()
+        order = numpy.argsort(depths, kind='stable')
+        ptr = numpy.zeros(int(depths.max())+2 if self.nnodes > 0 else 1, dtype=numpy.int64)
+        numpy.cumsum( numpy.bincount(depths), out=ptr[1:] )
+        return order, ptr
+
+    # PathStore with the selected paths (list/array of path ids or bool mask)
+    def take(self, idx):
+        idx = numpy.asarray(idx)
+        if idx.dtype == bool:
+            idx = numpy.flatnonzero(idx)
+        store = ps.PathStore(self.nvertices, capacity=1)
+        if len(idx) == 0:
+            return store
+        nodes = self.get_leaves()[idx]
+        lens = self.depth[nodes].astype(numpy.int64) + 1
+        store.offsets = numpy.zeros(len(idx)+1, dtype=numpy.int64)
+        numpy.cumsum(lens, out=store.offsets[1:])
+        store.buf = numpy.empty(store.offsets[-1], dtype=store.dtype)
+        # fill the paths from their last vertex backwards
+        pos = store.offsets[1:] - 1
+        active = numpy.arange(len(idx))
+        while len(active) > 0:
+            store.buf[ pos[active] ] = self.vertex[ nodes[active] ]
+            pos[active] = pos[active] - 1
+            nodes[active] = self.parent[ nodes[active] ]
+            active = active[ nodes[active] >= 0 ]
+        store.npaths = len(idx)
+        return store
+
+    # trie with the selected paths only (list/array of path ids or bool mask)
+    # the trie nodes are shared with this trie, the result is read-only
+    def select(self, idx):
+        idx = numpy.asarray(idx)
+        if idx.dtype == bool:
+            idx = numpy.flatnonzero(idx)
+        trie = copy.copy(self)
+        trie.leaves = self.get_leaves()[idx]
+        trie.npaths = len(idx)
+        return trie
+
+    # first vertex (attacker) of every path
+    def first_vertices(self):
+        parents = self.get_parents()
+        root = numpy.arange(self.nnodes)
+        (order, ptr) = self.levels()
+        for d in range(1, len(ptr)-1):
+            nodes = order[ ptr[d]:ptr[d+1] ]
+            root[nodes] = root[ parents[nodes] ]
+        return self.get_vertices()[ root[self.get_leaves()] ]
+
+    # number of paths through every vertex without the first and last vertex of
+    # the paths (see strong.find_modes), at least minlength entries
+    def interior_counts(self, minlength=0):
+        parents = self.get_parents()
+        ends = numpy.bincount(self.get_leaves(), minlength=self.nnodes)
+        # paths that pass or end at every trie node, summed up from the leaves
+        through = ends.copy()
+        (order, ptr) = self.levels()
+        for d in range(len(ptr)-2, 0, -1):
+            nodes = order[ ptr[d]:ptr[d+1] ]
+            numpy.add.at(through, parents[nodes], through[nodes])
+        inner = through - ends
+        inner[ self.get_depths() == 0 ] = 0
+        verts = self.get_vertices()
+        counts = numpy.zeros(max(minlength, int(verts.max())+1 if self.nnodes > 0 else 0), dtype=numpy.int64)
+        numpy.add.at(counts, verts, inner)
+        return counts
+
+    # ids of all paths that contain vertex v
+    def paths_with(self, v):
+        parents = self.get_parents()
+        has = self.get_vertices() == v
+        (order, ptr) = self.levels()
+        for d in range(1, len(ptr)-1):
+            nodes = order[ ptr[d]:ptr[d+1] ]
+            has[nodes] = has[nodes] | has[ parents[nodes] ]
+        return numpy.flatnonzero( has[self.get_leaves()] )
+
+    # all paths as PathStore
+    def store(self):
+        return self.take( numpy.arange(self.npaths) )
+
+    # bool mask of the paths that visit a vertex more than once
+    def loops(self):
+        mask = numpy.zeros(self.npaths, dtype=bool)
+        for b in range(0, self.npaths, TRIE_BATCH):
+            e = min(b+TRIE_BATCH, self.npaths)
+            mask[b:e] = self.take( numpy.arange(b, e) ).loops()
+        return mask
+
+    def nbytes(self):
+        return ( self.get_parents().nbytes + self.get_vertices().nbytes
+                 + self.get_depths().nbytes + self.get_leaves().nbytes )
+
+# the paths of a PathStore or PathTrie as PathStore
+def as_store(paths):
+    if isinstance(paths, PathTrie):
+        return paths.store()
+    return paths
@@ -23,7 +23,14 @@ import numpy
 import math
 
 from constants import DEFAULT_PROBABILITY, DEFAULT_IMPACT
+from tools import log
 
+# number of paths scored at once by path_scores (bounds the padded matrices)
+SCORE_BATCH=65536
+
+# find_shift stops once the log residual or the bracket is below this
+SHIFT_TOLERANCE=1e-12
+SHIFT_MAX_ITER=100
 
 class prob_calculator:
     def __init__(self, sg, args):
@@ -43,6 +50,17 @@ class prob_calculator:
         else:
             self.args_shift = args.structure_shift
             self.detected_shift = args.structure_shift
+        self.snapshot()
+
+    # take a copy of the per vertex scores and out-degrees as numpy arrays
+    # (call again after changing the vertex scores of the graph)
+    def snapshot(self):
+        self.vprob = numpy.array( self.sg.vertex_probability.get_array(), dtype=float )
+        self.vimpact = numpy.array( self.sg.vertex_impact.get_array(), dtype=float )
+        self.outdeg = self.sg.g.get_out_degrees( self.sg.g.get_vertices() )
+        self.vimpt = self.vimpact * numpy.sqrt(self.outdeg)
+        # python floats for the scalar path_risk
+        self.vimpt_list = self.vimpt.tolist()
 
     def path_prob(self, path, shift):
         prob = 1.0
@@ -66,17 +84,17 @@ class prob_calculator:
             nprob = max(0.0, min( (self.default_prob + shift), 1.0))
             prob = (nprob)**(len(path)-1)
             for i in path[1:]:
-                impt = impt + (self.sg.vertex_impact[i] * math.sqrt( self.sg.get_vertices()[i].out_degree()))
+                impt = impt + self.vimpt_list[i]
                 risk = risk + nprob * impt
                 if debug:
-                    print("PRisk[",i,"]=",impt," <-- ",self.sg.vertex_impact[i]," * ",self.sg.get_vertices()[i].out_degree())
+                    log.debug("PRisk[ %s ]= %s  <--  %s  *  %s", i, impt, self.sg.vertex_impact[i], self.outdeg[i])
         else:
             for i in path[1:]:
                 prob = prob * max(0.0, min( ( self.sg.vertex_probability[i] + shift ), 1.0 ))
-                impt = impt + (self.sg.vertex_impact[i] * math.sqrt( self.sg.get_vertices()[i].out_degree()))
+                impt = impt + self.vimpt_list[i]
                 risk = risk + prob * impt
                 if debug:
-                    print("PRisk[",i,"]=",impt," <-- ",self.sg.vertex_impact[i]," * ",self.sg.get_vertices()[i].out_degree())
+                    log.debug("PRisk[ %s ]= %s  <--  %s  *  %s", i, impt, self.sg.vertex_impact[i], self.outdeg[i])
 
         if prob < self.path_cutoff:
             prob = 0.0
@@ -85,6 +103,131 @@ class prob_calculator:
         return (prob, impt, risk)
 
 
+    # per vertex probability factor and impact contribution as used by path_risk
+    # returns (prob, impact, const_risk) where const_risk is the constant node
+    # probability that path_risk uses for VRisk in ignore_score mode (else None)
+    def vertex_arrays(self, shift):
+        impt = self.vimpt
+        if self.ignore_score and not self.with_errors:
+            nprob = max(0.0, min( (self.default_prob + shift), 1.0))
+            return numpy.full(len(impt), nprob), impt, nprob
+        prob = numpy.clip(self.vprob + shift, 0.0, 1.0)
+        return prob, impt, None
+
+    # path_risk for all paths of a PathStore at once
+    # returns numpy arrays (prob, impt, risk) with one entry per path.
+    # The products and sums run along the rows of a padded [path, step] matrix in
+    # the same order as the loop of path_risk, so the results are identical.
+    def path_scores(self, paths, shift):
+        (vprob, vimpt, const_risk) = self.vertex_arrays(shift)
+        offs = paths.get_offsets()
+        verts = paths.vertices()
+        prob = numpy.empty(len(paths))
+        impt = numpy.empty(len(paths))
+        risk = numpy.empty(len(paths))
+        for b in range(0, len(paths), SCORE_BATCH):
+            e = min(b+SCORE_BATCH, len(paths))
+            # the first vertex of a path is not scored
+            starts = offs[b:e] + 1
+            steps = offs[b+1:e+1] - starts
+            cols = numpy.arange( max(1, int(steps.max())) )
+            mask = cols < steps[:,None]
+            vidx = verts[ numpy.where(mask, starts[:,None] + cols, 0) ]
+
+            cimpt = numpy.cumsum( numpy.where(mask, vimpt[vidx], 0.0), axis=1 )
+            if const_risk != None:
+                # table of python float powers (numpy.power may round differently)
+                powers = numpy.array([ const_risk ** k for k in range(len(cols)+1) ])
+                prob[b:e] = powers[steps]
+                crisk = numpy.where(mask, const_risk * cimpt, 0.0)
+            else:
+                cprob = numpy.cumprod( numpy.where(mask, vprob[vidx], 1.0), axis=1 )
+                prob[b:e] = cprob[:,-1]
+                crisk = numpy.where(mask, cprob * cimpt, 0.0)
+            impt[b:e] = cimpt[:,-1]
+            risk[b:e] = numpy.cumsum(crisk, axis=1)[:,-1]
+
+        cut = prob < self.path_cutoff
+        prob[cut] = 0.0
+        impt[cut] = 0.0
+        risk[cut] = 0.0
+        return prob, impt, risk
+
+    # path_scores for the paths of a PathTrie: the running probability, impact
+    # and VRisk of path_risk are computed once per trie node, level by level
+    # (a node from its parent with the same operations as path_risk), and the
+    # scores of a path are the values of its leaf. Identical to path_scores.
+    def trie_scores(self, trie, shift):
+        (vprob, vimpt, const_risk) = self.vertex_arrays(shift)
+        nprob = numpy.ones(trie.nnodes)
+        nimpt = numpy.zeros(trie.nnodes)
+        nrisk = numpy.zeros(trie.nnodes)
+        parents = trie.get_parents()
+        verts = trie.get_vertices()
+        (order, ptr) = trie.levels()
+        # depth 0 (first vertex of a path) is not scored
+        for d in range(1, len(ptr)-1):
+            nodes = order[ ptr[d]:ptr[d+1] ]
+            par = parents[nodes]
+            nimpt[nodes] = nimpt[par] + vimpt[ verts[nodes] ]
+            if const_risk != None:
+                nrisk[nodes] = nrisk[par] + const_risk * nimpt[nodes]
+            else:
+                nprob[nodes] = nprob[par] * vprob[ verts[nodes] ]
+                nrisk[nodes] = nrisk[par] + nprob[nodes] * nimpt[nodes]
+
+        leaves = trie.get_leaves()
+        if const_risk != None:
+            powers = numpy.array([ const_risk ** k for k in range(len(ptr)) ])
+            prob = powers[ trie.lengths() - 1 ]
+        else:
+            prob = nprob[leaves]
+        impt = nimpt[leaves]
+        risk = nrisk[leaves]
+        cut = prob < self.path_cutoff
+        prob[cut] = 0.0
+        impt[cut] = 0.0
+        risk[cut] = 0.0
+        return prob, impt, risk
+
+    # path_scores for the node probabilities of several scenarios at once
+    # vprob: matrix [scenario, vertex] of node probabilities, shift: per scenario
+    # vimpact: matrix [scenario, vertex] of node impacts (default: the graph's)
+    # returns matrices (prob, impt, risk) [scenario, path] (same operations as
+    # path_scores along the last axis, so every row equals a path_scores call)
+    def path_scores_matrix(self, paths, vprob, shift, vimpact=None):
+        sprob = numpy.clip(vprob + numpy.asarray(shift)[:,None], 0.0, 1.0)
+        if vimpact is None:
+            vimpt = self.vimpt[None,:]
+        else:
+            vimpt = vimpact * numpy.sqrt(self.outdeg)
+        nscen = len(sprob)
+        offs = paths.get_offsets()
+        verts = paths.vertices()
+        prob = numpy.empty( (nscen, len(paths)) )
+        impt = numpy.empty( (nscen, len(paths)) )
+        risk = numpy.empty( (nscen, len(paths)) )
+        batch = max(1, SCORE_BATCH // nscen)
+        for b in range(0, len(paths), batch):
+            e = min(b+batch, len(paths))
+            starts = offs[b:e] + 1
+            steps = offs[b+1:e+1] - starts
+            cols = numpy.arange( max(1, int(steps.max())) )
+            mask = cols < steps[:,None]
+            vidx = verts[ numpy.where(mask, starts[:,None] + cols, 0) ]
+
+            cimpt = numpy.cumsum( numpy.where(mask, vimpt[:,vidx], 0.0), axis=2 )
+            cprob = numpy.cumprod( numpy.where(mask, sprob[:,vidx], 1.0), axis=2 )
+            prob[:,b:e] = cprob[:,:,-1]
+            impt[:,b:e] = cimpt[:,:,-1]
+            risk[:,b:e] = numpy.cumsum( numpy.where(mask, cprob * cimpt, 0.0), axis=2 )[:,:,-1]
+
+        cut = prob < self.path_cutoff
+        prob[cut] = 0.0
+        impt[cut] = 0.0
+        risk[cut] = 0.0
+        return prob, impt, risk
+
     # used to find the shift normalization parameter
     def default_P_total(self, paths, default_prob=DEFAULT_PROBABILITY):
         #path probabilities of all paths
@@ -95,39 +238,78 @@ class prob_calculator:
         #Union of path probabilities
         return 1.0 - numpy.prod(list_prob)
 
+    # same as default_P_total but based on a path length histogram {length: count}
+    def default_P_total_hist(self, lhist, default_prob=DEFAULT_PROBABILITY):
+        list_prob=[]
+        for plen,count in lhist.items():
+            list_prob.append( (1 - (default_prob)**plen)**count )
+        return 1.0 - numpy.prod(list_prob)
+
     def find_shift(self, paths):
+        if self.no_shift:
+            return self.args_shift
+        lhist = {}
+        for path in paths:
+            lhist[len(path)] = lhist.get(len(path), 0) + 1
+        return self.find_shift_hist(lhist)
+
+    # log( 1 - default_P_total_hist(lhist, p) ) - log(0.5) and its derivative in p
+    # sum over lengths of count * log(1 - p**len)
+    def shift_residual(self, lhist, p):
+        res = -math.log(0.5)
+        dres = 0.0
+        for plen,count in lhist.items():
+            pl = p**plen
+            if pl >= 1.0:
+                return -math.inf, -math.inf
+            res = res + count * math.log1p(-pl)
+            dres = dres - count * plen * p**(plen-1) / (1.0 - pl)
+        return res, dres
+
+    # the shift only depends on path lengths, so a histogram of them is enough.
+    # Finds the default probability p for which the P_total of all paths is 0.5:
+    # the residual is strictly decreasing in p with residual(0) > 0, so the root is
+    # bracketed by [0,1] and found by Newton steps that fall back to bisection
+    # whenever a step leaves the bracket
+    def find_shift_hist(self, lhist):
         if self.no_shift:
             return self.args_shift
 
-        shift=0.0
-        eps = 0.5
-        old_eps = self.default_P_total(paths, default_prob=0.5) - 0.5
-        prev_shift_delta = -0.25
+        if sum(lhist.values()) == 0:
+            log.warning("WARNING: Unable to converge to find shift normalization")
+            return self.args_shift
+
+        lo = 0.0
+        hi = 1.0
+        p = 0.5
+        (res, dres) = self.shift_residual(lhist, p)
         iter=0
-        while abs(eps) > 0.0001 and iter < 20:
-            shift = shift + prev_shift_delta
-            eps=self.default_P_total(paths, default_prob=0.5+shift) - 0.5
-            print("find_shift: o{}\te{}\ts{}\td{}".format(old_eps, eps, shift, prev_shift_delta))
-
-            if abs(eps) > abs(old_eps) and eps * old_eps >= 0.0:
-                # if eps increases, we're moving in the wrong direction
-                prev_shift_delta = -prev_shift_delta
-            elif abs(eps) < abs(old_eps) and eps * old_eps >= 0.0:
-                # both eps on 'same side of curve' -> keep moving, just slower
-                prev_shift_delta = prev_shift_delta / 2.0
+        while abs(res) > SHIFT_TOLERANCE and hi-lo > SHIFT_TOLERANCE and iter < SHIFT_MAX_ITER:
+            if res > 0.0:
+                lo = p
             else:
-                # eps's on 'different sides of curve' -> cut delta in half and change dir
-                prev_shift_delta = -prev_shift_delta / 2.0
-
-            old_eps = eps
+                hi = p
+            step = p
+            if dres != 0.0 and math.isfinite(dres):
+                step = p - res/dres
+            if not (lo < step < hi):
+                step = (lo + hi) / 2.0
+            p = step
+            (res, dres) = self.shift_residual(lhist, p)
             iter=iter+1
+            log.debug("find_shift: p%s\tr%s\ts%s\t[%s,%s]", p, res, p-0.5, lo, hi)
 
-        if iter >= 20:
-            print("WARNING: Unable to converge to find shift normalization")
+        shift = p - 0.5
+        # residual as difference of P_total from 0.5
+        eps = self.default_P_total_hist(lhist, default_prob=p) - 0.5
+        if iter >= SHIFT_MAX_ITER:
+            log.warning("WARNING: Unable to converge to find shift normalization (residual: %s)", eps)
         else:
-            print("Found normalization shift: ",shift," after ",iter,"iterations")
+            log.info("Found normalization shift: %s after %s iterations (residual: %s )", shift, iter, eps)
         self.detected_shift = shift
         return self.args_shift
 
     def getshift(self):
         return self.detected_shift
+    def getargshift(self):
+        return self.args_shift
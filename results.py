@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Machine-readable results for the -o option.
+#
+# Every writer gets the results target by target (add_target) and writes them
+# right away:
+#  json: {"targets": [ summary, summary, ... ]}, one summary per line
+#  yml : one yaml document per target
+#  npz : uncompressed npz (zip of .npy files) with the arrays of every target
+#        as "<target index>/<name>" plus "targets" (the target labels).
+#        numpy.load() reads the arrays lazily, one at a time.
+# A summary is a dict of the statistics of the text report. Histograms are the
+# lists "hist_bins" and "hist_counts" (in the npz: arrays of the same name;
+# the bins are int64, the counts int64 or, for the estimates of the sample
+# engine and for counts beyond the int64 range (exact path counts of the dag
+# engine), float64).
+
+import csv
+import json
+import numpy
+import yaml
+import zipfile
+
+OUTPUT_FORMATS=["pgt", "json", "yml", "npz"]
+OUTPUT_EXTENSIONS={ "json":".json", "yml":".yml", "npz":".npz" }
+
+
+# python types of numpy values (recursive for lists and dicts)
+def plain(val):
+    if isinstance(val, dict):
+        return { str(k):plain(v) for k,v in val.items() }
+    if isinstance(val, (list, tuple, numpy.ndarray)):
+        return [ plain(v) for v in val ]
+    if isinstance(val, numpy.bool_):
+        return bool(val)
+    if isinstance(val, numpy.integer):
+        return int(val)
+    if isinstance(val, numpy.floating):
+        return float(val)
+    return val
+
+
+# array of histogram counts, float64 if python ints exceed the int64 range
+def count_array(counts):
+    arr = numpy.asarray(counts)
+    if arr.dtype == object:
+        return numpy.asarray(counts, dtype=numpy.float64)
+    return arr
+
+class JsonWriter:
+    def __init__(self, fname):
+        self.stream = open(fname, "w")
+        self.stream.write('{"targets": [\n')
+        self.count = 0
+
+    def add_target(self, summary, arrays={}):
+        if self.count > 0:
+            self.stream.write(",\n")
+        json.dump(plain(summary), self.stream)
+        self.stream.flush()
+        self.count = self.count + 1
+
+    def close(self):
+        self.stream.write("\n]}\n")
+        self.stream.close()
+
+class YamlWriter:
+    def __init__(self, fname):
+        self.stream = open(fname, "w")
+
+    def add_target(self, summary, arrays={}):
+        yaml.safe_dump(plain(summary), self.stream, explicit_start=True, sort_keys=False)
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+class NpzWriter:
+    def __init__(self, fname):
+        self.zfile = zipfile.ZipFile(fname, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.targets = []
+
+    def write_array(self, name, arr):
+        with self.zfile.open(name + ".npy", "w", force_zip64=True) as astream:
+            numpy.lib.format.write_array(astream, numpy.asanyarray(arr), allow_pickle=False)
+
+    def add_target(self, summary, arrays={}):
+        prefix = str(len(self.targets)) + "/"
+        self.write_array(prefix + "hist_bins", numpy.asarray(summary["hist_bins"], dtype=numpy.int64))
+        self.write_array(prefix + "hist_counts", count_array(summary["hist_counts"]))
+        for name,arr in arrays.items():
+            self.write_array(prefix + name, arr)
+        self.targets.append(summary["target"])
+
+    def close(self):
+        self.write_array("targets", numpy.array(self.targets, dtype=str))
+        self.zfile.close()
+
+# writers for the comma-separated list of formats of -o (without pgt), all
+# files are named base + extension of the format
+class ResultWriters:
+    def __init__(self, formats, base):
+        self.writers = []
+        for fmt in formats:
+            fname = base + OUTPUT_EXTENSIONS[fmt]
+            if fmt == "json":
+                self.writers.append( JsonWriter(fname) )
+            elif fmt == "yml":
+                self.writers.append( YamlWriter(fname) )
+            elif fmt == "npz":
+                self.writers.append( NpzWriter(fname) )
+
+    # arrays: per-path arrays (only written to npz)
+    def add_target(self, summary, arrays={}):
+        for w in self.writers:
+            w.add_target(summary, arrays)
+
+    def close(self):
+        for w in self.writers:
+            w.close()
+
+# the scalar values of a summary as one table row (nested dicts as
+# <key>_<subkey>, lists are left out)
+def flatten(summary, prefix=""):
+    row = {}
+    for k,v in plain(summary).items():
+        if isinstance(v, dict):
+            row.update( flatten(v, prefix + k + "_") )
+        elif not isinstance(v, list):
+            row[prefix + k] = v
+    return row
+
+# collects the summaries of one batch run as table rows
+class TableRows:
+    def __init__(self, run):
+        self.run = run
+        self.rows = []
+
+    def add_target(self, summary, arrays={}):
+        row = { "run": self.run }
+        row.update( flatten(summary) )
+        self.rows.append(row)
+
+    def get(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+# csv table of rows; the columns are all keys in the order of appearance
+def write_table(fname, rows):
+    columns = []
+    for row in rows:
+        columns.extend( [ k for k in row if k not in columns ] )
+    with open(fname, "w", newline="") as tstream:
+        writer = csv.DictWriter(tstream, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -16,12 +16,43 @@
 # limitations under the License.
 # 
 
+import json
+
+from tools import log
+
+
+# key of a list of instance modifiers (independent of the dict order)
+def modifier_key(modifiers):
+    return json.dumps(modifiers, sort_keys=True, default=str)
+
+
+# a stencil with the modifiers (and collapsing) of an instance applied.
+# Templates are shared by all instances with the same modifiers, so their
+# node data and links must only be read (instances copy what they change).
+class StencilTemplate:
+    def __init__(self, snodes, removed):
+        self.snodes = snodes     # {stencil node: {attribute: value, "links": [...]}}
+        self.removed = removed   # stencil nodes removed by the modifiers
+        self.collapsed = {}
+
+    def nodes(self):
+        return self.snodes
+    def removed_nodes(self):
+        return self.removed
+
+    # cached result of build() for a set of collapsed nodes
+    def collapse(self, key, build):
+        if key not in self.collapsed:
+            self.collapsed[key] = build()
+        return self.collapsed[key]
+
 
 class Stencil:
     def __init__(self, sname, sdata):
         self.name = sname
         self.data = sdata.copy()
         self.data.pop("type",[]) # type info can be removed, at this point we know what we are
+        self.templates = {}
         return
 
     def sname(self):
@@ -29,6 +60,14 @@ class Stencil:
     def sdata(self):
         return self.data
 
+    # template for the given modifiers, build() is only called once per
+    # distinct set of modifiers
+    def template(self, modifiers, build):
+        key = modifier_key(modifiers)
+        if key not in self.templates:
+            self.templates[key] = build()
+        return self.templates[key]
+
 # stencils should be addressable by name, so this will be a dictionary
 class StencilList:
     def __init__(self):
@@ -44,7 +83,7 @@ class StencilList:
 
     def add(self, name, sdata):
         if name in self.stencils:
-            print("WARNING: trying to add a stencil that already exits.")
+            log.warning("WARNING: trying to add a stencil that already exits: %s", name)
         else:
             self.stencils[name] = Stencil( name, sdata )
         return self.stencils[name]
@@ -22,27 +22,38 @@ from graph_tool.all import *
 import statistics
 import numpy
 import math
+import logging
+import multiprocessing
 import os
-try:
-    from tqdm import tqdm
-except ImportError:
-    def tqdm(it, desc="None"):
-        return it
-
+import sys
+import time
 
 from constants import N1,N2,DEFAULT_PROBABILITY,DEFAULT_IMPACT,STRUCTURAL_SHIFT,MAX_PATHS,CVSS_CONF,CVSS_INT,CVSS_AVAIL,PNORM_BINS, PNORM_PEAK
 import tools
+from tools import log
 import layers
 import nodes
 import stencil
-import graph as sgr
+import model as md
 import prob_calc as pc
+import path_agg as pa
+import path_store as ps
+import path_trie as pt
+import dag_engine as de
+import tree_engine as te
+import error_ensemble as ee
+import incremental as inc
+import path_sample as psm
+import path_pool as pp
+import path_prune as pr
+import results as rs
+import sweep as sw
 
 
 class sec_graph:
-    def __init__(self, data):
-        self.lg = data
-        self.shortener = tools.Shortener()
+    def __init__(self, mdl):
+        self.model = mdl
+        self.shortener = mdl.get_shortener()
         self.g = Graph()
         self.vertex_label = self.g.new_vertex_property("string")
         self.vertex_fill_color = self.g.new_vertex_property('vector<double>')
@@ -60,8 +71,13 @@ class sec_graph:
         self.attk_nodes=[]
 
 
-    def get_nodes(self):
-        return self.lg.get_nodes()
+    def num_nodes(self):
+        return self.model.num_nodes()
+    # long name and probability of the node of vertex v
+    def node_name(self, v):
+        return self.model.longname( self.node_index[v] )
+    def node_probability(self, v):
+        return self.model.probability( self.node_index[v] )
     def get_vertices(self):
         return list(self.g.vertices())
 
@@ -70,83 +86,51 @@ class sec_graph:
     def get_targets(self):
         return self.targ_nodes
 
-    def create_labels(self):
-        shopt=-1
-        for opt in range( self.shortener.getOptionCount() ):
-            retry = False
-            shlist=[]
-            for n in self.get_nodes().get():
-                nshort=self.shortener.apply(n.nname(), opt)
-                if nshort in shlist:
-                    print("SHORT-NAME COLLISION with option", opt,": ", n.nname(), nshort)
-                    retry = True
-                    break
-                shlist.append(nshort)
-            if retry == False:
-                shopt=opt
-                break
-        if shopt==-1:
-            raise tools.NameShorteningError("NO MORE SHORTENING OPTIONS AVAILABLE TO CREATE UNIQUE SHORTNAMES")
-
-        print("Successful SHORTENING with option", shopt,": ", shlist)
-        self.shortener.set(shopt)
-        self.lg.shorten_ta_names(self.shortener)
-
     def explain_labels(self):
         print(self.shortener.explain())
 
     def find_node(self, longname):
+        v = self.model.get_symbols().vertex(longname)
+        if v != None:
+            return v
+        # partial names: first vertex label that contains the short name
         name = self.shortener.apply(longname)
         for i,n in enumerate(self.vertex_label):
             if name in n:
                 return i
 
-    def edge_dedup(self, edgelist, sshort, dshort, unidir=False):
-        esorted=[sshort, dshort]
-
-        if not unidir:
-            esorted.sort()
-
-        v1=esorted[0]
-        v2=esorted[1]
-        if v1 not in edgelist:
-            edgelist[v1]=[]
-        if v2 not in edgelist[v1]:
-            edgelist[v1].append(v2)
-            print("New Edge:", v1, v2)
-            return edgelist,True
-        return edgelist,False
-
-
     def generate_graph(self, unidir=False):
-        self.create_labels()
-        edges={}
         self.targ_nodes=[]
         self.attk_nodes=[]
+        mdl = self.model
+        nnodes = mdl.num_nodes()
 
         # create the vertices
-        for idx,n in enumerate( self.get_nodes().get() ):
-            nshort=self.shortener.apply( n.nname() )
-
-            locals()[nshort] = self.g.add_vertex()
-            self.vertex_label[locals()[nshort]] = nshort+"."+str(n.nprobability())
-            self.vertex_probability[locals()[nshort]] = n.nprobability()
-            self.vertex_impact[locals()[nshort]] = n.nimpact()
-            self.node_index[locals()[nshort]] = idx
-            if self.lg.is_attacker(nshort):
-                self.attk_nodes.append(locals()[nshort])
-            if self.lg.is_target(nshort):
-                self.targ_nodes.append(locals()[nshort])
-
-        for n in self.get_nodes().get():
-            nshort=self.shortener.apply( n.nname() )
-            for l in n.nlinks():
-                dshort=self.shortener.apply( l["d"] )
-                edges,newedge = self.edge_dedup(edges, nshort, dshort, unidir)
-                if newedge:
-                    self.g.add_edge(locals()[nshort], locals()[dshort])
-                    if not unidir:
-                        self.g.add_edge(locals()[dshort], locals()[nshort])
+        if nnodes > 0:
+            self.g.add_vertex(nnodes)
+        for idx in range(nnodes):
+            self.vertex_label[idx] = mdl.shortname(idx)+"."+str(mdl.probability(idx))
+        self.vertex_probability.get_array()[:] = mdl.probabilities()
+        self.vertex_impact.get_array()[:] = mdl.impacts()
+        self.node_index.get_array()[:] = numpy.arange(nnodes)
+        self.attk_nodes = [ self.g.vertex(idx) for idx in mdl.attackers() ]
+        self.targ_nodes = [ self.g.vertex(idx) for idx in mdl.targets() ]
+
+        # all links as vertex ids, deduplicated on the (unordered unless unidir)
+        # vertex pair keeping the first occurrence
+        (link_ptr, link_dst) = mdl.links()
+        links = numpy.stack( (numpy.repeat(numpy.arange(nnodes), numpy.diff(link_ptr)), link_dst), axis=1 )
+        if unidir:
+            keys = links[:,0] * nnodes + links[:,1]
+        else:
+            keys = links.min(axis=1) * nnodes + links.max(axis=1)
+        _,first = numpy.unique(keys, return_index=True)
+        links = links[ numpy.sort(first) ]
+        if not unidir:
+            # each link followed by its reverse edge
+            links = numpy.stack( (links, links[:,::-1]), axis=1 ).reshape(-1, 2)
+        self.g.add_edge_list(links)
+        log.info("Edges: %s", len(links))
 
     def conjugate(self):
 
@@ -159,60 +143,66 @@ class sec_graph:
         self.cgv_impact = self.cg.new_vertex_property("double")
         self.cgv_index = self.cg.new_vertex_property("int") # index into edgelist
         self.cgv_color = self.cg.new_vertex_property("vector<double>")
-        self.cgv_enodes_labels = self.cg.new_edge_property("string")
+        self.cgv_enodes = self.cg.new_edge_property("int") # shared vertex of g (-1: fin)
         self.cg.vertex_properties['cgv_label']=self.cgv_label
         self.cg.vertex_properties['cgv_probability']=self.cgv_probability
         self.cg.vertex_properties['cgv_impact']=self.cgv_impact
         self.cg.vertex_properties['cgv_index']=self.cgv_index
         self.cg.vertex_properties['vertex_fill_color']=self.cgv_color
-        self.cg.edge_properties['cgv_enodes_labels']=self.cgv_enodes_labels
-
-        for s, t, i in self.g.iter_edges([self.g.edge_index]):
-            str_i = "e"+str(i)
-            locals()[str_i] = self.cg.add_vertex()
-            self.cgv_label[locals()[str_i]] = str_i
-            self.cgv_probability[locals()[str_i]] = self.vertex_probability[t]
-            self.cgv_impact[locals()[str_i]] = self.vertex_impact[t]
-            self.cgv_index[locals()[str_i]] = i
-            dot_idx=self.vertex_label[s].index('.')
-            if self.lg.is_attacker(self.vertex_label[s][:dot_idx]):
-                self.attk_nodes.append(locals()[str_i])
-            dot_idx=self.vertex_label[t].index('.')
-            if self.lg.is_target(self.vertex_label[t][:dot_idx]):
-                self.targ_nodes.append(locals()[str_i])
+        self.cg.edge_properties['cgv_enodes']=self.cgv_enodes
+
+        # one vertex per edge of g (vertex k is the k-th edge of get_edges)
+        edges = self.g.get_edges([self.g.edge_index])
+        (s, t, eidx) = (edges[:,0], edges[:,1], edges[:,2])
+        nv = self.g.num_vertices()
+        ne = len(edges)
+        if ne > 0:
+            self.cg.add_vertex(ne)
+        for k in range(ne):
+            self.cgv_label[k] = "e"+str(eidx[k])
+        self.cgv_probability.get_array()[:] = self.vertex_probability.get_array()[t]
+        self.cgv_impact.get_array()[:] = self.vertex_impact.get_array()[t]
+        self.cgv_index.get_array()[:] = eidx
+
+        # attackers/targets of the model
+        vattk = numpy.zeros(nv, dtype=bool)
+        vtarg = numpy.zeros(nv, dtype=bool)
+        vattk[ self.model.attackers() ] = True
+        vtarg[ self.model.targets() ] = True
+        self.attk_nodes = [ self.cg.vertex(k) for k in numpy.flatnonzero(vattk[s]) ]
+        targets = numpy.flatnonzero(vtarg[t])
 
         # connect 2 edges if the target of edgeA equals the source of edgeB
-        #  - iterate over edges e of g
-        #  - create edge in cg to all outbound edges of the target(e)
-        #  - label the edge with the shared vertex
-        for s, t, i in self.g.iter_edges([self.g.edge_index]):
-            str_i = "e"+str(i)
-            # print(s,t,i, self.vertex_label[s], self.vertex_label[t])
-            for st, tt, ei in self.g.iter_out_edges(t, [self.g.edge_index]):
-                # print("   ",st,tt, ei, self.vertex_label[st], self.vertex_label[tt])
-                str_ei = "e"+str(ei)
-                loc_e = str_i+str_ei
-                locals()[loc_e] = self.cg.add_edge(locals()[str_i], locals()[str_ei])
-                self.cgv_enodes_labels[locals()[loc_e]] = self.vertex_label[t]
-
-
-        for v in self.cg.vertices():
-            p=self.cgv_probability[v]
-            self.cgv_color[v] = (p, 0/255.0, 0/255.0, 1)
+        #  - the out edges of every vertex in out-edge order: order[start[v]:start[v+1]]
+        #  - edge k connects to all out edges of t[k]
+        #  - the edge is labeled with the shared vertex
+        order = numpy.argsort(s, kind='stable')
+        start = numpy.zeros(nv+1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(s, minlength=nv), out=start[1:])
+        cnt = start[t+1] - start[t]
+        offs = numpy.zeros(ne+1, dtype=numpy.int64)
+        numpy.cumsum(cnt, out=offs[1:])
+        csrc = numpy.repeat(numpy.arange(ne), cnt)
+        cdst = order[ numpy.repeat(start[t] - offs[:-1], cnt) + numpy.arange(offs[-1]) ]
+        shared = numpy.repeat(t, cnt)
+
+        p = self.cgv_probability.get_array()
+        self.cgv_color.set_2d_array( numpy.array([ p, numpy.zeros(ne), numpy.zeros(ne), numpy.ones(ne) ]) )
 
         finode=self.cg.add_vertex()
         self.cgv_label[finode]="fin"
         self.cgv_probability[finode]=1.0
         self.cgv_impact[finode]=DEFAULT_IMPACT
         self.cgv_index[finode]=finode
-        for e in self.targ_nodes:
-            str_e="e"+str(e)
-            finedge=self.cg.add_edge(locals()[str_e], finode)
-            self.cgv_enodes_labels[finedge] = "fin"
+        ntarg = len(targets)
+        self.cg.add_edge_list( numpy.stack(
+            ( numpy.concatenate( (csrc, targets) ),
+              numpy.concatenate( (cdst, numpy.full(ntarg, int(finode))) ) ), axis=1 ) )
+        self.cgv_enodes.get_array()[:] = numpy.concatenate( (shared, numpy.full(ntarg, -1)) )
         self.targ_nodes=[finode]
 
-        print(self.g)
-        print(self.cg)
+        log.debug("%s", self.g)
+        log.debug("%s", self.cg)
         # print(self.targ_nodes, self.attk_nodes)
 
         # replace g with cg
@@ -236,7 +226,7 @@ class sec_graph:
         #            # vertex_text_offset=[-0.01,0.005],
         #            edge_pen_width=3,
         #            edge_color=(180/255.0,180/255.0,180/255.0, 1),
-        #            edge_text=self.cgv_enodes_labels,
+        #            edge_text=self.cgv_enodes,
         #            output_size=[1500,1000])
 
 
@@ -266,22 +256,29 @@ class sec_graph:
                    output_size=osize)
 
     def blast_radius_draw(self, paths):
+        self.blast_radius_reset()
+        for p in paths:
+            self.blast_radius_mark(p)
+        self.blast_radius_show()
+
+    def blast_radius_reset(self):
         self.eset = self.g.new_edge_property("bool", val=False)
         self.g.edge_properties['bref']=self.eset
         self.vset = self.g.new_vertex_property("bool", val=False)
         self.g.vertex_properties['bref']=self.vset
 
-        for p in paths:
-            snode = p[0]
-            self.vset[ snode ] = True
-            for v in p[1:]:
-                # print(v, self.vset[v])
-                self.vset[ v ] = True
-                self.eset[ self.g.edge(snode, v) ] = True
-                snode = v
-                # self.vset[ t ] = True
-                # self.eset[ i ] = True
-
+    def blast_radius_mark(self, p):
+        snode = p[0]
+        self.vset[ snode ] = True
+        for v in p[1:]:
+            # print(v, self.vset[v])
+            self.vset[ v ] = True
+            self.eset[ self.g.edge(snode, v) ] = True
+            snode = v
+            # self.vset[ t ] = True
+            # self.eset[ i ] = True
+
+    def blast_radius_show(self):
         brg = GraphView(self.g, vfilt=self.vset, efilt=self.eset)
         graph_draw(brg,
                    vertex_size=20,
@@ -297,119 +294,241 @@ class sec_graph:
                    output_size=[1500,1000])
 
 
-def find_modes(paths, nodes):
-    nhist={}
-    first=[]
-    second=[]
-    third=[]
-    for n in range(0, len(nodes)):
-        nhist[n] = 0
-    for p in tqdm(paths, desc="PathModes"):
-        for n in p[1:-1]:
-            nhist[n] = nhist[n]+1
-
-    fst_val = [0,0,0]
-    for n,c in nhist.items():
-        if c > fst_val[0]:
-            fst_val[0] = c
-        elif c > fst_val[1]:
-            fst_val[1] = c
-        elif c > fst_val[2]:
-            fst_val[2] = c
-
-    # find the 3 highest values in the dict
-    hvals = [ c for (n,c) in nhist.items() ]
-    fst_val[0] = max(hvals)
-    hvals = [ n for n in hvals if n < fst_val[0] ]
-    fst_val[1] = max(hvals)
-    hvals = [ n for n in hvals if n < fst_val[1] ]
-    fst_val[2] = max(hvals)
-
-    for n,c in nhist.items():
-        if c == fst_val[0]:
-            first.append(n)
-        if c == fst_val[1]:
-            second.append(n)
-        if c == fst_val[2]:
-            third.append(n)
-
-    return (nhist, fst_val, first, second, third)
-
-def has_loop(path):
-    return len(path) != len(set(path))
-
-def path_stats(sg, N1, N2, args):
+# print the paths via a -M node (at most as many as given), followed by a note
+# about the number of omitted paths
+def print_node_paths(sg, paths, npaths):
+    for path in paths:
+        print([ (sg.node_name(m), sg.node_probability(m)) for m in path[0:] ])
+    if npaths > len(paths):
+        print("... {} more paths via this node not shown".format(npaths-len(paths)))
+
+# write all paths via a -M node to the nodemode file
+def write_node_paths(sg, f, target, node, paths):
+    f.write("# target: {}  node: {}  paths: {}\n".format(
+        sg.vertex_label[target], sg.node_name(node), len(paths)))
+    for path in paths:
+        f.write(" ".join([ sg.node_name(m) for m in path ]) + "\n")
+
+# count the paths through every node (interior vertices of the paths only)
+# returns (counts per vertex, [val1, val2, ...], [[vertices with val1], ...])
+# for the k highest distinct counts
+def find_modes(paths, nodes, k=3):
+    if isinstance(paths, pt.PathTrie):
+        nhist = paths.interior_counts(len(nodes))
+    else:
+        offs = paths.get_offsets()
+        interior = numpy.ones(len(paths.vertices()), dtype=bool)
+        interior[ offs[:-1] ] = False
+        interior[ offs[1:]-1 ] = False
+        nhist = numpy.bincount( paths.vertices()[interior], minlength=len(nodes) )
+        # the vertex->paths index answers the -M lookups
+        paths.build_index()
+    (vals, tiers) = pa.mode_tiers(nhist, k)
+    return (nhist, vals, tiers)
+
+# common setup of the path-based analysis: nodemode lookup, conjugation and noise
+def prepare_paths(sg, args):
     mode_of_nodes_list = []
     if args.nodemode != '':
-        mode_of_nodes_list = [ sg.find_node(i) for i in args.nodemode.split(',') ]
-    shift=0.0
-    dropped_paths = 0
-    print(mode_of_nodes_list)
+        for i in args.nodemode.split(','):
+            node = sg.find_node(i)
+            if node == None:
+                log.warning("Unknown node for -M: %s", i)
+            else:
+                mode_of_nodes_list.append(node)
+    log.debug("%s", mode_of_nodes_list)
     if args.edge_graph == True:
         sg.conjugate()
-        print("Attackers:",[ sg.cgv_label[x] for x in sg.get_attackers() ])
-        print("Targets  :",[ sg.cgv_label[x] for x in sg.get_targets() ])
-    if args.error != 0.0:
-        nodelist = sg.get_nodes().get()
-        print("Applying ",args.error,"% of noise to scores to ",len(nodelist)," nodes")
+        if log.isEnabledFor(logging.INFO):
+            log.info("Attackers: %s", [ sg.cgv_label[x] for x in sg.get_attackers() ])
+            log.info("Targets  : %s", [ sg.cgv_label[x] for x in sg.get_targets() ])
+    if args.error != 0.0 and args.error_replicates == 0:
+        nnodes = sg.num_nodes()
+        log.info("Applying %s %% of noise to scores to %s nodes", args.error, nnodes)
         applied_err=abs(args.error)
         addsub=math.copysign(1.0, args.error)
-        noise=numpy.random.normal(0.0, numpy.sqrt(applied_err), len(nodelist))
-        print(sg.vertex_probability.get_array())
-        for n in range(0, len(nodelist)):
-            ridx=numpy.random.randint(len(nodelist))
+        noise=numpy.random.normal(0.0, numpy.sqrt(applied_err), nnodes)
+        log.debug("%s", sg.vertex_probability.get_array())
+        for n in range(0, nnodes):
+            ridx=numpy.random.randint(nnodes)
             sg.vertex_probability[n] = min(1.0, max(sg.vertex_probability[n] + addsub*noise[ridx]/100.0, 0.0))
-            iidx=numpy.random.randint(len(nodelist))
+            iidx=numpy.random.randint(nnodes)
             sg.vertex_impact[n] = min(4.0, max(sg.vertex_impact[n] + addsub*noise[iidx]/100.0, 0.0))
-        print(sg.vertex_probability.get_array())
+        log.debug("%s", sg.vertex_probability.get_array())
+    return mode_of_nodes_list
+
+# all attacker->c paths as PathStore (or PathTrie if trie is set)
+# paths: {target: PathStore/PathTrie} of the enumerated paths, shared by the runs
+# of a batch with the same graph structure (see batch_main) or kept for --watch
+# workers > 1 enumerates on a process pool (same paths in the same order)
+def enumerate_paths(sg, c, paths=None, trie=False, workers=1):
+    if paths != None and int(c) in paths:
+        log.info("Using the paths of a previous run...")
+        return paths[int(c)]
+    if trie:
+        ap = pt.PathTrie(len(sg.get_vertices()))
+    else:
+        ap = ps.PathStore(len(sg.get_vertices()))
+    log.info("Detecting paths...")
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    if workers > 1:
+        pp.enumerate_target(sg.g, sg.get_attackers(), c, cutoff, ap, workers)
+    else:
+        for a in sg.get_attackers():
+            ap.extend( all_paths(sg.g, a, c, cutoff=cutoff, edges=False) )
+    if trie:
+        log.info("Path trie: %s nodes for %s path vertices", ap.nnodes, int(ap.lengths().sum()))
+    if paths != None:
+        paths[int(c)] = ap
+    return ap
+
+# enumerate_paths for all targets that are not in paths yet with one
+# enumeration per attacker (--multi_target): every target gets an edge to an
+# extra sink vertex and all_paths runs from the attacker to the sink. A path
+# a..t,sink is a path a..t (that may pass other targets) and the paths of a
+# target come in the same order as from all_paths(g, a, t).
+def enumerate_targets(sg, paths, trie=False, workers=1):
+    targets = [ int(c) for c in sg.get_targets() if int(c) not in paths ]
+    attackers = [ int(a) for a in sg.get_attackers() ]
+    if len(targets) == 0:
+        return
+    # the paths from a vertex to itself are not simple paths to the sink
+    if len( set(targets) & set(attackers) ) > 0:
+        log.info("Attackers are targets, enumerating the paths target by target...")
+        for c in targets:
+            enumerate_paths(sg, c, paths, trie, workers)
+        return
+    # the work units of the pool are per target
+    if workers > 1:
+        log.info("Enumerating the paths target by target on %s workers...", workers)
+        for c in targets:
+            enumerate_paths(sg, c, paths, trie, workers)
+        return
+
+    nv = sg.g.num_vertices()
+    g = Graph()
+    g.add_vertex(nv+1)
+    g.add_edge_list( numpy.concatenate( (sg.g.get_edges()[:,0:2], [ [c, nv] for c in targets ]) ) )
+    stores = {}
+    for c in targets:
+        if trie:
+            stores[c] = pt.PathTrie(len(sg.get_vertices()))
+        else:
+            stores[c] = ps.PathStore(len(sg.get_vertices()))
+    log.info("Detecting paths of %s targets...", len(targets))
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    for a in attackers:
+        for path in all_paths(g, a, nv, cutoff=cutoff+1, edges=False):
+            stores[ int(path[-2]) ].append( path[:-1] )
+    paths.update(stores)
+
+# attacker->c paths with a probability of at least --cut_off (--engine pruned)
+# returns (PathStore or PathTrie, number of pruned subtrees)
+def pruned_paths(sg, c, pcalc, args):
+    if args.path_trie:
+        ap = pt.PathTrie(len(sg.get_vertices()))
+    else:
+        ap = ps.PathStore(len(sg.get_vertices()))
+    (vprob, vimpt, const_prob) = pcalc.vertex_arrays(pcalc.getargshift())
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    enum = pr.PrunedPaths(sg.g, c, cutoff, vprob, const_prob, args.cut_off)
+    log.info("Detecting paths with probability >= %s...", args.cut_off)
+    pruned = 0
+    for a in sg.get_attackers():
+        pruned = pruned + enum.enumerate(a, ap)
+    log.info("Found %s paths, pruned %s subtrees", len(ap), pruned)
+    return ap, pruned
+
+# attacker x target matrix of the summed PRisk of the kept paths
+def print_attacker_risk(sg, attk_risk):
+    print("-------------risk per attacker (rows) and target (columns)-------------")
+    print("", *[ sg.vertex_label[c] for c in sg.get_targets() ], sep="\t")
+    for row,a in enumerate(sg.get_attackers()):
+        print(sg.vertex_label[a], *attk_risk[row].tolist(), sep="\t")
+
+# scores: {target: (prob, impt, risk)} of the paths of paths (see incremental)
+def path_stats(sg, N1, N2, args, out=None, paths=None, scores=None):
+    shift=0.0
+    dropped_paths = 0
+    mode_of_nodes_list = prepare_paths(sg, args)
+    nmfile = None
+    if args.nodemode_file != '' and len(mode_of_nodes_list) > 0:
+        nmfile = open(args.nodemode_file, "w")
 
     # create a new probability calculator
     pcalc=pc.prob_calculator(sg, args)
-    for c in sg.get_targets():
-        ap = []
-        print("Detecting paths...")
-        for a in sg.get_attackers():
-            cutoff=max( 50, int( float( len( sg.get_nodes().get())) *0.85 ))
-            ap.extend( all_paths(sg.g, a, c, cutoff=cutoff, edges=False) )
+    attk_risk = None
+    prune = (args.engine == "pruned")
+    if prune and args.cut_off <= 0.0:
+        log.warning("WARNING: --engine pruned without a -C cut-off has nothing to prune, using the path enumeration")
+        prune = False
+    if prune and not pcalc.no_shift:
+        log.warning("The normalizing shift is detected from the paths above the cut-off only")
+    if args.multi_target:
+        if paths == None:
+            paths = {}
+        if not prune:
+            enumerate_targets(sg, paths, args.path_trie, args.workers)
+        attk_risk = numpy.zeros( (len(sg.get_attackers()), len(sg.get_targets())) )
+        attk_row = numpy.full(sg.g.num_vertices(), -1)
+        attk_row[ [ int(a) for a in sg.get_attackers() ] ] = numpy.arange(len(sg.get_attackers()))
+    for col,c in enumerate(sg.get_targets()):
+        pruned = None
+        if prune:
+            (ap, pruned) = pruned_paths(sg, c, pcalc, args)
+        else:
+            ap = enumerate_paths(sg, c, paths, args.path_trie, args.workers)
 
         if len(ap)<2:
             if len(ap) > 0:
-                print(ap[0])
-            print("Only {} paths found. Can't perform statistics on that".format(len(ap)) )
+                log.warning("%s", ap[0])
+            log.warning("Only %s paths found. Can't perform statistics on that", len(ap))
             if not args.no_graph:
                 sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
             continue
 
         # shift finder with all paths because path_prob may depend on detected shift
-        shift = pcalc.find_shift(ap)
+        shift = pcalc.find_shift_hist( ps.length_hist(ap.lengths()) )
 
         #path probabilities of all paths and cut-off filtering
-        list_prob=[]
-        list_impt=[]
-        list_vrisk=[]
-        list_prisk=[]
-        filtered_ap=[]
-        replace_ap = False
-        print("calculating path probabilities...")
-        for path in tqdm(ap, desc="PathProbs"):
-            if not has_loop(path):
-                (pprob, pimpt, risk) = pcalc.path_risk(path, shift)
-                if pprob >= args.cut_off:
-                    list_prob.append(pprob)
-                    list_impt.append(pimpt)
-                    list_vrisk.append(risk)
-                    list_prisk.append(pprob * pimpt)
-                    filtered_ap.append(path)
-                else:
-                    dropped_paths = dropped_paths + 1
-                    replace_ap = True
+        log.info("calculating path probabilities...")
+        loops = ap.loops()
+        for pidx in numpy.flatnonzero(loops):
+            log.warning("THIS PATH HAS A LOOP: %s", ap[pidx])
+        if scores != None and int(c) in scores:
+            (pprob, pimpt, risk) = scores[int(c)]
+        else:
+            if isinstance(ap, pt.PathTrie):
+                (pprob, pimpt, risk) = pcalc.trie_scores(ap, shift)
             else:
-                print("THIS PATH HAS A LOOP:",path)
-        if replace_ap == True:
-            ap = filtered_ap
-
-        print("processing path lengths...")
-        lengths = [len(i) for i in ap]
+                (pprob, pimpt, risk) = pcalc.path_scores(ap, shift)
+            if scores != None:
+                scores[int(c)] = (pprob, pimpt, risk)
+        keep = ~loops & (pprob >= args.cut_off)
+        dropped_paths = dropped_paths + int(numpy.count_nonzero(~loops & ~keep))
+        list_prob = pprob[keep].tolist()
+        list_impt = pimpt[keep].tolist()
+        list_vrisk = risk[keep].tolist()
+        list_prisk = (pprob[keep] * pimpt[keep]).tolist()
+        ens = None
+        if args.error_replicates > 0:
+            # the replicates are scored on the flat paths
+            ens = noise_ensemble(sg, pcalc, pt.as_store(ap), ~loops, shift, args)
+        # the statistics work on a trie directly, only the printed paths are
+        # materialized
+        if isinstance(ap, pt.PathTrie):
+            ap = ap.select(keep)
+        elif not numpy.all(keep):
+            ap = ap.take(keep)
+
+        if attk_risk is not None:
+            first = ap.first_vertices()
+            attk_risk[:,col] = numpy.bincount( attk_row[first], weights=pprob[keep] * pimpt[keep],
+                                               minlength=len(attk_risk) )
+
+        log.info("processing path lengths...")
+        lengths = ap.lengths()
+        lhist = ps.length_hist(lengths)
 
         # count paths through nodes to use as vertex size
         # for n in range(0, len(sg.get_nodes().get())):
@@ -421,60 +540,92 @@ def path_stats(sg, N1, N2, args):
         #     sg.vertex_paths[n] = math.log(sg.vertex_paths[n])
         # print([ sg.vertex_paths[n] for n in range(0, len(sg.get_nodes().get())) ])
 
-        minplen=min(lengths)
-        maxplen=max(lengths)
-        spa=[]
-        lpa=[]
-        for x in ap:
-            if len(x) == minplen:
-                spa.append(x)
-            if len(x) == maxplen:
-                lpa.append(x)
-        # spa=[x for x in ap if len(x)==minplen]
-        # lpa=[x for x in ap if len(x)==maxplen]
+        minplen=int(lengths.min())
+        maxplen=int(lengths.max())
+        nspa=int(numpy.count_nonzero(lengths == minplen))
+        nlpa=int(numpy.count_nonzero(lengths == maxplen))
+        spa=ap.take( numpy.flatnonzero(lengths == minplen)[0:MAX_PATHS] )
+        lpa=ap.take( numpy.flatnonzero(lengths == maxplen)[0:MAX_PATHS] )
+
+        #Path statistics (the path_agg helpers give exactly the values of
+        # statistics.mean/stdev/median on the list of lengths)
+        log.info("calculating mean PL...")
+        mean = pa.hist_mean(lhist)
+        log.info("calculating stdev of PL...")
+        stdev = pa.hist_stdev(lhist)
+        log.info("calculating median of PL...")
+        median = pa.hist_median(lhist)
+        log.info("calculating modes of nodes in paths...")
+        (nhist, fst_val, tiers) = find_modes(ap, sg.get_vertices(), args.modes)
+        # print(nhist)
+
+        #Union of path probabilities
+        list_comp = [(1-x) for x in list_prob]
+        inter = numpy.prod(list_comp)
+        union = 1.0 - inter
+        hist,bins = numpy.histogram( lengths, bins=range(minplen, maxplen+2) )
+
+        if out != None:
+            nodes = []
+            for node in mode_of_nodes_list:
+                node_pids = ap.paths_with(node)
+                nodes.append( (node, len(node_pids), pa.hist_median( ps.length_hist(lengths[node_pids]) )) )
+                if nmfile != None and len(node_pids) > 0:
+                    write_node_paths(sg, nmfile, c, node, ap.take(node_pids))
+            summary = target_summary(sg, c, {
+                "paths": len(lengths),
+                "shortest": minplen, "shortest_paths": nspa,
+                "longest": maxplen, "longest_paths": nlpa,
+                "mean": mean, "stdev": stdev, "median": median,
+                "mode": pa.hist_multimode(lhist),
+                "dropped": dropped_paths,
+                "shift": pcalc.getshift(),
+                "p_total": union, "avg_prob": statistics.mean(list_prob),
+                "exploitability": N1*union,
+                "impact": minmaxavg( (min(list_impt), max(list_impt), statistics.mean(list_impt)) ),
+                "vrisk": minmaxavg( (min(list_vrisk), max(list_vrisk), statistics.mean(list_vrisk)) ),
+                "prisk": minmaxavg( (min(list_prisk), max(list_prisk), statistics.mean(list_prisk)) ),
+                "risk": sum(list_prisk) }, fst_val, tiers, bins[:-1], hist, nodes)
+            if ens != None:
+                summary["noise"] = ens
+            if pruned != None:
+                summary["pruned"] = pruned
+            if attk_risk is not None:
+                summary["attacker_risk"] = { sg.vertex_label[a]:attk_risk[row,col] for row,a in enumerate(sg.get_attackers()) }
+            out.add_target( summary,
+                { "lengths": lengths, "prob": pprob[keep], "impact": pimpt[keep],
+                  "vrisk": risk[keep], "prisk": pprob[keep] * pimpt[keep] } )
+            continue
 
         print("---------shortest{}/{} paths-------------".format(MAX_PATHS,len(ap)))
-        for path in spa[0:MAX_PATHS]:
+        for path in spa:
             print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
 
         print("---------first{}/{} paths-------------".format(MAX_PATHS,len(ap)))
         for path in sorted(ap[0:MAX_PATHS], key=len):
-            print([sg.get_nodes().get()[ sg.node_index[m] ].nname() for m in path[1:]], pcalc.path_risk(path, shift))
+            print([sg.node_name(m) for m in path[1:]], pcalc.path_risk(path, shift))
 
         print("-----------longest paths-------------")
-        for path in lpa[0:MAX_PATHS]:
+        for path in lpa:
             print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
 
-        #Path statistics
-        print("calculating mean PL...")
-        mean = statistics.mean(lengths)
-        print("calculating stdev of PL...")
-        stdev = statistics.stdev(lengths)
-        print("calculating median of PL...")
-        median = statistics.median(lengths)
-        print("calculating modes of nodes in paths...")
-        (nhist, fst_val, first, second, third) = find_modes(ap, sg.get_vertices())
-        # print(nhist)
-
         sg.explain_labels()
         print("=============================================================")
         print("Critical node = ",sg.vertex_label[c])
         print("Number of paths = ",len(lengths))
-        print("Shortest path length = {} ({})".format(minplen, len(spa)) )
-        print("Longest path length = {} ({})".format(maxplen, len(lpa)) )
+        print("Shortest path length = {} ({})".format(minplen, nspa) )
+        print("Longest path length = {} ({})".format(maxplen, nlpa) )
         print("Mean of path lengths = ",mean)
         print("Normalized mean = ",mean/len(lengths))
         print("Std. deviation = ",stdev)
         print("Range = ",mean-stdev, mean+stdev)
         print("Median of paths = ",median)
-        print("Mode of paths = ",statistics.multimode(lengths))
+        print("Mode of paths = ",pa.hist_multimode(lhist))
         print("Dropped paths = ",dropped_paths)
+        if pruned != None:
+            print("Pruned subtrees = ",pruned)
 
         print("Normalizing Shift = ", pcalc.getshift())
-        #Union of path probabilities
-        list_comp = [(1-x) for x in list_prob]
-        inter = numpy.prod(list_comp)
-        union = 1.0 - inter
         print("P_total = ", union, " avg_pp:", statistics.mean(list_prob))
 
         #Metrics
@@ -499,64 +650,390 @@ def path_stats(sg, N1, N2, args):
         print("Risk score   = ", sum(list_prisk))
 
         print("---------------modes---------------")
-        if len(first) > 0:
-            print("1.Mode:", [sg.vertex_label[i] for i in first ], "(",fst_val[0],")")
-        if len(second) > 0:
-            print("2.Mode:", [sg.vertex_label[i] for i in second ], "(",fst_val[1],")")
-        if len(third) > 0:
-            print("3.Mode:", [sg.vertex_label[i] for i in third ], "(",fst_val[2],")")
+        for idx,tier in enumerate(tiers):
+            print("{}.Mode:".format(idx+1), [sg.vertex_label[i] for i in tier ], "(",fst_val[idx],")")
         if not args.no_graph:
             sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
 
         print("-------------histogram data (bin, frequency, bin-scaled, peak-norm, path-norm)---------------")
-        # plens=[ len(x) for x in ap ]
-        hist,bins = numpy.histogram( lengths, bins=range(minplen, maxplen+2) )
         xscale = PNORM_BINS/(maxplen-minplen)
         yscale = PNORM_PEAK/(max(hist))
         for idx,h in enumerate(hist):
             print( bins[idx], h, (bins[idx] - minplen) * xscale, h * yscale, h/len(lengths) )
         if sum(hist) != len(lengths):
-            print("HISTOGRAM NUMBER OF PATHS DIFFER FROM DETECTED PATHS:", sum(hist), len(lengths))
+            log.warning("HISTOGRAM NUMBER OF PATHS DIFFER FROM DETECTED PATHS: %s %s", sum(hist), len(lengths))
 
         print("---------------other-----------------")
         if len(mode_of_nodes_list) > 0:
             for node in mode_of_nodes_list:
-                node_mode_ls = [x for x in ap if node in x]
-                node_mode = len(node_mode_ls)
-                nmlen = [len(i) for i in node_mode_ls]
+                node_pids = ap.paths_with(node)
+                node_mode = len(node_pids)
                 if node_mode > 0:
-                    print("Paths via:",sg.get_nodes().get()[ sg.node_index[node] ].nname(),":",node_mode, "; median len:", statistics.median(nmlen))
-                    if node_mode < 20:
-                        for path in node_mode_ls:
-                            print([( sg.get_nodes().get()[ sg.node_index[m] ].nname(),
-                                     sg.get_nodes().get()[ sg.node_index[m] ].nprobability() )
-                                   for m in path[0:] ])
-                            # print([sg.vertex_label[m] for m in path])
+                    nmlen = ps.length_hist( lengths[node_pids] )
+                    print("Paths via:",sg.node_name(node),":",node_mode, "; median len:", pa.hist_median(nmlen))
+                    print_node_paths(sg, ap.take(node_pids[0:args.nodemode_paths]), node_mode)
+                    if nmfile != None:
+                        write_node_paths(sg, nmfile, c, node, ap.take(node_pids))
                 else:
-                    print("No paths via:", sg.get_nodes().get()[ sg.node_index[node] ].nname())
+                    print("No paths via:", sg.node_name(node))
                 print("---------------------------------------------")
 
+        if ens != None:
+            print_noise_ensemble(ens)
+
         # filter blast-radius graph
         if not args.no_graph:
             sg.blast_radius_draw( ap )
+    if attk_risk is not None and out == None:
+        print_attacker_risk(sg, attk_risk)
+    if nmfile != None:
+        nmfile.close()
+
+# single pass version of path_stats: the all_paths generator is consumed once
+# and only running aggregates (plus a few paths for printing) are kept
+def stream_path_stats(sg, N1, N2, args, out=None):
+    dropped_paths = 0
+    mode_of_nodes_list = prepare_paths(sg, args)
+
+    pcalc=pc.prob_calculator(sg, args)
+    # paths are scored with the cmdline shift, the detected one is only reported
+    shift = pcalc.getargshift()
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    ctx = pp.StreamContext(sg.g, pcalc, shift, args.cut_off, cutoff, MAX_PATHS,
+                           mode_of_nodes_list, args.nodemode_paths, not args.no_graph)
+    for c in sg.get_targets():
+        log.info("Detecting paths and calculating path probabilities...")
+        (agg, dropped) = pp.stream_target(ctx, sg.get_attackers(), c, args.workers)
+        dropped_paths = dropped_paths + dropped
+
+        if agg.raw_count()<2:
+            if agg.raw_count() > 0:
+                log.warning("%s", agg.first_path())
+            log.warning("Only %s paths found. Can't perform statistics on that", agg.raw_count())
+            if not args.no_graph:
+                sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
+            continue
+
+        pcalc.find_shift_hist(agg.raw_histogram())
+        print_path_summary(sg, c, agg, pcalc, shift, dropped_paths, mode_of_nodes_list, args, out)
+        if not args.no_graph:
+            sg.blast_radius_reset()
+            for e in agg.path_edges():
+                sg.blast_radius_mark(e)
+            sg.blast_radius_show()
+
+# exact path statistics by dynamic programming on acyclic graphs (see dag_engine)
+def dag_path_stats(sg, N1, N2, args, out=None, paths=None, scores=None):
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    reason = None
+    if args.edge_graph:
+        reason = "not supported for the conjugated graph (-e)"
+    elif args.cut_off != 0.0:
+        reason = "the path cut-off (-C) needs individual path probabilities"
+    elif not is_DAG(sg.g):
+        reason = "the graph has cycles (try -u with acyclic layer links)"
+    elif de.longest_path(sg.g, sg.get_attackers()) > cutoff+1:
+        reason = "paths exceed the path length cut-off of the enumeration"
+    if reason != None:
+        log.warning("DAG engine not applicable: %s - falling back to path enumeration", reason)
+        path_stats(sg, N1, N2, args, out, paths, scores)
+        return
+
+    dropped_paths = 0
+    mode_of_nodes_list = prepare_paths(sg, args)
+    pcalc=pc.prob_calculator(sg, args)
+    shift = pcalc.getargshift()
+    log.info("Running DAG path statistics...")
+    (vprob, vimpt, const_risk) = pcalc.vertex_arrays(shift)
+    dag = de.DagEngine(sg.g, sg.get_attackers(), vprob, vimpt, const_risk)
+    for c in sg.get_targets():
+        res = dag.analyze(c, mode_of_nodes_list, MAX_PATHS)
+        if res.count()<2:
+            log.warning("Only %s paths found. Can't perform statistics on that", res.count())
+            if not args.no_graph:
+                sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
+            continue
+
+        pcalc.find_shift_hist(res.histogram())
+        print_path_summary(sg, c, res, pcalc, shift, dropped_paths, mode_of_nodes_list, args, out)
+        if not args.no_graph:
+            sg.blast_radius_reset()
+            for e in res.path_edges():
+                sg.blast_radius_mark(e)
+            sg.blast_radius_show()
+
+# print the statistics block of the path analysis from a result object that
+# provides the accessors of path_agg.PathAggregator (stream and dag engines)
+# or pass them to the -o writers
+def print_path_summary(sg, c, res, pcalc, shift, dropped_paths, mode_of_nodes_list, args, out=None):
+    (minplen, nspa, spa) = res.shortest()
+    (maxplen, nlpa, lpa) = res.longest()
+    npaths = res.count()
+    if out != None:
+        bins = pa.hist_bins(res.histogram())
+        nodes = []
+        for node in mode_of_nodes_list:
+            nhist = res.node_stats(node)[0]
+            nodes.append( (node, pa.hist_count(nhist), pa.hist_median(nhist)) )
+        union = res.p_total()
+        out.add_target( target_summary(sg, c, {
+            "paths": npaths,
+            "shortest": minplen, "shortest_paths": nspa,
+            "longest": maxplen, "longest_paths": nlpa,
+            "mean": res.mean(), "stdev": res.stdev(), "median": res.median(),
+            "mode": res.multimode(),
+            "dropped": dropped_paths,
+            "shift": pcalc.getshift(),
+            "p_total": union, "avg_prob": res.avg_prob(),
+            "exploitability": N1*union,
+            "impact": minmaxavg(res.impact()),
+            "vrisk": minmaxavg(res.vrisk_stats()),
+            "prisk": minmaxavg(res.prisk_stats()),
+            "risk": res.risk() }, *res.modes(args.modes),
+            [ b for b,_ in bins ], [ h for _,h in bins ], nodes) )
+        return
+    print("---------shortest{}/{} paths-------------".format(MAX_PATHS,npaths))
+    for path in spa:
+        print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
+
+    print("---------first{}/{} paths-------------".format(MAX_PATHS,npaths))
+    if res.first() == None:
+        print("(not available without the path enumeration)")
+    else:
+        for path in sorted(res.first(), key=len):
+            print([sg.node_name(m) for m in path[1:]], pcalc.path_risk(path, shift))
+
+    print("-----------longest paths-------------")
+    for path in lpa:
+        print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
+
+    mean = res.mean()
+    stdev = res.stdev()
+    (fst_val, tiers) = res.modes(args.modes)
+
+    sg.explain_labels()
+    print("=============================================================")
+    print("Critical node = ",sg.vertex_label[c])
+    print("Number of paths = ",npaths)
+    print("Shortest path length = {} ({})".format(minplen, nspa) )
+    print("Longest path length = {} ({})".format(maxplen, nlpa) )
+    print("Mean of path lengths = ",mean)
+    print("Normalized mean = ",mean/npaths)
+    print("Std. deviation = ",stdev)
+    print("Range = ",mean-stdev, mean+stdev)
+    print("Median of paths = ",res.median())
+    print("Mode of paths = ",res.multimode())
+    print("Dropped paths = ",dropped_paths)
+
+    print("Normalizing Shift = ", pcalc.getshift())
+    union = res.p_total()
+    print("P_total = ", union, " avg_pp:", res.avg_prob())
+
+    exploitability = N1*union
+    print("Exploitability = ", exploitability)
+    print("Impact = (min: {}; max: {}; avg:{})".format( *res.impact() ))
+    print("VRisk = (min: {}; max: {}; avg:{})".format( *res.vrisk_stats() ))
+    print("PRisk = (min: {}; max: {}; avg:{})".format( *res.prisk_stats() ))
+    print("Risk score   = ", res.risk())
+
+    print("---------------modes---------------")
+    for idx,tier in enumerate(tiers):
+        if len(tier) > 0:
+            print("{}.Mode:".format(idx+1), [sg.vertex_label[i] for i in tier ], "(",fst_val[idx],")")
+    if not args.no_graph:
+        sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
+
+    print("-------------histogram data (bin, frequency, bin-scaled, peak-norm, path-norm)---------------")
+    bins = pa.hist_bins(res.histogram())
+    xscale = PNORM_BINS/(maxplen-minplen)
+    yscale = PNORM_PEAK/(max([ h for _,h in bins ]))
+    for b,h in bins:
+        print( b, h, (b - minplen) * xscale, h * yscale, h/npaths )
+
+    print("---------------other-----------------")
+    for node in mode_of_nodes_list:
+        (nhist, npaths_via) = res.node_stats(node)
+        node_mode = pa.hist_count(nhist)
+        if node_mode > 0:
+            print("Paths via:",sg.node_name(node),":",node_mode, "; median len:", pa.hist_median(nhist))
+            print_node_paths(sg, npaths_via, node_mode)
+        else:
+            print("No paths via:", sg.node_name(node))
+        print("---------------------------------------------")
+
+# Monte Carlo estimate of the path statistics (see path_sample)
+def sample_path_stats(sg, N1, N2, args, out=None):
+    mode_of_nodes_list = prepare_paths(sg, args)
+    pcalc=pc.prob_calculator(sg, args)
+    shift = pcalc.getargshift()
+    rng = numpy.random.default_rng(args.seed)
+    cutoff=max( 50, int( float( sg.num_nodes()) *0.85 ))
+    for c in sg.get_targets():
+        sampler = psm.PathSampler(sg.g, sg.get_attackers(), c, cutoff, rng)
+        st = psm.SampleStats(len(sg.get_vertices()), MAX_PATHS, mode_of_nodes_list)
+        log.info("Sampling paths...")
+        while st.samples() < args.samples:
+            for _ in range( min(psm.SAMPLE_BATCH, args.samples - st.samples()) ):
+                (path, weight) = sampler.walk()
+                if weight == 0.0:
+                    st.add(path, 0.0)
+                    continue
+                scores = pcalc.path_risk(path, shift)
+                st.add(path, weight, scores, scores[0] >= args.cut_off)
+            if args.rel_error > 0.0 and st.rel_error() <= args.rel_error:
+                break
+
+        if st.hits() == 0 or st.count()[0] == 0.0:
+            log.warning("No paths found in %s samples. Can't perform statistics on that", st.samples())
+            continue
 
-#function to calculate path probability of single path
-def path_probl(path_index, vertex_probability, shift=0.0):
-    prob = 1.0
-    for i in path_index:
-        prob = prob * vertex_probability[i]
-    return prob
+        pcalc.find_shift_hist(st.raw_histogram())
+        (minplen, spa) = st.shortest()
+        (maxplen, lpa) = st.longest()
+        if out != None:
+            hist = st.histogram()
+            bins = list(range(minplen, maxplen+1))
+            (vals, cis, tiers) = st.modes(args.modes)
+            (union, union_ci) = st.p_total()
+            summary = target_summary(sg, c, {
+                "samples": st.samples(), "hits": st.hits(),
+                "paths": st.count()[0], "paths_ci": st.count()[1],
+                "shortest": minplen, "longest": maxplen,
+                "mean": st.mean()[0], "mean_ci": st.mean()[1],
+                "stdev": st.stdev(), "stdev_ci": st.stdev_ci(),
+                "median": st.median(), "median_ci": st.median_ci(),
+                "mode": [st.mode()], "mode_ci": st.mode_ci(),
+                "dropped": st.dropped()[0], "dropped_ci": st.dropped()[1],
+                "shift": pcalc.getshift(),
+                "p_total": union, "p_total_ci": union_ci,
+                "avg_prob": st.avg_prob()[0], "avg_prob_ci": st.avg_prob()[1],
+                "exploitability": N1*union, "exploitability_ci": N1*union_ci,
+                "impact": minmaxavg(st.impact()),
+                "vrisk": minmaxavg(st.vrisk_stats()),
+                "prisk": minmaxavg(st.prisk_stats()),
+                "risk": st.risk()[0], "risk_ci": st.risk()[1] }, vals, tiers,
+                bins, [ hist.get(b, (0.0, 0.0))[0] for b in bins ],
+                [ (node,)+st.node_stats(node) for node in mode_of_nodes_list ])
+            for mode,ci in zip(summary["modes"], cis):
+                mode["paths_ci"] = ci
+            summary["hist_ci"] = [ hist.get(b, (0.0, 0.0))[1] for b in bins ]
+            out.add_target(summary)
+            continue
+
+        print("---------shortest{} sampled paths-------------".format(MAX_PATHS))
+        for path in spa:
+            print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
+        print("-----------longest sampled paths-------------")
+        for path in lpa:
+            print([sg.vertex_label[m] for m in path], pcalc.path_risk(path, shift))
+
+        (npaths, npaths_ci) = st.count()
+        (mean, mean_ci) = st.mean()
+        stdev = st.stdev()
+        sg.explain_labels()
+        print("=============================================================")
+        print("NOTE: sampled statistics. Values are estimates from {} samples ({} reached the target), shown with +/- 95% confidence intervals".format(st.samples(), st.hits()))
+        print("Critical node = ",sg.vertex_label[c])
+        print("Number of paths = {} +/- {}".format(npaths, npaths_ci))
+        print("Shortest path length = {} (sampled)".format(minplen) )
+        print("Longest path length = {} (sampled)".format(maxplen) )
+        print("Mean of path lengths = {} +/- {}".format(mean, mean_ci))
+        print("Normalized mean = ",mean/npaths)
+        print("Std. deviation = {} +/- {}".format(stdev, st.stdev_ci()))
+        print("Range = ",mean-stdev, mean+stdev)
+        print("Median of paths = {} +/- {}".format(st.median(), st.median_ci()))
+        print("Mode of paths = {} +/- {}".format([st.mode()], st.mode_ci()))
+        print("Dropped paths = {} +/- {}".format(*st.dropped()))
+
+        print("Normalizing Shift = ", pcalc.getshift())
+        (union, union_ci) = st.p_total()
+        print("P_total = {} +/- {}  avg_pp: {} +/- {}".format(union, union_ci, *st.avg_prob()))
+        print("Exploitability = {} +/- {}".format(N1*union, N1*union_ci))
+        print("Impact = (min: {}; max: {}; avg:{} +/- {})".format( *st.impact() ))
+        print("VRisk = (min: {}; max: {}; avg:{} +/- {})".format( *st.vrisk_stats() ))
+        print("PRisk = (min: {}; max: {}; avg:{} +/- {})".format( *st.prisk_stats() ))
+        print("Risk score   = {} +/- {}".format( *st.risk() ))
+
+        print("---------------modes---------------")
+        (vals, cis, tiers) = st.modes(args.modes)
+        for idx,tier in enumerate(tiers):
+            if len(tier) > 0:
+                print("{}.Mode:".format(idx+1), [sg.vertex_label[i] for i in tier ], "(",vals[idx],"+/-",cis[idx],")")
+        if not args.no_graph:
+            sg.draw(vsize=15, fsize=16, osize=[1500,1000], target=c, sources=sg.attk_nodes)
+
+        print("-------------histogram data (bin, frequency, bin-scaled, peak-norm, path-norm, frequency-ci)---------------")
+        hist = st.histogram()
+        peak = max([ h for h,_ in hist.values() ])
+        xscale = PNORM_BINS/max(1, maxplen-minplen)
+        for b in range(minplen, maxplen+1):
+            (h, ci) = hist.get(b, (0.0, 0.0))
+            print( b, h, (b - minplen) * xscale, h * PNORM_PEAK/peak, h/npaths, ci )
+
+        print("---------------other-----------------")
+        for node in mode_of_nodes_list:
+            (node_mode, nmedian) = st.node_stats(node)
+            if node_mode > 0:
+                print("Paths via:",sg.node_name(node),":",node_mode, "; median len:", nmedian)
+            else:
+                print("No sampled paths via:", sg.node_name(node))
+            print("---------------------------------------------")
+
+# distribution of P_total, risk score and node modes over --error_replicates
+# noise draws of -E (see error_ensemble)
+def noise_ensemble(sg, pcalc, ap, valid, shift, args):
+    log.info("Scoring %s noise replicates...", args.error_replicates)
+    rng = numpy.random.default_rng(args.seed)
+    (vprob, vimpt) = ee.noise_matrix(rng, args.error, args.error_replicates,
+                                     pcalc.vprob, pcalc.vimpact, sg.num_nodes())
+    ens = ee.Ensemble(pcalc, ap, valid, shift, args.cut_off, args.modes, vprob, vimpt)
+    (p_total, risk, modes, first) = ee.run(ens, args.workers)
+    order = numpy.argsort(-first, kind="stable")
+    return { "replicates": args.error_replicates, "error": args.error,
+             "p_total": ee.distribution(p_total),
+             "risk": ee.distribution(risk),
+             "modes": [ ee.distribution(modes[:,k]) for k in range(modes.shape[1]) ],
+             "first_mode": [ { "node": sg.vertex_label[v], "share": float(first[v]/args.error_replicates) }
+                             for v in order if first[v] > 0 ] }
+
+def print_noise_ensemble(ens):
+    def dist(d):
+        return "; ".join([ "{}: {}".format(k, v) for k,v in d.items() ])
+    print("---------------noise ensemble ({} replicates, -E {})---------------".format(ens["replicates"], ens["error"]))
+    print("P_total = ({})".format(dist(ens["p_total"])))
+    print("Risk score = ({})".format(dist(ens["risk"])))
+    for idx,mode in enumerate(ens["modes"]):
+        print("{}.Mode = ({})".format(idx+1, dist(mode)))
+    print("1.Mode nodes (share of replicates):", [ (m["node"], m["share"]) for m in ens["first_mode"] ])
+
+# (min, max, avg[, ci]) as dict
+def minmaxavg(vals):
+    return dict(zip(["min", "max", "avg", "avg_ci"], vals))
+
+# summary of one target for the -o writers (see results)
+#  stats: the statistics of the report
+#  vals/tiers: node modes (see path_agg.mode_tiers)
+#  nodes: [ (-M node, number of paths via node, median length) ]
+def target_summary(sg, c, stats, vals, tiers, bins, counts, nodes):
+    summary = { "target": sg.vertex_label[c] }
+    summary.update(stats)
+    summary["modes"] = [ { "nodes": [ sg.vertex_label[i] for i in tier ], "paths": val }
+                         for val,tier in zip(vals, tiers) if len(tier) > 0 ]
+    summary["hist_bins"] = list(bins)
+    summary["hist_counts"] = list(counts)
+    summary["nodes"] = [ { "node": sg.node_name(node), "paths": npaths, "median": median }
+                         for node,npaths,median in nodes ]
+    return summary
 
 def tree_stats(sg, N1, N2, args):
     csall=[]
     vulnerable_nodes=[]
     protected_nodes=[]
-    shift=0.0
     if not args.no_graph:
         sg.draw(vsize=15, fsize=16, osize=[1500,1000])
 
+    engine = te.TreeEngine(sg.g, sg.vertex_probability.get_array())
     for c in sg.get_targets():
-        list_paths = []
         tree = min_spanning_tree(sg.g, root=c)
 
         #Derive tree
@@ -569,37 +1046,32 @@ def tree_stats(sg, N1, N2, args):
         #     sg.vertex_fill_color[p] = (0/255.0, 255.0/255.0, 0/255.0, 1)
 
 
-        for v in sg.g.vertices():
-            for path in all_paths(u,v,c):
-                list_paths.append(path)
-        lengths = [len(i) for i in list_paths]
-        if len(list_paths) > 0:
+        # paths of all vertices to c from one search over the tree (the
+        # spanning tree has no cycles, so there is no path from c back to c)
+        (verts, lengths, probs) = engine.paths(tree, c)
+        if len(verts) > 0:
 
-            #Path statistics
+            #Path statistics (the path_agg helpers give exactly the values of
+            # statistics.mean/stdev/median/mode on the list of lengths)
+            lhist = ps.length_hist(lengths)
+            minplen = int(lengths.min())
             sg.explain_labels()
-            mean = statistics.mean(lengths)
-            stdev = statistics.stdev(lengths)
-            median = statistics.median(lengths)
+            mean = pa.hist_mean(lhist)
+            stdev = pa.hist_stdev(lhist)
+            median = pa.hist_median(lhist)
             print("=============================================================")
             print("Critical node = ",sg.vertex_label[c])
             print("Number of paths = ",len(lengths))
-            print("Shortest path length = ",min(lengths))
+            print("Shortest path length = ",minplen)
             print("Mean of path lengths = ",mean)
             print("Normalized mean = ",mean/len(lengths))
             print("Std. deviation = ",stdev)
             print("Range = ",mean-stdev, mean+stdev)
             print("Median of paths = ",median)
-            print("Mode of paths = ",statistics.mode(lengths))
-
-            #path probabilities of all paths
-            list_prob=[]
-            for v in sg.g.vertices():
-                for path in all_paths(u,v,c):
-                    list_prob.append(path_probl(path,sg.vertex_probability, shift=shift))
+            print("Mode of paths = ",pa.hist_multimode(lhist)[0])
 
             #Union of path probabilities
-            list_comp = [1-x for x in list_prob]
-            inter = numpy.prod(list_comp)
+            inter = numpy.prod(1.0 - probs)
             union = 1.0 - inter
             print("P_total = ", union)
 
@@ -612,7 +1084,7 @@ def tree_stats(sg, N1, N2, args):
             print("Base score = ", exploitability+impact)
             csall.append(exploitability+impact)
 
-            print("CSV:", sg.vertex_label[c], len(lengths), min(lengths), mean, mean/len(lengths),
+            print("CSV:", sg.vertex_label[c], len(lengths), minplen, mean, mean/len(lengths),
               stdev, median, union, exploitability, impact, exploitability+impact )
 
         # draw the graph after the stats-print to see graph and stats side-by-side
@@ -643,11 +1115,25 @@ def tree_stats(sg, N1, N2, args):
         print("Total Base score mean = ", statistics.mean(csall))
 
 
-def main():
-
-    args = tools.cmdline()
+def compile_main(argv):
+    args = tools.compile_cmdline(argv)
+    tools.setup_logging(args.verbose, args.quiet)
     config = tools.StrongConfig(args)
+    mdl = md.build_yml(args.input_file, config, tools.cache_dir(args))
+    if mdl == None:
+        return -1
+    md.write(mdl, args.output)
+    log.info("Compiled model written to %s", args.output)
+    return 0
+
+# path or tree analysis of a model with the options of args
+def analyze(mdl, args, out=None, paths=None, scores=None):
+    sg = sec_graph(mdl)
+    sg.generate_graph(args.unidir)
+    analyze_graph(sg, args, out, paths, scores)
+    return sg
 
+def analyze_graph(sg, args, out=None, paths=None, scores=None):
     global MAX_PATHS
     MAX_PATHS=args.max_path
     global DEFAULT_PROBABILITY
@@ -655,27 +1141,274 @@ def main():
     global STRUCTURAL_SHIFT
     STRUCTURAL_SHIFT=args.structure_shift
 
+    if args.antype.lower() == "path":
+        if args.engine == "stream":
+            stream_path_stats(sg, N1, N2, args, out)
+        elif args.engine == "dag":
+            dag_path_stats(sg, N1, N2, args, out, paths, scores)
+        elif args.engine == "pruned":
+            # the pruned paths depend on the scores, they can't be shared
+            path_stats(sg, N1, N2, args, out)
+        elif args.engine == "sample":
+            sample_path_stats(sg, N1, N2, args, out)
+        else:
+            path_stats(sg, N1, N2, args, out, paths, scores)
+    else:
+        tree_stats(sg, N1, N2, args)
+
+# model of a yml file or compiled model
+def load_model(args, config):
+    if md.is_compiled(args.input_file):
+        return md.load(args.input_file, config, tools.cache_dir(args))
+    return md.build_yml(args.input_file, config, tools.cache_dir(args))
+
+# the -o files: -O or the input file with .results instead of its extension
+def result_files(args):
+    base = args.output_base
+    if base == "":
+        base = os.path.splitext(args.input_file)[0] + ".results"
+    return base, [ base + rs.OUTPUT_EXTENSIONS[f] for f in args.output.split(",") ]
+
+# -o files that would overwrite the input file or one of the model sources
+def result_conflicts(args, mdl):
+    sources = [ os.path.realpath(f) for f in watch_files(args, mdl) ]
+    return [ f for f in result_files(args)[1] if os.path.realpath(f) in sources ]
+
+# writers of the -o formats (None for pgt)
+def open_results(args):
+    if args.output == "pgt":
+        return None
+    return rs.ResultWriters(args.output.split(","), result_files(args)[0])
+
+# the files to watch: the input file and the sources of the model
+def watch_files(args, mdl):
+    files = [ os.path.abspath(args.input_file) ]
+    files.extend( [ src["path"] for src in mdl.sources() if src["path"] not in files ] )
+    return files
+
+# analyze the model again whenever one of its files changes (--watch)
+# paths, scores: of the previous analysis of sg (see incremental)
+def watch_model(args, config, sg, paths, scores):
+    mtimes = inc.source_mtimes( watch_files(args, sg.model) )
+    # incremental updates need the unmodified scores of the path enumeration
+    incremental = (args.engine in ["list", "dag"] and not args.edge_graph and args.error == 0.0
+                   and args.workers <= 1 and args.antype.lower() == "path")
+    log.info("Watching %s files for changes", len(mtimes))
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            current = inc.source_mtimes(list(mtimes))
+            if current == mtimes:
+                continue
+            log.info("Changed: %s", ", ".join([ f for f in mtimes if current[f] != mtimes[f] ]))
+            mtimes = current
+            start = time.time()
+            # (the files might be saved half-way, keep watching on any error)
+            try:
+                mdl = load_model(args, config)
+            except Exception as e:
+                log.error("Error: unable to load the changed model: %s", e)
+                continue
+            if mdl == None:
+                continue
+            conflicts = result_conflicts(args, mdl) if args.output != "pgt" else []
+            if len(conflicts) > 0:
+                log.error("Error: -o would overwrite the model file(s) %s, not analyzing the changed model", ", ".join(conflicts))
+                continue
+            new_sg = sec_graph(mdl)
+            new_sg.generate_graph(args.unidir)
+            if incremental:
+                pcalc = pc.prob_calculator(new_sg, args)
+                inc.update(sg, new_sg, pcalc, pc.prob_calculator(sg, args), pcalc.getargshift(), paths, scores)
+            else:
+                paths.clear()
+                scores.clear()
+            sg = new_sg
+            out = open_results(args)
+            print("===================== analysis of the changed model =====================")
+            analyze_graph(sg, args, out, paths, scores)
+            if out != None:
+                out.close()
+            sys.stdout.flush()
+            mtimes = inc.source_mtimes( watch_files(args, mdl) )
+            log.info("Analysis of the changed model took %.3f s", time.time()-start)
+    except KeyboardInterrupt:
+        pass
+
+# runs of the batch manifest for the forked workers (see batch_group)
+_batch = None
+
+# run a group of batch runs that share the graph structure, so the paths are
+# enumerated once and then scored with the scores of every run
+# returns [ (run index, table rows) ]
+def batch_group(group):
+    paths = {}
+    rows = []
+    for idx in group:
+        run = _batch[idx]
+        log.info("Batch run: %s", run["name"])
+        table = rs.TableRows(run["name"])
+        analyze(run["model"], run["args"], table, paths)
+        rows.append( (idx, table.get()) )
+    return rows
+
+def batch_main(argv):
+    global _batch
+    bargs = tools.batch_cmdline(argv)
+    tools.setup_logging(bargs.verbose, bargs.quiet)
+    runs = tools.read_manifest(bargs.manifest)
+    if runs == None:
+        return -1
+
+    # every model (file and score options) is loaded once, runs with the same
+    # graph structure and path options form a group
+    models = {}
+    groups = {}
+    for idx,run in enumerate(runs):
+        args = run["args"]
+        if args.antype.lower() != "path":
+            log.error("Error: %s: batch runs are only available for the path-based analysis", run["name"])
+            return -1
+        if args.output != "pgt":
+            log.warning("WARNING: %s: -o is ignored for batch runs", run["name"])
+        if bargs.jobs > 1 and args.workers > 1:
+            log.warning("WARNING: %s: -w is ignored with -j", run["name"])
+            args.workers = 1
+        args.no_graph = True
+        config = tools.StrongConfig(args)
+        mkey = (os.path.abspath(args.input_file), str(config.ModelKey()), tools.cache_dir(args))
+        if mkey not in models:
+            models[mkey] = load_model(args, config)
+            if models[mkey] == None:
+                log.error("Error: %s: unable to load %s", run["name"], args.input_file)
+                return -1
+        run["model"] = models[mkey]
+        skey = (run["model"].structure_key(), args.unidir, args.edge_graph)
+        groups.setdefault(skey, []).append(idx)
+    log.info("%s runs, %s models, %s graph structures", len(runs), len(models), len(groups))
+
+    _batch = runs
+    results = {}
+    if bargs.jobs > 1:
+        with multiprocessing.get_context("fork").Pool(bargs.jobs) as pool:
+            for rows in pool.imap_unordered(batch_group, list(groups.values())):
+                results.update(rows)
+    else:
+        for group in groups.values():
+            results.update( batch_group(group) )
+    _batch = None
+
+    table = []
+    for idx,run in enumerate(runs):
+        for row in results[idx]:
+            table.append( { "model": run["args"].input_file, **row } )
+    rs.write_table(bargs.output, table)
+    log.info("Results table written to %s", bargs.output)
+    return 0
 
-    ymldata = tools.load_files(args.input_file)
-    gr = sgr.StrongGraph(ymldata, config)
-    # gr.collapse_stencils()
-    print([ (g.gname(),g.gprobability()) for _,g in gr.groups.get().items() ])
-#    return -1
-
-    sg = sec_graph(gr)
+# score the paths of every target for all scenarios of a scenario file
+def sweep_main(argv):
+    args = tools.sweep_cmdline(argv)
+    tools.setup_logging(args.verbose, args.quiet)
+    if args.ignore_score or args.edge_graph or args.error != 0.0:
+        log.error("Error: -i, -e and -E are not available for sweeps")
+        return -1
+    scenarios = sw.read_scenarios(args.scenarios, args)
+    if scenarios == None:
+        return -1
+    config = tools.StrongConfig(args)
+    mdl = load_model(args, config)
+    if mdl == None:
+        return -1
 
+    vprob = sw.node_probabilities(mdl, scenarios, config.GGroupProb())
+    shift = [ sw.scenario_shift(sc) for sc in scenarios ]
+    sg = sec_graph(mdl)
     sg.generate_graph(args.unidir)
+    pcalc = pc.prob_calculator(sg, args)
+    log.info("Scoring %s scenarios", len(scenarios))
+    table = []
+    for c in sg.get_targets():
+        ap = enumerate_paths(sg, c, workers=args.workers)
+        if len(ap)<2:
+            log.warning("Only %s paths found. Can't perform statistics on that", len(ap))
+            continue
+        loops = ap.loops()
+        (pprob, pimpt, risk) = pcalc.path_scores_matrix(ap, vprob, shift)
+        for s,sc in enumerate(scenarios):
+            row = sw.scenario_row(s, sc)
+            keep = ~loops & (pprob[s] >= args.cut_off)
+            row["target"] = sg.vertex_label[c]
+            row["paths"] = int(numpy.count_nonzero(keep))
+            row["dropped"] = int(numpy.count_nonzero(~loops & ~keep))
+            if row["paths"] > 0:
+                list_prob = pprob[s][keep].tolist()
+                list_impt = pimpt[s][keep].tolist()
+                list_vrisk = risk[s][keep].tolist()
+                list_prisk = (pprob[s][keep] * pimpt[s][keep]).tolist()
+                union = 1.0 - numpy.prod([ (1-x) for x in list_prob ])
+                row.update( rs.flatten( {
+                    "p_total": union, "avg_prob": statistics.mean(list_prob),
+                    "exploitability": N1*union,
+                    "impact": minmaxavg( (min(list_impt), max(list_impt), statistics.mean(list_impt)) ),
+                    "vrisk": minmaxavg( (min(list_vrisk), max(list_vrisk), statistics.mean(list_vrisk)) ),
+                    "prisk": minmaxavg( (min(list_prisk), max(list_prisk), statistics.mean(list_prisk)) ),
+                    "risk": sum(list_prisk) } ) )
+            table.append(row)
+    rs.write_table(args.table, table)
+    log.info("Results table written to %s", args.table)
+    return 0
 
-    if args.output == "pgt":
-        if args.antype.lower() == "path":
-            path_stats(sg, N1, N2, args)
-        else:
-            tree_stats(sg, N1, N2, args)
+def main():
+    if sys.argv[1:2] == ["compile"]:
+        return compile_main(sys.argv[2:])
+    if sys.argv[1:2] == ["batch"]:
+        return batch_main(sys.argv[2:])
+    if sys.argv[1:2] == ["sweep"]:
+        return sweep_main(sys.argv[2:])
+
+    args = tools.cmdline()
+    tools.setup_logging(args.verbose, args.quiet)
+    config = tools.StrongConfig(args)
+
+    if args.error_replicates > 0 and (args.error == 0.0 or args.engine != "list" or args.antype.lower() != "path"):
+        log.error("Error: --error_replicates needs -E and the path enumeration engine (--engine list)")
+        return -1
+
+    mdl = load_model(args, config)
+    if mdl == None:
+        return -1
+
+    # structured output instead of the printed report and the graph windows
+    out = None
+    if args.output != "pgt":
+        formats = args.output.split(",")
+        unknown = [ f for f in formats if f not in rs.OUTPUT_EXTENSIONS ]
+        if len(unknown) > 0:
+            log.error("Error: unrecognized/unimplemented output format: %s. -o <pgt|json,yml,npz>", ",".join(unknown))
+            return -1
+        if args.antype.lower() != "path":
+            log.error("Error: -o %s is only available for the path-based analysis", args.output)
+            return -1
+        conflicts = result_conflicts(args, mdl)
+        if len(conflicts) > 0:
+            log.error("Error: -o would overwrite the model file(s) %s, use -O to choose another name", ", ".join(conflicts))
+            return -1
+        out = open_results(args)
+        args.no_graph = True
+
+    paths = None
+    scores = None
+    if args.watch:
+        args.no_graph = True
+        paths = {}
+        scores = {}
+    sg = analyze(mdl, args, out, paths, scores)
+    if out != None:
+        out.close()
+    if args.watch:
+        sys.stdout.flush()
+        watch_model(args, config, sg, paths, scores)
     return 0
-# elif args.output == "yml":
-#     gdata.export_combined_yml(args.file)
-# else:
-#     print("Error: unrecognized/unimplemented export option. -o <pgt|yml>")
-#     return -1
 
 main()
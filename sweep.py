@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Scenarios of a group probability sweep (strong.py sweep).
+#
+# Scenario file:
+#   grid:                     # all combinations of the listed values
+#     groupA: [0.1, 0.5, 0.9]
+#     default_prob: [0.3, 0.5]
+#   scenarios:                # additional scenarios
+#     - {groupB: 0.2, group_priority: true}
+# Every key other than default_prob (-D), structure_shift (-s) and
+# group_priority (-G) is a group probability (-P). Values that are not set
+# by a scenario are taken from the cmdline.
+#
+# The node probabilities of all scenarios are derived from the model at once
+# (same rules as nodes.Node): the active group of a node is its group with the
+# highest priority, its probability is the one of the yml file, else the one of
+# the active group, else the default probability (-G: the group probability
+# takes priority).
+
+import itertools
+import numpy
+
+import groups
+import yml_loader
+from tools import log
+
+OPTION_KEYS = ["default_prob", "structure_shift", "group_priority"]
+
+
+# list of scenarios {"groups": {name: prob}, "default_prob": p,
+# "structure_shift": s, "group_priority": bool} or None
+def read_scenarios(fname, args):
+    data = yml_loader.load_yml(fname)
+    if not isinstance(data, dict):
+        data = {}
+    entries = []
+    grid = data.get("grid", {})
+    if len(grid) > 0:
+        keys = list(grid)
+        values = [ v if isinstance(v, list) else [v] for v in grid.values() ]
+        entries.extend( [ dict(zip(keys, combo)) for combo in itertools.product(*values) ] )
+    entries.extend( data.get("scenarios", []) )
+    if len(entries) == 0:
+        log.error("Scenario file %s has no grid or scenarios", fname)
+        return None
+
+    scenarios = []
+    for entry in entries:
+        scenarios.append( { "groups": { str(k):float(v) for k,v in entry.items() if k not in OPTION_KEYS },
+                            "default_prob": abs(float(entry.get("default_prob", args.default_prob))),
+                            "structure_shift": float(entry.get("structure_shift", args.structure_shift)),
+                            "group_priority": bool(entry.get("group_priority", args.group_prio)) } )
+    return scenarios
+
+# probability shift of a scenario (as prob_calc: -1.0 is no shift)
+def scenario_shift(sc):
+    if sc["structure_shift"] == -1.0:
+        return 0.0
+    return sc["structure_shift"]
+
+# cmdline group overrides ({name: (prob, prio)}, see StrongConfig) with the
+# groups of a scenario: new groups are added in the order of the scenario
+def scenario_overrides(base, sc):
+    ovrrd = dict(base)
+    for name,prob in sc["groups"].items():
+        if name in ovrrd:
+            ovrrd[name] = (prob, ovrrd[name][1])
+        else:
+            ovrrd[name] = (prob, len(ovrrd))
+    return ovrrd
+
+# matrix [scenario, node] of the node probabilities
+# base: the cmdline group overrides
+def node_probabilities(mdl, scenarios, base):
+    names = mdl.member_names()
+    nnodes = mdl.num_nodes()
+    (ptr, idx) = mdl.members()
+    member = numpy.zeros( (nnodes, len(names)), dtype=bool )
+    member[ numpy.repeat(numpy.arange(nnodes), numpy.diff(ptr)), idx ] = True
+
+    # priority and probability of every group per scenario (inf: not defined)
+    prio = numpy.full( (len(scenarios), len(names)), numpy.inf )
+    gprob = numpy.zeros( (len(scenarios), len(names)) )
+    for s,sc in enumerate(scenarios):
+        sgroups = groups.StrongGroups( mdl.yml_groups(), scenario_overrides(base, sc) )
+        for gidx,name in enumerate(names):
+            g = sgroups.find(name)
+            if g != None:
+                prio[s,gidx] = g.gpriority()
+                gprob[s,gidx] = g.gprobability()
+
+    # active group: member group with the lowest priority value
+    mprio = numpy.where( member[None,:,:], prio[:,None,:], numpy.inf )
+    active = numpy.argmin(mprio, axis=2)
+    has_group = numpy.isfinite( numpy.take_along_axis(mprio, active[:,:,None], axis=2)[:,:,0] )
+    active_prob = numpy.take_along_axis(gprob, active, axis=1)
+
+    yml = numpy.broadcast_to( mdl.yml_probabilities(), active.shape )
+    default = numpy.array([ sc["default_prob"] for sc in scenarios ])[:,None]
+    gprio = numpy.array([ sc["group_priority"] for sc in scenarios ])[:,None]
+    prob = numpy.where( yml == -1.0, numpy.where(has_group, active_prob, default), yml )
+    return numpy.where( gprio & has_group, active_prob, prob )
+
+# the scenario values of a table row
+def scenario_row(idx, sc):
+    row = { "scenario": idx }
+    row.update( sc["groups"] )
+    for key in OPTION_KEYS:
+        row[key] = sc[key]
+    return row
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# symbol table of the nodes: long names, short names and vertex ids
+# the vertex id of a node is its index in the node list (see model.build)
+class SymbolTable:
+    def __init__(self, longnames):
+        self.longnames = list(longnames)
+        self.longidx = { n:idx for idx,n in enumerate(self.longnames) }
+        self.shortidx = {}
+        self.shortnames = []
+
+    # add the short names (same order as the node list)
+    def set_short(self, shortnames):
+        self.shortnames = list(shortnames)
+        self.shortidx = { s:idx for idx,s in enumerate(self.shortnames) }
+
+    def __len__(self):
+        return len(self.longnames)
+    def __contains__(self, longname):
+        return longname in self.longidx
+
+    # vertex id of a long or short name (None if unknown)
+    def vertex(self, name):
+        if name in self.longidx:
+            return self.longidx[name]
+        return self.shortidx.get(name)
+
+    def longname(self, vertex):
+        return self.longnames[vertex]
+    def shortname(self, vertex):
+        return self.shortnames[vertex]
@@ -0,0 +1,116 @@
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+import random
+
+import pytest
+
+gt = pytest.importorskip("graph_tool.all")
+
+import path_agg as pa
+from dag_engine import DagEngine
+
+
+# random DAG: edges only go from lower to higher vertex numbers
+def random_dag(seed, nvertices, nedges):
+    rnd = random.Random(seed)
+    edges = set()
+    while len(edges) < nedges:
+        (s, t) = sorted(rnd.sample(range(nvertices), 2))
+        edges.add( (s, t) )
+    g = gt.Graph()
+    g.add_vertex(nvertices)
+    g.add_edge_list(sorted(edges))
+    q = [ rnd.uniform(0.1, 0.9) for _ in range(nvertices) ]
+    w = [ rnd.uniform(0.0, 5.0) for _ in range(nvertices) ]
+    return g, q, w
+
+def all_paths(g, attackers, c):
+    succs = {}
+    for s,t in g.get_edges()[:,0:2]:
+        succs.setdefault(int(s), []).append(int(t))
+    paths = []
+    todo = [ [a] for a in attackers ]
+    while len(todo) > 0:
+        path = todo.pop()
+        if path[-1] == c:
+            paths.append(path)
+        for t in succs.get(path[-1], []):
+            todo.append(path + [t])
+    return paths
+
+# path scores as in prob_calculator.path_risk: the first vertex does not count
+def path_scores(path, q, w):
+    prob = math.prod( q[v] for v in path[1:] )
+    impt = math.fsum( w[v] for v in path[1:] )
+    return prob, impt
+
+# the dynamic program gives the statistics of the enumerated paths
+def test_dag_brute_force():
+    for seed in range(10):
+        (g, q, w) = random_dag(seed, 14, 30)
+        attackers = [0, 1, 2]
+        dag = DagEngine(g, attackers, q, w)
+        for c in range(3, 14):
+            paths = all_paths(g, attackers, c)
+            if len(paths) == 0:
+                continue
+            stats = dag.analyze(c, nodemode=[5], maxpaths=100)
+            hist = {}
+            for path in paths:
+                pa.hist_add(hist, len(path))
+            scores = [ path_scores(path, q, w) for path in paths ]
+            probs = [ p for (p, i) in scores ]
+
+            assert stats.count() == len(paths)
+            assert stats.histogram() == { l:hist[l] for l in sorted(hist) }
+            assert stats.avg_prob() == pytest.approx(sum(probs) / len(paths), rel=1e-12)
+            assert stats.risk() == pytest.approx(sum( p*i for (p, i) in scores ), rel=1e-12)
+            (imin, imax, iavg) = stats.impact()
+            assert imin == pytest.approx(min( i for (p, i) in scores ), rel=1e-12)
+            assert imax == pytest.approx(max( i for (p, i) in scores ), rel=1e-12)
+            assert iavg == pytest.approx(sum( i for (p, i) in scores ) / len(paths), rel=1e-12)
+            inter = math.prod( 1.0 - p for p in probs )
+            assert stats.p_total() == pytest.approx(1.0 - inter, rel=1e-10)
+
+            counts = [0] * 14
+            for path in paths:
+                for v in path[1:-1]:
+                    counts[v] = counts[v] + 1
+            assert list(stats.vertex_counts()) == counts
+
+            nhist = {}
+            for path in paths:
+                if 5 in path:
+                    pa.hist_add(nhist, len(path))
+            assert stats.node_stats(5)[0] == { l:nhist[l] for l in sorted(nhist) }
+
+            (minlen, nmin, spa) = stats.shortest()
+            assert nmin == hist[minlen] and minlen == min(hist)
+            assert sorted(spa) == sorted( p for p in paths if len(p) == minlen )
+
+# the paths are reconstructed without recursion, also for very long paths
+def test_dag_long_chain():
+    n = 5000
+    g = gt.Graph()
+    g.add_vertex(n)
+    g.add_edge_list([ (v, v+1) for v in range(n-1) ])
+    dag = DagEngine(g, [0], [0.5] * n, [1.0] * n)
+    stats = dag.analyze(n-1, maxpaths=10)
+    (minlen, nmin, spa) = stats.shortest()
+    assert (minlen, nmin) == (n, 1)
+    assert spa == [ list(range(n)) ]
@@ -0,0 +1,80 @@
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+import statistics
+
+import path_agg as pa
+
+
+def random_lengths(seed, n):
+    rnd = random.Random(seed)
+    return [ rnd.randint(2, 12) for _ in range(n) ]
+
+def histogram(lengths):
+    hist = {}
+    for l in lengths:
+        pa.hist_add(hist, l)
+    return hist
+
+# the histogram helpers return exactly what statistics returns on the lengths
+def test_hist_stats():
+    for seed in range(20):
+        lengths = random_lengths(seed, 2 + seed*7)
+        hist = histogram(lengths)
+        assert pa.hist_count(hist) == len(lengths)
+        assert pa.hist_mean(hist) == statistics.mean(lengths)
+        assert type(pa.hist_mean(hist)) == type(statistics.mean(lengths))
+        assert pa.hist_stdev(hist) == statistics.stdev(lengths)
+        assert pa.hist_median(hist) == statistics.median(lengths)
+        assert pa.hist_multimode(hist) == statistics.multimode(lengths)
+
+def test_hist_stdev_large():
+    lengths = [ 10**9 + l for l in random_lengths(1, 1001) ]
+    assert pa.hist_stdev(histogram(lengths)) == statistics.stdev(lengths)
+
+def random_paths(seed, n, nvertices):
+    rnd = random.Random(seed)
+    paths = []
+    for _ in range(n):
+        path = rnd.sample(range(nvertices), rnd.randint(2, 8))
+        paths.append( (path, rnd.random(), rnd.random() * 10, rnd.random()) )
+    return paths
+
+def aggregate(paths, nvertices, nodemode):
+    agg = pa.PathAggregator(nvertices, 5, nodemode)
+    for (path, pprob, pimpt, risk) in paths:
+        agg.add_raw(path)
+        agg.add(path, pprob, pimpt, risk)
+    return agg
+
+def summary(agg):
+    return (agg.raw_histogram(), agg.first_path(), agg.histogram(), agg.vertex_counts().tolist(),
+            agg.shortest(), agg.longest(), agg.first(), agg.p_total(), agg.avg_prob(),
+            agg.impact(), agg.vrisk_stats(), agg.prisk_stats(), agg.risk(),
+            [ agg.node_stats(n) for n in agg.nodemode ])
+
+# merged aggregators of consecutive parts give the result of a single pass
+def test_merge():
+    nvertices = 30
+    paths = random_paths(3, 200, nvertices)
+    nodemode = [ 0, 7, 29 ]
+    single = aggregate(paths, nvertices, nodemode)
+    for cuts in [ [0, 200], [0, 1, 200], [0, 50, 51, 130, 200], list(range(0, 201, 10)) ]:
+        merged = aggregate(paths[cuts[0]:cuts[1]], nvertices, nodemode)
+        for i in range(1, len(cuts)-1):
+            merged.merge( aggregate(paths[cuts[i]:cuts[i+1]], nvertices, nodemode) )
+        assert summary(merged) == summary(single)
@@ -0,0 +1,79 @@
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+
+import pytest
+
+pytest.importorskip("graph_tool")
+
+import prob_calc
+
+
+def shift_calculator():
+    pc = prob_calc.prob_calculator.__new__(prob_calc.prob_calculator)
+    (pc.no_shift, pc.args_shift, pc.detected_shift) = (False, 0.0, 0.0)
+    return pc
+
+# the search of find_shift before it worked on a length histogram: steps of
+# decreasing size until P_total is within 1e-4 of 0.5
+def old_find_shift(pc, paths):
+    shift = 0.0
+    eps = 0.5
+    old_eps = pc.default_P_total(paths, default_prob=0.5) - 0.5
+    prev_shift_delta = -0.25
+    iter = 0
+    while abs(eps) > 0.0001 and iter < 20:
+        shift = shift + prev_shift_delta
+        eps = pc.default_P_total(paths, default_prob=0.5+shift) - 0.5
+        if abs(eps) > abs(old_eps) and eps * old_eps >= 0.0:
+            prev_shift_delta = -prev_shift_delta
+        elif abs(eps) < abs(old_eps) and eps * old_eps >= 0.0:
+            prev_shift_delta = prev_shift_delta / 2.0
+        else:
+            prev_shift_delta = -prev_shift_delta / 2.0
+        old_eps = eps
+        iter = iter + 1
+    return shift, iter < 20
+
+# the root finder on the histogram finds the shift of the old search on the
+# paths, only more precisely
+def test_find_shift_hist():
+    for seed in range(20):
+        rnd = random.Random(seed)
+        paths = [ [0] * rnd.randint(2, 6 + seed) for _ in range(rnd.randint(1, 300)) ]
+        lhist = {}
+        for path in paths:
+            lhist[len(path)] = lhist.get(len(path), 0) + 1
+
+        pc = shift_calculator()
+        pc.find_shift_hist(lhist)
+        shift = pc.getshift()
+        assert pc.default_P_total(paths, default_prob=0.5+shift) == pytest.approx(0.5, abs=1e-9)
+
+        (old_shift, converged) = old_find_shift(pc, paths)
+        if converged:
+            assert shift == pytest.approx(old_shift, abs=1e-3)
+
+        pc2 = shift_calculator()
+        pc2.find_shift(paths)
+        assert pc2.getshift() == shift
+
+def test_find_shift_no_shift():
+    pc = shift_calculator()
+    (pc.no_shift, pc.args_shift) = (True, 0.1)
+    assert pc.find_shift_hist({3: 5}) == 0.1
+    assert pc.getshift() == 0.0
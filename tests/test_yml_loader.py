@@ -0,0 +1,66 @@
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import yml_loader
+
+
+def write(fname, text, mtime=None):
+    with open(fname, "w") as stream:
+        stream.write(text)
+    if mtime != None:
+        os.utime(fname, ns=(mtime, mtime))
+
+# an up to date cache entry is used, a changed file is parsed again
+def test_cache_invalidation(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    fname = str(tmp_path / "model.yml")
+    write(fname, "a: 1\n", 10**18)
+    assert yml_loader.load_yml(fname, cache_dir) == {"a": 1}
+    cfile = yml_loader.cache_file(cache_dir, fname)
+    assert os.path.exists(cfile)
+
+    # the entry is used as long as mtime and content match
+    st = os.stat(fname)
+    with open(fname, "rb") as stream:
+        digest = yml_loader.hashlib.sha256(stream.read()).hexdigest()
+    yml_loader.write_cache(cfile, st.st_mtime_ns, digest, {"a": "cached"})
+    assert yml_loader.load_yml(fname, cache_dir) == {"a": "cached"}
+
+    # same mtime, other content
+    write(fname, "a: 2\n", 10**18)
+    assert yml_loader.load_yml(fname, cache_dir) == {"a": 2}
+
+    # same content, other mtime
+    yml_loader.write_cache(cfile, 10**18, digest, {"a": "cached"})
+    write(fname, "a: 1\n", 10**18 + 1)
+    assert yml_loader.load_yml(fname, cache_dir) == {"a": 1}
+
+    # unreadable entries are ignored
+    write(cfile, "garbage")
+    assert yml_loader.load_yml(fname, cache_dir) == {"a": 1}
+    assert yml_loader.load_yml(fname, None) == {"a": 1}
+
+# includes (also the ones of include files) are relative to the main file
+def test_load_tree(tmp_path):
+    os.makedirs(tmp_path / "sub")
+    write(str(tmp_path / "main.yml"), "includes: [sub/a.yml]\n")
+    write(str(tmp_path / "sub" / "a.yml"), "includes: [b.yml]\n")
+    write(str(tmp_path / "b.yml"), "b: 1\n")
+    parsed = yml_loader.load_tree(str(tmp_path / "main.yml"), str(tmp_path / "cache"))
+    assert list(parsed) == [ str(tmp_path / n) for n in ["main.yml", "sub/a.yml", "b.yml"] ]
+    assert parsed[str(tmp_path / "b.yml")] == {"b": 1}
@@ -17,13 +17,48 @@
 # 
 
 import argparse
+import logging
 import os
 import pathlib
 import math
-import yaml
 import re
+import shlex
 import sys
 
+import yml_loader
+
+# progress bars if tqdm is available
+try:
+    from tqdm import tqdm
+except ImportError:
+    def tqdm(it, desc="None", total=None, disable=False):
+        return it
+
+# diagnostics go to stderr through this logger, results are printed to stdout
+log = logging.getLogger("strong")
+
+# -q: errors only, default: warnings, -v: progress info, -vv: debug output
+# yml cache directory of the cmdline options (None: no cache)
+def cache_dir(args):
+    if args.no_cache:
+        return None
+    return args.cache_dir
+
+def setup_logging(verbose=0, quiet=False):
+    if quiet:
+        level = logging.ERROR
+    elif verbose >= 2:
+        level = logging.DEBUG
+    elif verbose == 1:
+        level = logging.INFO
+    else:
+        level = logging.WARNING
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter( logging.Formatter("%(message)s") )
+    log.handlers = [handler]
+    log.setLevel(level)
+    log.propagate = False
+
 class StrongConfig:
     def __init__(self, args):
         self.defprob = abs(args.default_prob)
@@ -51,6 +86,10 @@ class StrongConfig:
         return self.groupprob
     def PathCutOff(self):
         return self.pathcutoff
+    # the settings that change the node scores of the model (json compatible)
+    def ModelKey(self):
+        return [ self.defprob, self.defimpt, self.ignorescores, self.groupprio,
+                 [ [g, p[0], p[1]] for g,p in self.groupprob.items() ] ]
 
     def GroupCmdToYml(self, grstr):
         gdata = {}
@@ -64,27 +103,133 @@ class StrongConfig:
         return gdata
 
 
-def cmdline():
+# options that are used to build the model (see compile_cmdline)
+def model_options(parser):
+    parser.add_argument("--cache_dir", help="Directory for the cache of parsed yml files (default: {})".format(yml_loader.default_cache_dir()), default=yml_loader.default_cache_dir(), type=str)
+    parser.add_argument("--no_cache", dest='no_cache', action='store_const', const=True, help="Always parse the yml files, don't use or update the cache (default: false)", default=False)
+    parser.add_argument("-D", "--default_prob", help='Set the default node probability in case the yml definition does not specify (default 0.5). NOTE: This disables the search for the normalizing shift value.', default=-0.5, type=float)
+    parser.add_argument("-G", "--group_priority", dest="group_prio", action="store_const", const=True, help="Group probabilities take priority over individually specified probabilities (default: False)", default=False)
+    parser.add_argument("-i", "--ignore_score", dest='ignore_score', action='store_const', const=True, help="Ignore the specified node probabilities and use the default node probability instead (default: false)", default=False)
+    parser.add_argument("-I", "--default_impt", help='Set the default node impact in case the yml definition does not specify (default 1.0).', default=1.0, type=float)
+    parser.add_argument("-q", "--quiet", dest='quiet', action='store_const', const=True, help="Only print the results and errors, no diagnostics (default: false)", default=False)
+    parser.add_argument("-P", "--group_prob", help="comma-separated list of cmdline group probability overrides. Any listed entry overwrites the yml spec. Ordering only important for groups that an undefined in yml. This list takes precedence. Format: <group>:<prob>[,<group>:<prob>] (default: "")", default="", type=str)
+    parser.add_argument("-v", "--verbose", help="Print progress information to stderr, -vv adds debug output (default: warnings only)", default=0, action='count')
+
+def cmdline(argv=None):
     # Parse argument
-    parser = argparse.ArgumentParser()
-    parser.add_argument("input_file", help="Name of Input file", type=str)
+    parser = argparse.ArgumentParser(epilog="Use 'strong.py compile -h' for compiling models, 'strong.py batch -h' for running a manifest of models and 'strong.py sweep -h' for group probability sweeps.")
+    analysis_options(parser)
+    args = parser.parse_args(argv)
+    check_engine_options(parser, args)
+    return args
+
+# options that only some of the path analysis engines support
+def check_engine_options(parser, args):
+    if args.workers > 1 and (args.engine not in ["list", "stream"] or args.antype.lower() != "path"):
+        parser.error("-w/--workers is only available for the path-based analysis with --engine list or stream")
+    if args.multi_target and (args.engine not in ["list", "pruned"] or args.antype.lower() != "path"):
+        parser.error("--multi_target is only available for the path-based analysis with --engine list or pruned")
+
+# input file and options of the analysis (see cmdline)
+def analysis_options(parser):
+    parser.add_argument("input_file", help="Name of Input file (yml or compiled model)", type=str)
+    model_options(parser)
     parser.add_argument("-a", "--antype", help="Path-based or Tree-based analysis [path,tree] (default: path)", default="path", type=str)
     parser.add_argument("-C", "--cut_off", help="Any path with probability below this threshold will be dropped from the calculations (default: none)", default=0.0, type=float)
-    parser.add_argument("-D", "--default_prob", help='Set the default node probability in case the yml definition does not specify (default 0.5). NOTE: This disables the search for the normalizing shift value.', default=-0.5, type=float)
     parser.add_argument("-E", "--error", help='Apply random noise profile to node scores', default=0.0, type=float)
+    parser.add_argument("--error_replicates", help="Score the paths for this many -E noise draws and report the distribution of P_total, risk score and modes (path enumeration engine only, use --seed for reproducible draws) (default: 0 = one noisy result)", default=0, type=int)
+    parser.add_argument("--engine", dest="engine", help="Path analysis engine [list, stream, dag, sample, pruned]. 'dag' computes exact statistics without path enumeration for acyclic graphs (e.g. -u), 'sample' estimates the statistics from random paths, 'pruned' doesn't enumerate the paths below the -C cut-off (default: list)", default="list", choices=["list","stream","dag","sample","pruned"], type=str)
     parser.add_argument("-e", "--edge_graph", dest="edge_graph", action='store_const', const=True, help='Convert input to conjugated graph for path analysis', default=False)
-    parser.add_argument("-G", "--group_priority", dest="group_prio", action="store_const", const=True, help="Group probabilities take priority over individually specified probabilities (default: False)", default=False)
     parser.add_argument("-g", "--no_graph", dest='no_graph', action='store_const', const=True, help="Skip the display of the graphs and only/directly run the statistics (default: not enabled)", default=False)
-    parser.add_argument("-i", "--ignore_score", dest='ignore_score', action='store_const', const=True, help="Ignore the specified node probabilities and use the default node probability instead (default: false)", default=False)
-    parser.add_argument("-I", "--default_impt", help='Set the default node impact in case the yml definition does not specify (default 1.0).', default=1.0, type=float)
     parser.add_argument("-M", "--nodemode", help="Print mode of listed nodes (number of paths containing those nodes). Comma-separated list of node names (default: '')", default="", type=str)
+    parser.add_argument("--nodemode_paths", help="Maximum number of paths to print per node of -M (default: 20)", default=20, type=int)
+    parser.add_argument("--nodemode_file", help="Write all paths via the nodes of -M to this file (path enumeration engine only) (default: '')", default="", type=str)
+    parser.add_argument("--modes", help="Number of ranked node modes (nodes with the most paths through them) to print (default: 3)", default=3, type=int)
     parser.add_argument("-m", "--max_path", help="Maximum number of paths to print in path-based analysis mode (default: 60)", default=60, type=int)
-    parser.add_argument("-o", "--output", help="What type of output file format [yml, dot, pgt=python graph-tool] (default=pgt)", default="pgt", type=str)
-    parser.add_argument("-P", "--group_prob", help="comma-separated list of cmdline group probability overrides. Any listed entry overwrites the yml spec. Ordering only important for groups that an undefined in yml. This list takes precedence. Format: <group>:<prob>[,<group>:<prob>] (default: "")", default="", type=str)
+    parser.add_argument("--multi_target", dest='multi_target', action='store_const', const=True, help="Enumerate the paths to all targets in one pass per attacker (keeps the paths of all targets in memory) and report the risk per attacker and target (--engine list or pruned) (default: false)", default=False)
+    parser.add_argument("-o", "--output", help="Output format: pgt (print the report and show the graphs) or a comma-separated list of json, yml (statistics of every target) and npz (histograms and per-path arrays) (default=pgt)", default="pgt", type=str)
+    parser.add_argument("-O", "--output_base", help="File name without extension for the -o files (default: input file with .results instead of its extension)", default="", type=str)
+    parser.add_argument("--path_trie", dest='path_trie', action='store_const', const=True, help="Keep the enumerated paths as prefix trie: shared path prefixes are stored and scored once (path enumeration engine) (default: false)", default=False)
+    parser.add_argument("-S", "--stream", dest='engine', action='store_const', const="stream", help="Single-pass path analysis that keeps running statistics instead of all paths in memory. Same as '--engine stream' (default: false)")
+    parser.add_argument("--samples", help="Number of random paths to draw with '--engine sample' (max number if --rel_error is used) (default: 10000)", default=10000, type=int)
+    parser.add_argument("--rel_error", help="With '--engine sample': stop sampling once the relative 95%% confidence interval of the number of paths is below this value (default: 0.0 = off)", default=0.0, type=float)
+    parser.add_argument("--seed", help="Seed for the random number generator (default: none)", default=None, type=int)
     parser.add_argument("-s", "--structure_shift", help='Shift node probabilities to normalize for structural differences (default 0.0). NOTE: This does not affect the node labels!', default=-1.0, type=float)
+    parser.add_argument("-w", "--workers", help="Number of worker processes for the path enumeration (--engine list or stream). The work units (by attacker and first hops) are merged in order, so the result is the same. With --error_replicates the workers also score the replicates (default: 1)", default=1, type=int)
     parser.add_argument("-u", "--unidir", dest='unidir', action='store_const', const=True, help="Links between nodes (within a layer) are made directional (default: false)", default=False)
+    parser.add_argument("--watch", dest='watch', action='store_const', const=True, help="Keep running and analyze the model again whenever one of its files changes. Only the paths and scores affected by the change are updated (path enumeration engine) (default: false)", default=False)
+    parser.add_argument("--watch_interval", help="Seconds between the checks for changed files with --watch (default: 1.0)", default=1.0, type=float)
+
+# strong.py compile <input_file> [-o <compiled model>]
+def compile_cmdline(argv):
+    parser = argparse.ArgumentParser(prog="strong.py compile", description="Compile a yml model into a binary model file that can be used instead of the yml file")
+    parser.add_argument("input_file", help="Name of Input file", type=str)
+    parser.add_argument("-o", "--output", help="Name of the compiled model (default: input file with .sgm extension)", default=None, type=str)
+    model_options(parser)
+    # not used for compiling
+    parser.set_defaults(max_path=60, structure_shift=-1.0, cut_off=0.0)
+    args = parser.parse_args(argv)
+    if args.output == None:
+        args.output = os.path.splitext(args.input_file)[0] + ".sgm"
+    return args
+
+# strong.py batch <manifest> [-o <table>]
+def batch_cmdline(argv):
+    parser = argparse.ArgumentParser(prog="strong.py batch", description="Run the path analysis for all models and option sets of a manifest and write the results into one table")
+    parser.add_argument("manifest", help="Manifest (yml) with the list of runs", type=str)
+    parser.add_argument("-j", "--jobs", help="Number of processes that run the manifest (default: 1)", default=1, type=int)
+    parser.add_argument("-o", "--output", help="Results table (csv) (default: manifest file with .csv extension)", default=None, type=str)
+    parser.add_argument("-q", "--quiet", dest='quiet', action='store_const', const=True, help="Only print errors, no diagnostics (default: false)", default=False)
+    parser.add_argument("-v", "--verbose", help="Print progress information to stderr, -vv adds debug output (default: warnings only)", default=0, action='count')
+    args = parser.parse_args(argv)
+    if args.output == None:
+        args.output = os.path.splitext(args.manifest)[0] + ".csv"
+    return args
+
+# strong.py sweep <scenarios> <input_file> [options] [-T <table>]
+def sweep_cmdline(argv):
+    parser = argparse.ArgumentParser(prog="strong.py sweep", description="Enumerate the paths of a model once and score them for every scenario (group probabilities, -D, -s, -G) of a scenario file")
+    parser.add_argument("scenarios", help="Scenario file (yml) with a grid and/or a list of scenarios", type=str)
+    analysis_options(parser)
+    parser.add_argument("-T", "--table", help="Results table (csv) (default: scenario file with .csv extension)", default=None, type=str)
+    args = parser.parse_args(argv)
+    if args.table == None:
+        args.table = os.path.splitext(args.scenarios)[0] + ".csv"
+    return args
+
+# runs of a batch manifest:
+#   options: <options for all runs>              (optional)
+#   runs:
+#     - model: <yml file or compiled model>      (relative to the manifest)
+#       name: <name in the results table>        (optional, default: model + options)
+#       options: <options of this run>           (optional)
+# returns [ {"name": name, "args": parsed options} ] or None
+# options of a manifest entry: a string (split like a shell command line) or
+# a list of arguments
+def manifest_options(opts):
+    if opts == None:
+        return []
+    if isinstance(opts, list):
+        return [ str(o) for o in opts ]
+    return shlex.split(str(opts))
 
-    return parser.parse_args()
+def read_manifest(fname):
+    data = yml_loader.load_yml(fname)
+    if not isinstance(data, dict) or not isinstance(data.get("runs"), list):
+        log.error("Manifest %s has no list of runs", fname)
+        return None
+    mdir = os.path.dirname(fname)
+    common = manifest_options(data.get("options"))
+    runs = []
+    for idx,run in enumerate(data["runs"]):
+        if not isinstance(run, dict) or "model" not in run:
+            log.error("Run %s of manifest %s has no model", idx+1, fname)
+            return None
+        options = manifest_options(run.get("options"))
+        model = os.path.normpath(os.path.join(mdir, run["model"]))
+        name = run.get("name", " ".join([run["model"]] + options))
+        runs.append( { "name": str(name), "args": cmdline(common + options + [model]) } )
+    return runs
 
 
 class DataConsistencyError(Exception):
@@ -96,35 +241,43 @@ class NameShorteningError(Exception):
         self.message = message
 
 # read in all files based off of the main filename
-def load_files(fname):
+# (include files are relative to the directory of fname and may include files too)
+def load_files(fname, cache_dir=None):
+    return load_model_files(fname, cache_dir)[0]
+
+# same as load_files, returns (ymldata, list of all files read)
+def load_model_files(fname, cache_dir=None):
     yml_file_path=os.path.dirname(fname)
-    print(fname," is located in directory:",yml_file_path)
-    if len(yml_file_path) > 0:
-        yml_file_path=yml_file_path+"/"
+    log.info("%s is located in directory: %s", fname, yml_file_path)
 
+    root = os.path.normpath(fname)
+    parsed = yml_loader.load_tree(root, cache_dir)
     ymldata={}
-    with open(fname, 'r') as data_stream:
-        fdata = yaml.load(data_stream, Loader=yaml.Loader)
-
-        # see whether there are any include files defined
-        include_files = fdata.pop("includes",[])
-        for iname in include_files:
-                print("=====>>> Reading include file:",iname)
-                with open(yml_file_path+iname, 'r') as idata_stream:
-                    idata = yaml.load(idata_stream, Loader=yaml.Loader)
-                    for n,d in idata.items():
-                        if n in ymldata:
-                            print("Duplicate key ",n,"found in", iname)
-                            return None
-                        ymldata[n] = d
-
-        for n,d in fdata.items():
-            if n in ymldata:
-                print("Duplicate key ",n,"found in", fname)
-                return None
-            ymldata[n] = d
+    if not merge_files(root, fname, os.path.dirname(root), parsed, ymldata, []):
+        return None, list(parsed)
+    return ymldata, list(parsed)
 
-    return ymldata
+# add the data of the includes and then of the file itself to ymldata
+# returns False for duplicate keys or include loops
+def merge_files(fname, dname, ydir, parsed, ymldata, parents):
+    fdata = parsed[fname]
+    parents = parents + [fname]
+    for iname,ipath in zip(fdata.get("includes",[]), yml_loader.include_list(ydir, fdata)):
+        log.info("=====>>> Reading include file: %s", iname)
+        if ipath in parents:
+            log.error("Include loop: %s includes %s", dname, iname)
+            return False
+        if not merge_files(ipath, iname, ydir, parsed, ymldata, parents):
+            return False
+
+    for n,d in fdata.items():
+        if n == "includes":
+            continue
+        if n in ymldata:
+            log.error("Duplicate key %s found in %s", n, dname)
+            return False
+        ymldata[n] = d
+    return True
 
 
 
@@ -144,6 +297,10 @@ class Shortener:
     def __init__(self):
         self.SHORTEN_OPTIONS=[(3,0), (2,1), (2,2), (3,1), (2,3), (3,2), (32,0)]
         self.shortener=0
+        # memoized long->short names of the current option plus the per node
+        # overrides of the per node fallback (see assign)
+        self.names={}
+        self.overrides={}
 
     def getOptionCount(self):
         return len(self.SHORTEN_OPTIONS)
@@ -153,6 +310,12 @@ class Shortener:
 
     def set(self, shortener=-1):
         self.shortener=min( max(0, shortener), len(self.SHORTEN_OPTIONS) )
+        self.names=dict(self.overrides)
+
+    # state of a previous assign (see model)
+    def restore(self, shortener, overrides):
+        self.overrides=dict(overrides)
+        self.set(shortener)
 
     def explain(self):
         opt=self.SHORTEN_OPTIONS[ self.shortener ]
@@ -163,11 +326,19 @@ class Shortener:
             if opt[1] % 10 < 4:
                 postfix=opt[1] % 10
             extrachar="and then adds the "+str( opt[1] )+POSTFIXES[postfix]+" char from the end"
-        return "Shortening uses the first "+str(opt[0])+" chars "+extrachar+" of the substring."
+        overrides=""
+        if len(self.overrides) > 0:
+            overrides=" Longer options are used for "+str( len(self.overrides) )+" colliding names."
+        return "Shortening uses the first "+str(opt[0])+" chars "+extrachar+" of the substring."+overrides
 
     def apply(self, longname, option=-1):
         if option==-1:
-            option = self.get()
+            if longname not in self.names:
+                self.names[longname] = self.shorten(longname, self.get())
+            return self.names[longname]
+        return self.shorten(longname, option)
+
+    def shorten(self, longname, option):
         rs=""
         naidx=re.split('[\.]', longname)
 
@@ -178,7 +349,49 @@ class Shortener:
 
             ab=min(opt[0], len(sw))
             ec=''
-            if opt[1] != 0:
+            if opt[1] != 0 and opt[1] <= 2*len(sw):
                 ec=sw[min( len(sw)-opt[1], len(sw) )]
             rs=rs+sw[0:ab]+ec
         return rs
+
+    # pick the short names for a list of (unique) long names
+    # uses the first option that creates unique names for all of them. If there
+    # is none, all names start with the first option and only the colliding ones
+    # move on to the next option until the names are unique.
+    # returns the list of short names or None if no unique names can be created
+    def assign(self, longnames):
+        self.overrides={}
+        for opt in range( self.getOptionCount() ):
+            shset=set()
+            for n in longnames:
+                nshort=self.shorten(n, opt)
+                if nshort in shset:
+                    log.debug("SHORT-NAME COLLISION with option %s: %s %s", opt, n, nshort)
+                    break
+                shset.add(nshort)
+            if len(shset) == len(longnames):
+                self.set(opt)
+                return [ self.apply(n) for n in longnames ]
+
+        # per node fallback
+        last = self.getOptionCount()-1
+        nopt = [0] * len(longnames)
+        shlist = [ self.shorten(n, 0) for n in longnames ]
+        while True:
+            users = {}
+            for idx,nshort in enumerate(shlist):
+                users.setdefault(nshort, []).append(idx)
+            colliding = [ idx for idxs in users.values() if len(idxs) > 1 for idx in idxs ]
+            if len(colliding) == 0:
+                break
+            moved = False
+            for idx in colliding:
+                if nopt[idx] < last:
+                    nopt[idx] = nopt[idx] + 1
+                    shlist[idx] = self.shorten(longnames[idx], nopt[idx])
+                    moved = True
+            if not moved:
+                return None
+        self.overrides = { n:shlist[idx] for idx,n in enumerate(longnames) if nopt[idx] > 0 }
+        self.set(0)
+        return shlist
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Path statistics of the tree analysis (-a tree) without path enumeration.
+#
+# In the spanning tree of a target every vertex has at most one path to the
+# target. One breadth-first search from the target over the reversed tree
+# edges gives the path of every vertex: its length (in vertices) is the depth
+# + 1 and its probability the product of the vertex probabilities on the way,
+# prob[v] = p[v] * prob[parent(v)]. The search runs level by level on numpy
+# arrays, O(V) per target. The edge list and the vertex probabilities are
+# shared by all targets.
+# The probabilities are multiplied from the target outwards, so they can
+# differ in the last digits from the per-path products v->target.
+
+from graph_tool.all import *
+import numpy
+
+
+class TreeEngine:
+    def __init__(self, g, vprob):
+        self.nv = g.num_vertices()
+        edges = g.get_edges([g.edge_index])
+        self.src = edges[:,0].astype(numpy.int64)
+        self.dst = edges[:,1].astype(numpy.int64)
+        self.eidx = edges[:,2].astype(numpy.int64)
+        self.vprob = numpy.asarray(vprob, dtype=float)
+
+    # (vertices, lengths, probabilities) of the paths v->target in the tree
+    # (edge property map of min_spanning_tree), ordered by vertex index;
+    # the target itself is not included
+    def paths(self, tree, target):
+        target = int(target)
+        intree = numpy.asarray(tree.get_array(), dtype=bool)[self.eidx]
+        # reversed tree edges grouped by their target vertex
+        order = numpy.argsort(self.dst[intree], kind="stable")
+        child = self.src[intree][order]
+        ptr = numpy.zeros(self.nv+1, dtype=numpy.int64)
+        numpy.cumsum( numpy.bincount(self.dst[intree], minlength=self.nv), out=ptr[1:] )
+
+        depth = numpy.full(self.nv, -1, dtype=numpy.int64)
+        prob = numpy.zeros(self.nv)
+        depth[target] = 0
+        prob[target] = self.vprob[target]
+        frontier = numpy.array([target], dtype=numpy.int64)
+        while len(frontier) > 0:
+            counts = ptr[frontier+1] - ptr[frontier]
+            parent = numpy.repeat(frontier, counts)
+            # positions ptr[f] .. ptr[f+1]-1 of the children of every frontier vertex
+            pos = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + ptr[parent]
+            kids = child[pos]
+            new = depth[kids] < 0
+            (kids, first) = numpy.unique(kids[new], return_index=True)
+            parent = parent[new][first]
+            depth[kids] = depth[parent] + 1
+            prob[kids] = self.vprob[kids] * prob[parent]
+            frontier = kids
+
+        depth[target] = -1
+        verts = numpy.flatnonzero(depth >= 0)
+        return verts, depth[verts] + 1, prob[verts]
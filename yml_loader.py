@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+#
+# Copyright © 2020-2024 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Parsing of the yml model files with an on-disk cache of the parsed data.
+#
+# Every file is cached separately in <cache_dir>/<hash of the path>.pickle
+# together with the mtime and the sha256 of the file content it was parsed
+# from. A cache entry is only used if both still match the file; otherwise the
+# file is parsed again and the entry is replaced. Unreadable or unwritable cache
+# entries are ignored (the file is just parsed).
+
+import hashlib
+import logging
+import os
+import pickle
+import yaml
+
+# (the logger of tools, which imports this module)
+log = logging.getLogger("strong")
+
+# libyaml based loader if available
+try:
+    YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    YamlLoader = yaml.SafeLoader
+
+CACHE_VERSION=1
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "strong", "yml")
+
+def cache_file(cache_dir, fname):
+    key = hashlib.sha256( os.path.abspath(fname).encode() ).hexdigest()
+    return os.path.join(cache_dir, key + ".pickle")
+
+def read_cache(cfile, mtime, digest):
+    try:
+        with open(cfile, "rb") as cstream:
+            (version, cmtime, cdigest, data) = pickle.load(cstream)
+    except Exception:
+        return None
+    if version != CACHE_VERSION or cmtime != mtime or cdigest != digest:
+        return None
+    return data
+
+def write_cache(cfile, mtime, digest, data):
+    try:
+        os.makedirs(os.path.dirname(cfile), exist_ok=True)
+        tmpfile = "{}.{}.tmp".format(cfile, os.getpid())
+        with open(tmpfile, "wb") as cstream:
+            pickle.dump( (CACHE_VERSION, mtime, digest, data), cstream, protocol=pickle.HIGHEST_PROTOCOL )
+        os.replace(tmpfile, cfile)
+    except OSError as e:
+        log.debug("Unable to write yml cache %s: %s", cfile, e)
+
+# parsed content of one yml file (from the cache if it is up to date)
+# cache_dir=None disables the cache
+def load_yml(fname, cache_dir=None):
+    with open(fname, 'rb') as data_stream:
+        mtime = os.fstat(data_stream.fileno()).st_mtime_ns
+        content = data_stream.read()
+    if cache_dir == None:
+        return yaml.load(content, Loader=YamlLoader)
+
+    digest = hashlib.sha256(content).hexdigest()
+    cfile = cache_file(cache_dir, fname)
+    data = read_cache(cfile, mtime, digest)
+    if data != None:
+        log.debug("Using cached %s", fname)
+        return data
+    data = yaml.load(content, Loader=YamlLoader)
+    write_cache(cfile, mtime, digest, data)
+    return data
+
+# include files are relative to the directory of the main file (also the
+# includes of include files)
+def include_list(ydir, fdata):
+    return [ os.path.normpath(os.path.join(ydir, iname)) for iname in fdata.get("includes", []) ]
+
+# parse a file and all the files it includes (also nested includes)
+# returns {file name: parsed data}
+def load_tree(fname, cache_dir=None):
+    ydir = os.path.dirname(fname)
+    parsed = {}
+    todo = [fname]
+    while len(todo) > 0:
+        iname = todo.pop(0)
+        if iname in parsed:
+            continue
+        idata = load_yml(iname, cache_dir)
+        parsed[iname] = idata if idata != None else {}
+        todo.extend( include_list(ydir, parsed[iname]) )
+    return parsed